@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,17 @@ DATABASE_TYPE = os.environ.get('DATABASE_TYPE', 'postgresql')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Media downloads offload configuration
+# 'none' streams the files from Django, 'x-accel-redirect' (nginx) and
+# 'x-sendfile' (Apache, lighttpd) let the front proxy transfer the file after
+# Django authorizes the download
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD', 'none').lower()
+if MEDIA_OFFLOAD not in ('none', 'x-accel-redirect', 'x-sendfile'):
+    raise ImproperlyConfigured(
+        "MEDIA_OFFLOAD must be 'none', 'x-accel-redirect' or 'x-sendfile', got '{}'".format(MEDIA_OFFLOAD))
+# Internal location of the proxy that maps to MEDIA_ROOT (x-accel-redirect only)
+MEDIA_OFFLOAD_PREFIX = os.environ.get('MEDIA_OFFLOAD_PREFIX', '/protected-media/')
+
 # CONNECTION CONFIGURATION
 URL = os.environ.get('URL', 'http://127.0.0.1:8000')
 
@@ -62,6 +74,20 @@ if DEMO:
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 if not DEMO:
     DATABASE_TYPE = os.environ.get('DATABASE_TYPE', 'postgresql') 
+
+# Threads of every gunicorn worker, set by gunicorn.conf.py from its profile.
+# Each one needs its own database connection
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS') or 1)
+
+# Database connection reuse (PostgreSQL only)
+# By default every worker thread keeps its connection for DB_CONN_MAX_AGE
+# seconds (0 opens a new one per request) and checks that it is still usable
+# before reusing it. DB_POOL=True uses a psycopg 3 pool per worker instead,
+# with up to GUNICORN_THREADS connections
+DB_POOL = str_to_bool(os.environ.get('DB_POOL', 'False'))
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE') or 60)
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT') or 10)
+
 if DATABASE_TYPE == 'postgresql':
     # PostgreSQL settings
     DATABASES = {
@@ -72,6 +98,16 @@ if DATABASE_TYPE == 'postgresql':
             'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'scholarships_password'),
             'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
             'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # The pool keeps the connections itself
+            'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': 1,
+                    'max_size': GUNICORN_THREADS,
+                    'timeout': DB_POOL_TIMEOUT,
+                },
+            } if DB_POOL else {},
         }
     }
 else:
@@ -83,6 +119,33 @@ else:
         }
     }
 
+# Cache configuration
+# 'locmem' keeps a separate cache in every process, 'file' shares a directory
+# between the processes of one host and 'redis' uses a Redis-compatible server
+# (Redis, Valkey) shared by every process and host. The catalog versions must
+# be seen by every worker, so the default is 'file'; 'locmem' only fits a
+# single process, like the tests
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'file').lower()
+_cache_backends = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'becas-sntsa'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/0'),
+}
+if CACHE_BACKEND not in _cache_backends:
+    raise ImproperlyConfigured(
+        "CACHE_BACKEND must be 'locmem', 'file' or 'redis', got '{}'".format(CACHE_BACKEND))
+CACHES = {
+    'default': {
+        'BACKEND': _cache_backends[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION') or _cache_backends[CACHE_BACKEND][1],
+        'KEY_PREFIX': 'becas_sntsa',
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT') or 300),
+    }
+}
+# Seconds the rendered template fragments are kept. Their keys change with
+# the templates and the data they show, so they never serve stale content
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT') or 3600)
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -98,16 +161,28 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'becas_sntsa.middleware.AsgiUrlconfMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'becas_sntsa.middleware.TrabajadorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Loads the profile of the user with the user, see becas_sntsa.backends.
+# ModelBackend stays after it for the sessions opened before it was added,
+# Django logs out the sessions whose backend is not listed
+AUTHENTICATION_BACKENDS = [
+    'becas_sntsa.backends.TrabajadorBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 ROOT_URLCONF = 'becas.urls'
+# The same URLs with async downloads and activation, for the ASGI requests
+ASGI_URLCONF = 'becas.urls_asgi'
 
 TEMPLATES = [
     {
@@ -120,6 +195,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'becas_sntsa.context_processors.fragment_cache',
             ],
         },
     },
@@ -0,0 +1,23 @@
+"""
+URL configuration of the requests served by the ASGI application.
+
+It is the configuration of becas.urls with the async versions of the views
+that wait on slow clients. The ASGI requests are routed here by
+becas_sntsa.middleware.AsgiUrlconfMiddleware, the WSGI ones keep the sync
+views and never run an event loop.
+"""
+from django.urls import path
+from becas import urls
+from becas_sntsa import views
+
+# Async views by URL name
+ASYNC_VIEWS = {
+    'activate': views.activate_async,
+    'download_file': views.download_file_async,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name)
+    if getattr(pattern, 'name', None) in ASYNC_VIEWS else pattern
+    for pattern in urls.urlpatterns
+]
@@ -3,10 +3,20 @@ Admin configurations for the becas_sntsa app.
 
 This file defines how the models are displayed and managed in the Django admin interface.
 """
-from django.contrib import admin
-from django.urls import reverse
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db import IntegrityError
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.html import format_html
-from becas_sntsa.models import Seccion, Puesto, LugarAdscripcion, Grado, Trabajador, Becario, SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial
+from becas_sntsa.exports import CONTENT_TYPES, export_queryset, export_rows, stream_export
+from becas_sntsa.forms import ImportarGanadoresForm, ExportarSolicitudesForm
+from becas_sntsa.ganadores import TIPOS, extract_lines, parse_ganadores, plan_import
+from becas_sntsa.matching import normalize_name
+from becas_sntsa.models import Seccion, Puesto, LugarAdscripcion, Grado, Trabajador, Becario, Solicitud, SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial, EmailOutbox, ConteoSolicitud
 
 
 admin.site.register(Seccion)
@@ -21,13 +31,68 @@ class TrabajadorAdmin(admin.ModelAdmin):
     """
     search_fields = ['usuario__username']
     list_filter = ['aprobado', 'lugar_adscripcion', 'jurisdiccion']
+    list_select_related = ('usuario',)
 
 
 class BecarioAdmin(admin.ModelAdmin):
     """
     Admin configuration for the Becario model.
+
+    Names are searched through the normalized name, so accents and case do
+    not matter.
+    """
+    search_fields = ['curp', 'nombre_normalizado']
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Normalizes the search term before searching, keeping CURPs intact.
+        """
+        if not any(letra.isdigit() for letra in search_term):
+            search_term = normalize_name(search_term)
+        return super().get_search_results(request, queryset, search_term)
+
+
+def estado_action(estado, descripcion):
+    """
+    Builds an admin action that moves the selected applications to an estado.
+
+    Args:
+        estado (str): The new estado, a key of Solicitud.ESTADO_CHOICES.
+        descripcion (str): The human readable name of the estado.
+
+    Returns:
+        function: The admin action.
     """
-    search_fields = ['curp']
+    def action(modeladmin, request, queryset):
+        modeladmin.cambiar_estado(request, queryset, estado)
+    action.__name__ = 'marcar_estado_{}'.format(estado.lower())
+    action.short_description = 'Cambiar estado a "{}"'.format(descripcion)
+    action.allowed_permissions = ('change',)
+    return action
+
+
+def tabla_conteos(conteos, indice, etiquetas=None, vacio='Sin dato') -> list:
+    """
+    Adds up the application counters by one dimension and estado.
+
+    Args:
+        conteos (list): Tuples of (estado, tipo, jurisdiccion, grado, total).
+        indice (int): The position of the dimension in the tuples.
+        etiquetas (dict, optional): The label of each value of the dimension.
+        vacio (str): The label of the applications without a value.
+
+    Returns:
+        list: Tuples of (label, totals per estado in the order of
+              Solicitud.ESTADO_CHOICES, total), sorted by label.
+    """
+    estados = [estado for estado, _ in Solicitud.ESTADO_CHOICES]
+    filas = {}
+    for conteo in conteos:
+        valor = conteo[indice]
+        etiqueta = vacio if valor in (None, '') else (etiquetas or {}).get(valor, valor)
+        fila = filas.setdefault(etiqueta, [0] * len(estados))
+        fila[estados.index(conteo[0])] += conteo[4]
+    return [(etiqueta, fila, sum(fila)) for etiqueta, fila in sorted(filas.items(), key=lambda item: str(item[0]))]
 
 
 class SolicitudAdmin(admin.ModelAdmin):
@@ -37,7 +102,195 @@ class SolicitudAdmin(admin.ModelAdmin):
     search_fields = ['becario__curp',
                        'fecha_solicitud', 'becario__trabajador__username']
     list_display = ('__str__', 'get_trabajador')
+    list_filter = ['estado']
+    actions = [estado_action(estado, descripcion) for estado, descripcion in Solicitud.ESTADO_CHOICES]
     readonly_fields = ('get_trabajador',)
+    change_list_template = 'admin/becas_sntsa/solicitud_change_list.html'
+    # Type preselected in the import form, set by each subclass admin
+    tipo = None
+    # Number of rows of each list shown in the import report
+    import_report_limit = 200
+
+    def get_urls(self):
+        """
+        Adds the results import, the export and the statistics pages to the
+        admin URLs of the model.
+        """
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            path('importar_ganadores/',
+                 self.admin_site.admin_view(self.importar_ganadores_view),
+                 name='%s_%s_importar_ganadores' % info),
+            path('exportar/',
+                 self.admin_site.admin_view(self.exportar_view),
+                 name='%s_%s_exportar' % info),
+            path('estadisticas/',
+                 self.admin_site.admin_view(self.estadisticas_view),
+                 name='%s_%s_estadisticas' % info),
+        ] + super().get_urls()
+
+    def get_queryset(self, request):
+        """
+        Loads the applications with their scholar, and the worker shown by
+        get_trabajador, in the same query.
+        """
+        return super().get_queryset(request).select_subclasses().annotate(
+            trabajador_pk=F('becario__trabajador__trabajador'),
+            trabajador_username=F('becario__trabajador__username'),
+        )
+
+    def get_tipos(self, request, permiso) -> list:
+        """
+        Returns the application types whose admin grants a permission to the
+        user, so the pages of one type do not expose or change the others.
+
+        Args:
+            request (HttpRequest): The request object.
+            permiso (str): 'view' or 'change'.
+
+        Returns:
+            list: The allowed keys of TIPOS.
+        """
+        tipos = []
+        for tipo, model in TIPOS.items():
+            model_admin = self.admin_site._registry.get(model)
+            if model_admin is not None and getattr(model_admin, 'has_{}_permission'.format(permiso))(request):
+                tipos.append(tipo)
+        return tipos
+
+    def cambiar_estado(self, request, queryset, estado):
+        """
+        Changes the estado of the selected applications in bulk and queues
+        the notifications of the changed ones.
+
+        Args:
+            request (HttpRequest): The request object.
+            queryset (QuerySet): The selected applications.
+            estado (str): The new estado.
+        """
+        try:
+            ids = queryset.cambiar_estado(estado)
+        except IntegrityError:
+            self.message_user(
+                request,
+                'Un becario no puede tener más de una solicitud en espera de resultados.',
+                messages.ERROR)
+            return
+        self.message_user(
+            request,
+            '{} solicitudes cambiaron a "{}".'.format(len(ids), dict(Solicitud.ESTADO_CHOICES)[estado]),
+            messages.SUCCESS)
+
+    def importar_ganadores_view(self, request):
+        """
+        Imports a results list, showing the changes before applying them.
+
+        Args:
+            request (HttpRequest): The request object.
+
+        Returns:
+            TemplateResponse: The import form and, after a submission, the report.
+        """
+        tipos = self.get_tipos(request, 'change')
+        if not self.has_change_permission(request) or not tipos:
+            raise PermissionDenied
+        plan = None
+        if request.method == 'POST':
+            if set(request.POST.getlist('tipos')) & set(TIPOS) - set(tipos):
+                raise PermissionDenied
+            form = ImportarGanadoresForm(request.POST, request.FILES, tipos=tipos)
+            if form.is_valid():
+                archivo = form.cleaned_data['archivo']
+                plan = plan_import(parse_ganadores(extract_lines(archivo)), form.cleaned_data['tipos'])
+                if not form.cleaned_data['dry_run']:
+                    plan.apply(notificar=form.cleaned_data['notificar'])
+                    self.message_user(
+                        request,
+                        '{} solicitudes otorgadas y {} no otorgadas.'.format(
+                            len(plan.ganadores), len(plan.no_ganadores)),
+                        messages.SUCCESS)
+        else:
+            form = ImportarGanadoresForm(initial={'tipos': [self.tipo] if self.tipo else []}, tipos=tipos)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'title': 'Importar ganadores',
+            'form': form,
+            'plan': plan,
+            'limit': self.import_report_limit,
+        }
+        return TemplateResponse(request, 'admin/becas_sntsa/importar_ganadores.html', context)
+
+    def exportar_view(self, request):
+        """
+        Exports the applications matching the filters as a spreadsheet,
+        streamed as it is read from the database.
+
+        Args:
+            request (HttpRequest): The request object.
+
+        Returns:
+            HttpResponse: The filters form or the streamed CSV or XLSX file.
+        """
+        tipos = self.get_tipos(request, 'view')
+        if not self.has_view_permission(request) or not tipos:
+            raise PermissionDenied
+        if 'formato' in request.GET:
+            if set(request.GET.getlist('tipos')) & set(TIPOS) - set(tipos):
+                raise PermissionDenied
+            form = ExportarSolicitudesForm(request.GET, tipos=tipos)
+            if form.is_valid():
+                datos = form.cleaned_data
+                formato = datos['formato']
+                # No type selected exports all the allowed ones
+                seleccion = datos['tipos'] or (tipos if len(tipos) < len(TIPOS) else None)
+                queryset = export_queryset(datos['estado'], seleccion, datos['desde'], datos['hasta'])
+                response = StreamingHttpResponse(
+                    stream_export(formato, export_rows(queryset)), content_type=CONTENT_TYPES[formato])
+                response['Content-Disposition'] = 'attachment; filename="solicitudes_{}.{}"'.format(
+                    timezone.localdate().strftime('%Y%m%d'), formato)
+                return response
+        else:
+            form = ExportarSolicitudesForm(initial={'tipos': [self.tipo] if self.tipo else []}, tipos=tipos)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'title': 'Exportar solicitudes',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/becas_sntsa/exportar_solicitudes.html', context)
+
+    def estadisticas_view(self, request):
+        """
+        Shows the number of applications of every type by estado, type,
+        jurisdiction and grade, read from the ConteoSolicitud counters so it
+        does not depend on the number of applications.
+
+        Args:
+            request (HttpRequest): The request object.
+
+        Returns:
+            TemplateResponse: The statistics tables.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        conteos = list(ConteoSolicitud.objects.filter(total__gt=0).values_list(
+            'estado', 'tipo', 'jurisdiccion__clave', 'grado__nombre', 'total'))
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'title': 'Estadísticas de solicitudes',
+            'estados': [descripcion for _, descripcion in Solicitud.ESTADO_CHOICES],
+            'tablas': [
+                ('Tipo', tabla_conteos(conteos, 1, {tipo: model.tipo_nombre for tipo, model in TIPOS.items()})),
+                ('Jurisdicción', tabla_conteos(conteos, 2, vacio='Sin jurisdicción')),
+                ('Grado', tabla_conteos(conteos, 3, vacio='Sin grado')),
+            ],
+            'total': sum(conteo[4] for conteo in conteos),
+        }
+        return TemplateResponse(request, 'admin/becas_sntsa/estadisticas_solicitudes.html', context)
 
     def get_trabajador(self, obj):
         """
@@ -49,14 +302,13 @@ class SolicitudAdmin(admin.ModelAdmin):
         Returns:
             str: An HTML link to the worker's admin page or the worker's username.
         """
-        trabajador_user = obj.becario.trabajador
-        try:
-            trabajador = Trabajador.objects.get(usuario=trabajador_user)
-            url = reverse('admin:becas_sntsa_trabajador_change',
-                          args=[trabajador.pk])
-            return format_html('<a href="{}">{}</a>', url, trabajador_user.username)
-        except Trabajador.DoesNotExist:
-            return trabajador_user.username
+        if not hasattr(obj, 'trabajador_username'):
+            # Instances not loaded through get_queryset, e.g. in the add form
+            return self.get_empty_value_display()
+        if obj.trabajador_pk is None:
+            return obj.trabajador_username
+        url = reverse('admin:becas_sntsa_trabajador_change', args=[obj.trabajador_pk])
+        return format_html('<a href="{}">{}</a>', url, obj.trabajador_username)
     get_trabajador.short_description = 'Trabajador'
 
 
@@ -64,21 +316,43 @@ class SolicitudAprovechamientoAdmin(SolicitudAdmin):
     """
     Admin configuration for the SolicitudAprovechamiento model.
     """
-    pass
+    tipo = 'aprovechamiento'
 
 
 class SolicitudExcelenciaAdmin(SolicitudAdmin):
     """
     Admin configuration for the SolicitudExcelencia model.
     """
-    pass
+    tipo = 'excelencia'
 
 
 class SolicitudEspecialAdmin(SolicitudAdmin):
     """
     Admin configuration for the SolicitudEspecial model.
     """
-    pass
+    tipo = 'especial'
+
+
+class EmailOutboxAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the EmailOutbox model.
+    """
+    list_display = ('asunto', 'get_destinatarios', 'estado', 'intentos', 'siguiente_intento', 'enviado')
+    list_filter = ['estado']
+    readonly_fields = ('creado', 'enviado', 'ultimo_error')
+
+    def get_destinatarios(self, obj):
+        """
+        Returns the recipients of the queued email.
+
+        Args:
+            obj (EmailOutbox): The EmailOutbox instance.
+
+        Returns:
+            str: The comma separated recipient addresses.
+        """
+        return ', '.join(obj.destinatarios)
+    get_destinatarios.short_description = 'Destinatarios'
 
 
 admin.site.register(Trabajador, TrabajadorAdmin)
@@ -86,3 +360,4 @@ admin.site.register(Becario, BecarioAdmin)
 admin.site.register(SolicitudAprovechamiento, SolicitudAprovechamientoAdmin)
 admin.site.register(SolicitudExcelencia, SolicitudExcelenciaAdmin)
 admin.site.register(SolicitudEspecial, SolicitudEspecialAdmin)
+admin.site.register(EmailOutbox, EmailOutboxAdmin)
@@ -10,3 +10,9 @@ class MainConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'becas_sntsa'
+
+    def ready(self):
+        """
+        Connects the signal handlers of the app.
+        """
+        from becas_sntsa import signals
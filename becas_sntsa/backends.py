@@ -0,0 +1,32 @@
+"""
+Authentication backends for the becas_sntsa app.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class TrabajadorBackend(ModelBackend):
+    """
+    The default model backend, loading the user of every request joined with
+    its 'Trabajador' profile, so the views and decorators that check the
+    profile do not query it again.
+    """
+
+    def get_user(self, user_id):
+        """
+        Returns the active user with the given primary key and its profile.
+
+        Args:
+            user_id (int): The primary key stored in the session.
+
+        Returns:
+            User: The user, with user.trabajador already loaded (raising
+                  Trabajador.DoesNotExist without a query if there is no
+                  profile), or None.
+        """
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related('trabajador').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
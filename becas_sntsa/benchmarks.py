@@ -0,0 +1,659 @@
+"""
+Benchmark scenarios for the becas_sntsa app.
+
+Each scenario is run by the benchmark management command against a throwaway
+test database and returns a list of result rows (dicts) to be reported.
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from becas_sntsa.models import Seccion, Puesto, Jurisdiccion, LugarAdscripcion, Grado, Trabajador, Becario, SolicitudAprovechamiento
+
+SCENARIOS = {}
+
+# Fast hasher so that creating fixtures does not dominate the measurements
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def scenario(name):
+    """
+    Registers a benchmark scenario under the given name.
+
+    Args:
+        name (str): The name used to select the scenario from the command line.
+
+    Returns:
+        function: The decorator that registers the scenario.
+    """
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+def create_catalogs():
+    """
+    Creates one row of each catalog table.
+
+    Returns:
+        dict: The created catalog rows keyed by field name.
+    """
+    return {
+        'seccion': Seccion.objects.create(numero=37),
+        'puesto': Puesto.objects.create(clave='P1'),
+        'jurisdiccion': Jurisdiccion.objects.create(clave='J1'),
+        'lugar_adscripcion': LugarAdscripcion.objects.create(nombre='Lugar 1'),
+        'grado': Grado.objects.create(clave='G1', nombre='Grado 1'),
+    }
+
+
+def create_trabajador(username, catalogs, aprobado=True) -> Trabajador:
+    """
+    Creates a user with an approved worker profile.
+
+    Args:
+        username (str): The username (CURP) of the worker.
+        catalogs (dict): The catalog rows returned by create_catalogs.
+        aprobado (bool): Whether the worker is approved.
+
+    Returns:
+        Trabajador: The newly created worker.
+    """
+    user = User.objects.create_user(username=username, password='benchmark')
+    return Trabajador.objects.create(
+        usuario=user,
+        nombre='Bench',
+        apellido_paterno='Worker',
+        talon_pago_archivo='talon_pago/{}.pdf'.format(username),
+        telefono='1234567890',
+        correo='{}@example.com'.format(username.lower()),
+        seccion=catalogs['seccion'],
+        puesto=catalogs['puesto'],
+        jurisdiccion=catalogs['jurisdiccion'],
+        lugar_adscripcion=catalogs['lugar_adscripcion'],
+        aprobado=aprobado,
+    )
+
+
+@contextmanager
+def count_queries():
+    """
+    Counts the queries run on the default connection.
+
+    Unlike CaptureQueriesContext it has no limit on the number of queries and
+    does not turn on the debug cursor.
+
+    Yields:
+        list: The SQL of every query run inside the block.
+    """
+    queries = []
+
+    def wrapper(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield queries
+
+
+def timed_request(client, url, repeat=5):
+    """
+    Requests a URL several times, returning the queries of the last request
+    and the mean wall time.
+
+    Args:
+        client (Client): The test client, already logged in if needed.
+        url (str): The URL to request.
+        repeat (int): The number of requests to average.
+
+    Returns:
+        tuple: The response, the number of queries and the mean time in ms.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat - 1):
+        client.get(url)
+    with count_queries() as queries:
+        response = client.get(url)
+    elapsed = (time.perf_counter() - start) * 1000 / repeat
+    return response, len(queries), elapsed
+
+
+@scenario('download_file')
+def bench_download_file(options):
+    """
+    Measures the cost of authorizing a non-staff download as the number of
+    solicitudes of the worker grows.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as media_root, \
+            override_settings(MEDIA_ROOT=media_root, PASSWORD_HASHERS=FAST_HASHERS):
+        catalogs = create_catalogs()
+        for index, size in enumerate(options['sizes']):
+            username = 'BENC{:06d}HDFLNA01'.format(index)
+            trabajador = create_trabajador(username, catalogs)
+            becario = Becario.objects.create(
+                trabajador=trabajador.usuario, nombre='Bench', apellido_paterno='Becario',
+                curp=username, curp_archivo='curp/{}.pdf'.format(username),
+                acta_nacimiento='acta_nacimiento/{}.pdf'.format(username),
+            )
+            for number in range(size):
+                solicitud = SolicitudAprovechamiento.objects.create(
+                    becario=becario, grado=catalogs['grado'], promedio=9.0, estado='F',
+                    boleta='boleta/{}_{}.pdf'.format(username, number),
+                    recibo_nomina='recibo_nomina/{}_{}.pdf'.format(username, number),
+                    ine='ine/{}_{}.pdf'.format(username, number),
+                )
+            # Request the last uploaded file, the worst case of a linear scan
+            ruta = solicitud.ine.name
+            os.makedirs(os.path.join(media_root, 'ine'), exist_ok=True)
+            with open(os.path.join(media_root, ruta), 'wb') as archivo:
+                archivo.write(b'%PDF-1.4 benchmark')
+
+            client = Client()
+            client.force_login(trabajador.usuario)
+            response, queries, elapsed = timed_request(
+                client, reverse('download_file', args=[ruta]), options['repeat'])
+            results.append({
+                'solicitudes': size,
+                'status': response.status_code,
+                'queries': queries,
+                'ms': round(elapsed, 2),
+            })
+    return results
+
+
+@scenario('import_ganadores')
+def bench_import_ganadores(options):
+    """
+    Measures matching and applying a results list against the pending
+    solicitudes, for lists of the given sizes with half of them winners.
+    """
+    from becas_sntsa.ganadores import parse_ganadores, plan_import
+    from becas_sntsa.models import SolicitudExcelencia
+
+    results = []
+    with override_settings(PASSWORD_HASHERS=FAST_HASHERS):
+        catalogs = create_catalogs()
+        trabajador = create_trabajador('BENC000000HDFLNA99', catalogs)
+        for index, size in enumerate(options['sizes']):
+            lines = []
+            for number in range(size):
+                curp = 'BEN{}{:06d}HDFLNA{:02d}'.format(chr(65 + index), number, number % 100)
+                becario = Becario.objects.create(
+                    trabajador=trabajador.usuario, nombre='Bench', apellido_paterno='Becario', curp=curp,
+                    curp_archivo='curp/{}.pdf'.format(curp), acta_nacimiento='acta_nacimiento/{}.pdf'.format(curp),
+                )
+                SolicitudExcelencia.objects.create(
+                    becario=becario, grado=catalogs['grado'], promedio=9.0, carrera='Bench', estado='P',
+                    boleta='boleta/{}.pdf'.format(curp), recibo_nomina='recibo_nomina/{}.pdf'.format(curp),
+                    ine='ine/{}.pdf'.format(curp),
+                )
+                if number % 2 == 0:
+                    lines.append('{} {} BECARIO BENCH'.format(number + 1, curp))
+
+            start = time.perf_counter()
+            with count_queries() as queries:
+                plan = plan_import(parse_ganadores(lines), ['excelencia'])
+                plan.apply(notificar=False)
+            results.append({
+                'solicitudes': size,
+                'ganadores': len(plan.ganadores),
+                'queries': len(queries),
+                'ms': round((time.perf_counter() - start) * 1000, 2),
+            })
+    return results
+
+
+@scenario('name_matcher')
+def bench_name_matcher(options):
+    """
+    Measures resolving misspelled names against an index of the given sizes
+    (in thousands of names), compared with scoring every name.
+    """
+    import random
+    from faker import Faker
+    from becas_sntsa.matching import NameMatcher, normalize_name, similarity, trigrams
+
+    fake = Faker('es_MX')
+    fake.seed_instance(0)
+    rng = random.Random(0)
+    results = []
+    for size in options['sizes']:
+        nombres = ['{} {} {}'.format(fake.first_name(), fake.last_name(), fake.last_name())
+                   for _ in range(size * 1000)]
+        matcher = NameMatcher()
+        for index, nombre in enumerate(nombres):
+            matcher.add(index, nombre, promedio=rng.uniform(6, 10))
+
+        consultas = []
+        for nombre in rng.sample(nombres, min(100, len(nombres))):
+            # Drop one letter to simulate a typo in the results list
+            posicion = rng.randrange(len(nombre))
+            consultas.append(nombre[:posicion] + nombre[posicion + 1:])
+
+        start = time.perf_counter()
+        encontrados = sum(matcher.match(consulta) is not None for consulta in consultas)
+        indexed = (time.perf_counter() - start) * 1000 / len(consultas)
+
+        grams = [trigrams(normalize_name(nombre)) for nombre in nombres]
+        start = time.perf_counter()
+        for consulta in consultas[:10]:
+            consulta_grams = trigrams(normalize_name(consulta))
+            max(range(len(grams)), key=lambda index: similarity(consulta_grams, grams[index]))
+        linear = (time.perf_counter() - start) * 1000 / min(10, len(consultas))
+
+        results.append({
+            'nombres': len(nombres),
+            'encontrados': '{}/{}'.format(encontrados, len(consultas)),
+            'ms_indexed': round(indexed, 3),
+            'ms_linear': round(linear, 3),
+        })
+    return results
+
+
+@scenario('bulk_estado')
+def bench_bulk_estado(options):
+    """
+    Compares changing the estado of the given number of solicitudes one save()
+    at a time with the bulk cambiar_estado used by the admin actions,
+    notifications included.
+    """
+    results = []
+    with override_settings(PASSWORD_HASHERS=FAST_HASHERS):
+        catalogs = create_catalogs()
+        trabajador = create_trabajador('BENC000000HDFLNA98', catalogs)
+        for index, size in enumerate(options['sizes']):
+            ids = []
+            for number in range(size):
+                curp = 'EST{}{:06d}HDFLNA{:02d}'.format(chr(65 + index), number, number % 100)
+                becario = Becario.objects.create(
+                    trabajador=trabajador.usuario, nombre='Bench', apellido_paterno='Becario', curp=curp,
+                    curp_archivo='curp/{}.pdf'.format(curp), acta_nacimiento='acta_nacimiento/{}.pdf'.format(curp),
+                )
+                ids.append(SolicitudAprovechamiento.objects.create(
+                    becario=becario, grado=catalogs['grado'], promedio=9.0, estado='R',
+                    boleta='boleta/{}.pdf'.format(curp), recibo_nomina='recibo_nomina/{}.pdf'.format(curp),
+                    ine='ine/{}.pdf'.format(curp),
+                ).pk)
+
+            start = time.perf_counter()
+            with count_queries() as queries:
+                for solicitud in SolicitudAprovechamiento.objects.filter(pk__in=ids):
+                    solicitud.estado = 'E'
+                    solicitud.save()
+            results.append({
+                'solicitudes': size,
+                'method': 'save',
+                'queries': len(queries),
+                'ms': round((time.perf_counter() - start) * 1000, 2),
+            })
+
+            start = time.perf_counter()
+            with count_queries() as queries:
+                SolicitudAprovechamiento.objects.filter(pk__in=ids).cambiar_estado('P')
+            results.append({
+                'solicitudes': size,
+                'method': 'cambiar_estado',
+                'queries': len(queries),
+                'ms': round((time.perf_counter() - start) * 1000, 2),
+            })
+    return results
+
+
+@scenario('export_snapshot')
+def bench_export_snapshot(options):
+    """
+    Compares writing the columnar snapshot of export_snapshot with a naive
+    ORM dump that loads every instance, follows its foreign keys and calls
+    get_sexo and get_fecha_nacimiento, for the given numbers of workers.
+    """
+    import json
+    import random
+    from becas_sntsa.management.commands.generate_users import BulkWriter, generate_trabajadores, load_catalogs
+    from becas_sntsa.models import Solicitud
+    from becas_sntsa.snapshot import TABLES, pa, write_table
+
+    if pa is None:
+        return [{'error': 'pyarrow is not installed'}]
+
+    results = []
+    with tempfile.TemporaryDirectory() as directorio, override_settings(PASSWORD_HASHERS=FAST_HASHERS):
+        catalogs = create_catalogs()
+        catalog_pks = {name: [row.pk] for name, row in catalogs.items()}
+        rangos = {'min_becarios': 1, 'max_becarios': 3, 'min_solicitudes': 1, 'max_solicitudes': 3}
+        existentes = 0
+        for index, size in enumerate(options['sizes']):
+            writer = BulkWriter('benchmark', 1000)
+            for trabajador in generate_trabajadores(catalog_pks, rangos, index, size - existentes):
+                writer.add(trabajador)
+            writer.flush()
+            existentes = size
+
+            start = time.perf_counter()
+            with count_queries() as queries, open(os.path.join(directorio, 'naive.jsonl'), 'w') as archivo:
+                filas = 0
+                for trabajador in Trabajador.objects.all():
+                    archivo.write(json.dumps({
+                        'id': trabajador.pk, 'curp': trabajador.usuario.username, 'nombre': trabajador.nombre,
+                        'seccion': str(trabajador.seccion), 'puesto': str(trabajador.puesto),
+                        'jurisdiccion': str(trabajador.jurisdiccion),
+                        'lugar_adscripcion': str(trabajador.lugar_adscripcion),
+                    }) + '\n')
+                    filas += 1
+                for becario in Becario.objects.all():
+                    archivo.write(json.dumps({
+                        'id': becario.pk, 'curp': becario.curp, 'sexo': becario.get_sexo(),
+                        'fecha_nacimiento': becario.get_fecha_nacimiento(),
+                    }) + '\n')
+                    filas += 1
+                for solicitud in Solicitud.objects.all():
+                    for related in ('solicitudaprovechamiento', 'solicitudexcelencia', 'solicitudespecial'):
+                        try:
+                            solicitud = getattr(solicitud, related)
+                            break
+                        except Solicitud.DoesNotExist:
+                            continue
+                    archivo.write(json.dumps({
+                        'id': solicitud.pk, 'tipo': solicitud.tipo_nombre, 'estado': solicitud.estado,
+                        'grado': str(getattr(solicitud, 'grado', '')),
+                    }) + '\n')
+                    filas += 1
+            results.append({
+                'trabajadores': size,
+                'method': 'orm',
+                'rows': filas,
+                'queries': len(queries),
+                'ms': round((time.perf_counter() - start) * 1000, 2),
+            })
+
+            start = time.perf_counter()
+            with count_queries() as queries:
+                filas = sum(write_table(name, os.path.join(directorio, name + '.parquet')) for name in TABLES)
+            results.append({
+                'trabajadores': size,
+                'method': 'snapshot',
+                'rows': filas,
+                'queries': len(queries),
+                'ms': round((time.perf_counter() - start) * 1000, 2),
+            })
+    return results
+
+
+@scenario('estadisticas')
+def bench_estadisticas(options):
+    """
+    Compares counting the solicitudes by estado, tipo, jurisdiccion and grado
+    with a grouped scan of the solicitudes against rendering the statistics
+    page of the admin from the ConteoSolicitud counters, for the given
+    numbers of workers.
+    """
+    from becas_sntsa.management.commands.generate_users import BulkWriter, generate_trabajadores
+    from becas_sntsa.models import Solicitud
+
+    results = []
+    with override_settings(PASSWORD_HASHERS=FAST_HASHERS):
+        catalogs = create_catalogs()
+        catalog_pks = {name: [row.pk] for name, row in catalogs.items()}
+        rangos = {'min_becarios': 1, 'max_becarios': 3, 'min_solicitudes': 1, 'max_solicitudes': 3}
+        client = Client()
+        client.force_login(User.objects.create_superuser(username='bench_estadisticas', password='x'))
+        url = reverse('admin:becas_sntsa_solicitudaprovechamiento_estadisticas')
+        existentes = 0
+        for index, size in enumerate(options['sizes']):
+            writer = BulkWriter('benchmark', 1000)
+            for trabajador in generate_trabajadores(catalog_pks, rangos, index, size - existentes):
+                writer.add(trabajador)
+            writer.flush()
+            existentes = size
+            solicitudes = Solicitud.objects.count()
+
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                with count_queries() as queries:
+                    Solicitud.objects.conteos()
+            results.append({
+                'solicitudes': solicitudes,
+                'method': 'scan',
+                'queries': len(queries),
+                'ms': round((time.perf_counter() - start) * 1000 / options['repeat'], 2),
+            })
+
+            _, queries, elapsed = timed_request(client, url, options['repeat'])
+            results.append({
+                'solicitudes': solicitudes,
+                'method': 'dashboard',
+                'queries': queries,
+                'ms': round(elapsed, 2),
+            })
+    return results
+
+
+@scenario('template_cache')
+def bench_template_cache(options):
+    """
+    Compares rendering the pages with cached fragments (navbar, catalog
+    selects and static content) against rendering them with a dummy cache,
+    for the given numbers of places of assignment in the catalog.
+    """
+    from django.core.cache import cache
+
+    caches = {
+        'dummy': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-template-cache'},
+    }
+    pages = ['home', 'becas', 'create_trabajador', 'create_solicitud_aprovechamiento']
+    results = []
+    with override_settings(PASSWORD_HASHERS=FAST_HASHERS):
+        catalogs = create_catalogs()
+        trabajador = create_trabajador('BTPL800101HDFLNA01', catalogs)
+        client = Client()
+        client.force_login(trabajador.usuario)
+        existentes = 1
+        for size in options['sizes']:
+            LugarAdscripcion.objects.bulk_create(
+                [LugarAdscripcion(nombre='Lugar {}'.format(number)) for number in range(existentes, size)])
+            existentes = max(existentes, size)
+            for backend, settings in caches.items():
+                with override_settings(CACHES={'default': settings}):
+                    cache.clear()
+                    for page in pages:
+                        response, queries, elapsed = timed_request(client, reverse(page), options['repeat'])
+                        results.append({
+                            'lugares': size,
+                            'cache': backend,
+                            'page': page,
+                            'status': response.status_code,
+                            'queries': queries,
+                            'ms': round(elapsed, 2),
+                        })
+    return results
+
+
+@scenario('db_connections')
+def bench_db_connections(options):
+    """
+    Measures the latency of cheap pages served over HTTP when every request
+    opens a new database connection, when the connection is kept between
+    requests and, with psycopg 3 and psycopg_pool installed, when it comes
+    from a pool. The sizes are the number of requests per page. Needs a
+    PostgreSQL database, where opening a connection is expensive.
+    """
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db.backends.signals import connection_created
+    from becas_sntsa.load import InProcessServer, Recorder, Session
+
+    if connection.vendor != 'postgresql':
+        return [{'skipped': 'needs PostgreSQL (DEMO=False, DATABASE_TYPE=postgresql)'}]
+
+    modes = {
+        'new': {'CONN_MAX_AGE': 0, 'OPTIONS': {}},
+        'persistent': {'CONN_MAX_AGE': 60, 'OPTIONS': {}},
+    }
+    try:
+        import psycopg_pool  # noqa: F401
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    except ImportError:
+        is_psycopg3 = False
+    if is_psycopg3:
+        modes['pool'] = {'CONN_MAX_AGE': 0, 'OPTIONS': {'pool': {'min_size': 1, 'max_size': 1}}}
+
+    abiertas = []
+
+    def contar(sender, connection, **kwargs):
+        abiertas.append(connection.alias)
+
+    results = []
+    original = {key: connection.settings_dict[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'OPTIONS')}
+    with override_settings(PASSWORD_HASHERS=FAST_HASHERS):
+        catalogs = create_catalogs()
+        trabajador = create_trabajador('BCON800101HDFLNA01', catalogs)
+        Becario.objects.create(
+            trabajador=trabajador.usuario, nombre='Bench', apellido_paterno='Becario', curp='BCON100101HDFLNA01',
+            curp_archivo='curp/bench.pdf', acta_nacimiento='acta_nacimiento/bench.pdf',
+        )
+        client = Client()
+        client.force_login(trabajador.usuario)
+        connection_created.connect(contar)
+        try:
+            for mode, overrides in modes.items():
+                # The settings dict is shared with the connections of the server
+                # thread, close this one so it is not returned to a pool it
+                # does not come from
+                connection.close()
+                connection.settings_dict.update(overrides, CONN_HEALTH_CHECKS=True)
+                with InProcessServer(WSGIHandler(), threaded=False) as server:
+                    for size in options['sizes']:
+                        for page in ('becas', 'ver_becarios'):
+                            recorder = Recorder()
+                            session = Session(server.url, recorder)
+                            session.cookies['sessionid'] = client.cookies['sessionid'].value
+                            del abiertas[:]
+                            start = time.perf_counter()
+                            for _ in range(size):
+                                session.get(page, reverse(page))
+                            elapsed = time.perf_counter() - start
+                            stats = recorder.report(elapsed)['GET {}'.format(page)]
+                            # Django connects on every checkout, count the pool's own connections
+                            conexiones = (connection.pool.pop_stats().get('connections_num', 0) if connection.pool
+                                          else len(abiertas))
+                            results.append({
+                                'mode': mode,
+                                'page': page,
+                                'requests': size,
+                                'connections': conexiones,
+                                'mean_ms': stats['mean_ms'],
+                                'p95_ms': stats['p95_ms'],
+                            })
+                connection.close_pool()
+        finally:
+            connection_created.disconnect(contar)
+            connection.settings_dict.update(original)
+    return results
+
+
+def slow_download(url, cookies, chunk_size=65536, delay=0.005):
+    """
+    Downloads a URL like a client on a slow link: with a small receive buffer,
+    reading one chunk at a time with a pause between chunks.
+
+    Args:
+        url (str): The URL to download.
+        cookies (dict): The cookies to send.
+        chunk_size (int): The bytes read per chunk, also the receive buffer.
+        delay (float): The seconds waited after every chunk.
+
+    Returns:
+        tuple: The status and the number of bytes received.
+    """
+    import http.client
+    import socket
+    from urllib.parse import urlsplit
+
+    parts = urlsplit(url)
+    conexion = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+    conexion.sock = socket.socket()
+    conexion.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, chunk_size)
+    conexion.sock.settimeout(120)
+    conexion.sock.connect((parts.hostname, parts.port))
+    try:
+        conexion.request('GET', parts.path, headers={
+            'Cookie': '; '.join('{}={}'.format(key, value) for key, value in cookies.items())})
+        respuesta = conexion.getresponse()
+        total = 0
+        while chunk := respuesta.read(chunk_size):
+            total += len(chunk)
+            time.sleep(delay)
+        return respuesta.status, total
+    finally:
+        conexion.close()
+
+
+@scenario('asgi_downloads')
+def bench_asgi_downloads(options):
+    """
+    Measures how many downloads one process serves at the same time to slow
+    clients: under WSGI with a single thread (a sync worker), under WSGI with
+    a thread per request and under ASGI with uvicorn, where the download
+    view is async and streams the file without holding the process. The
+    sizes are the numbers of concurrent downloads of an 8 MB file. Needs
+    uvicorn.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from django.core.handlers.asgi import ASGIHandler
+    from django.core.handlers.wsgi import WSGIHandler
+    from becas_sntsa.load import InProcessASGIServer, InProcessServer, percentile
+
+    servers = {
+        'wsgi': lambda: InProcessServer(WSGIHandler(), threaded=False),
+        'wsgi-threaded': lambda: InProcessServer(WSGIHandler()),
+        'asgi': lambda: InProcessASGIServer(ASGIHandler()),
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as media_root, \
+            override_settings(MEDIA_ROOT=media_root, PASSWORD_HASHERS=FAST_HASHERS,
+                              ALLOWED_HOSTS=['127.0.0.1']):
+        catalogs = create_catalogs()
+        trabajador = create_trabajador('BASG800101HDFLNA01', catalogs)
+        becario = Becario.objects.create(
+            trabajador=trabajador.usuario, nombre='Bench', apellido_paterno='Becario', curp='BASG100101HDFLNA01',
+            curp_archivo='curp/BASG100101HDFLNA01.pdf', acta_nacimiento='acta_nacimiento/BASG100101HDFLNA01.pdf',
+        )
+        os.makedirs(os.path.join(media_root, 'curp'))
+        with open(os.path.join(media_root, becario.curp_archivo.name), 'wb') as archivo:
+            archivo.write(os.urandom(8 * 1024 * 1024))
+        client = Client()
+        client.force_login(trabajador.usuario)
+        cookies = {'sessionid': client.cookies['sessionid'].value}
+        path = reverse('download_file', args=[becario.curp_archivo.name])
+
+        for mode, server_factory in servers.items():
+            with server_factory() as server:
+                for size in options['sizes']:
+                    tiempos = []
+
+                    def download(_):
+                        start = time.perf_counter()
+                        status, total = slow_download(server.url + path, cookies)
+                        tiempos.append((time.perf_counter() - start) * 1000)
+                        return status == 200 and total == 8 * 1024 * 1024
+
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=size) as executor:
+                        completas = sum(executor.map(download, range(size)))
+                    elapsed = time.perf_counter() - start
+                    tiempos.sort()
+                    results.append({
+                        'mode': mode,
+                        'concurrent': size,
+                        'ok': completas,
+                        'wall_s': round(elapsed, 2),
+                        'p50_ms': round(percentile(tiempos, 50), 1),
+                        'max_ms': round(tiempos[-1], 1),
+                        'downloads_per_s': round(size / elapsed, 2),
+                    })
+    return results
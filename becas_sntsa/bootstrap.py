@@ -0,0 +1,192 @@
+"""
+Fingerprints of the startup phases of the container.
+
+Every start used to run makemigrations, migrate, loaddata and collectstatic,
+even when nothing they depend on had changed. Each phase is described here
+by a fingerprint of its inputs: the models and the migration files, the
+migration graph, the fixture file and the static source files. The
+bootstrap command stores the fingerprint after a phase runs and skips the
+phase while the fingerprint stays the same.
+
+The fingerprints of the database phases are stored in the database itself,
+so a new or restored database runs them again. The one of collectstatic is
+stored next to the collected files, in STATIC_ROOT.
+"""
+import hashlib
+import os
+import sys
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from becas_sntsa.models import BootstrapFingerprint
+
+PHASES = ('makemigrations', 'migrate', 'loaddata', 'collectstatic')
+
+# Phases whose fingerprint is stored in the database
+DATABASE_PHASES = ('makemigrations', 'migrate', 'loaddata')
+
+# File of STATIC_ROOT with the fingerprint of the collected files
+STATIC_FINGERPRINT = '.bootstrap-fingerprint'
+
+# Patterns collectstatic ignores by default
+STATIC_IGNORE_PATTERNS = ['CVS', '.*', '*~']
+
+
+def hash_files(digest, paths):
+    """
+    Adds the name and the content of some files to a digest, in order.
+
+    Args:
+        digest (hashlib._Hash): The digest to update.
+        paths (iterable): (name, path) of every file. The name is hashed
+                          instead of the path, so the fingerprint does not
+                          depend on where the project is installed.
+    """
+    for name, path in paths:
+        digest.update(name.encode('utf-8') + b'\0')
+        with open(path, 'rb') as archivo:
+            for chunk in iter(lambda: archivo.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+
+
+def migration_files(loader) -> list:
+    """
+    Returns the migration files found on disk, sorted by app and name.
+    """
+    files = []
+    for (app_label, name), migration in sorted(loader.disk_migrations.items()):
+        files.append(('{}/{}'.format(app_label, name), sys.modules[migration.__module__].__file__))
+    return files
+
+
+def migrate_fingerprint() -> str:
+    """
+    Returns the fingerprint of the migration graph: the name and the content
+    of every migration, so a new or edited migration changes it.
+    """
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    digest = hashlib.sha256()
+    hash_files(digest, migration_files(loader))
+    return digest.hexdigest()
+
+
+def makemigrations_fingerprint() -> str:
+    """
+    Returns the fingerprint of the inputs of makemigrations: the models
+    module of every app and the migration graph.
+    """
+    digest = hashlib.sha256()
+    modules = sorted((app_config.label, app_config.models_module.__file__)
+                     for app_config in apps.get_app_configs() if app_config.models_module)
+    hash_files(digest, modules)
+    digest.update(migrate_fingerprint().encode('ascii'))
+    return digest.hexdigest()
+
+
+def find_fixture(name) -> list:
+    """
+    Returns the paths of the fixture files with a name, in the fixtures
+    directory of every app and in FIXTURE_DIRS, like loaddata looks for them.
+    """
+    directorios = [os.path.join(app_config.path, 'fixtures') for app_config in apps.get_app_configs()]
+    directorios += [str(directorio) for directorio in settings.FIXTURE_DIRS]
+    return [os.path.join(directorio, name) for directorio in directorios
+            if os.path.isfile(os.path.join(directorio, name))]
+
+
+def loaddata_fingerprint(name) -> str:
+    """
+    Returns the fingerprint of the files of a fixture.
+
+    Args:
+        name (str): The name of the fixture, e.g. 'initial_data.json'.
+    """
+    digest = hashlib.sha256(name.encode('utf-8') + b'\0')
+    hash_files(digest, [(str(indice), path) for indice, path in enumerate(find_fixture(name))])
+    return digest.hexdigest()
+
+
+def collectstatic_fingerprint() -> str:
+    """
+    Returns the fingerprint of the static files collectstatic would copy and
+    of the storage they are copied to.
+    """
+    files = {}
+    for finder in get_finders():
+        for path, storage in finder.list(STATIC_IGNORE_PATTERNS):
+            prefix = getattr(storage, 'prefix', None)
+            name = os.path.join(prefix, path) if prefix else path
+            # The first finder that has a file wins, like in collectstatic
+            files.setdefault(name, storage.path(path))
+    digest = hashlib.sha256('{}.{}\0{}\0'.format(
+        type(staticfiles_storage).__module__, type(staticfiles_storage).__qualname__,
+        settings.STATIC_URL).encode('utf-8'))
+    hash_files(digest, sorted(files.items()))
+    return digest.hexdigest()
+
+
+def get_fingerprint(fase, fixture='initial_data.json') -> str:
+    """
+    Returns the current fingerprint of the inputs of a phase.
+
+    Args:
+        fase (str): One of PHASES.
+        fixture (str): The fixture loaded by the loaddata phase.
+    """
+    if fase == 'makemigrations':
+        return makemigrations_fingerprint()
+    if fase == 'migrate':
+        return migrate_fingerprint()
+    if fase == 'loaddata':
+        return loaddata_fingerprint(fixture)
+    return collectstatic_fingerprint()
+
+
+def static_fingerprint_path() -> str:
+    """
+    Returns the path of the file with the fingerprint of the collected files.
+    """
+    return os.path.join(settings.STATIC_ROOT, STATIC_FINGERPRINT)
+
+
+def get_stored(fase) -> str:
+    """
+    Returns the fingerprint stored the last time a phase ran, or None if it
+    never ran or its output is gone (e.g. a new database or an empty
+    STATIC_ROOT).
+    """
+    if fase in DATABASE_PHASES:
+        if BootstrapFingerprint._meta.db_table not in connection.introspection.table_names():
+            return None
+        return BootstrapFingerprint.objects.filter(fase=fase).values_list('huella', flat=True).first()
+
+    manifest = getattr(staticfiles_storage, 'manifest_name', None)
+    if manifest and not os.path.isfile(os.path.join(settings.STATIC_ROOT, manifest)):
+        return None
+    try:
+        with open(static_fingerprint_path()) as archivo:
+            return archivo.read().strip() or None
+    except OSError:
+        return None
+
+
+def store(fase, huella) -> bool:
+    """
+    Stores the fingerprint of a phase that ran.
+
+    Returns:
+        bool: False if it could not be stored yet, because the database is
+              not migrated.
+    """
+    if fase in DATABASE_PHASES:
+        if BootstrapFingerprint._meta.db_table not in connection.introspection.table_names():
+            return False
+        BootstrapFingerprint.objects.update_or_create(fase=fase, defaults={'huella': huella})
+    else:
+        with open(static_fingerprint_path(), 'w') as archivo:
+            archivo.write(huella + '\n')
+    return True
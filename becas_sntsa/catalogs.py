@@ -0,0 +1,152 @@
+"""
+Process-local cache of the catalog tables.
+
+Sections, positions, jurisdictions, places of assignment and grades change a
+few times a year but fill the selects of every registration and application
+form. Each process keeps the rows of these tables in memory and serves the
+form choices from there. Saving or deleting a catalog row changes the
+version of its table in the shared cache, so every process reloads it on
+its next read.
+
+Rows read in a transaction that changed their table are kept apart, for
+the thread of that transaction only, until it ends: if it is rolled back,
+no process serves rows that are not in the table.
+"""
+import threading
+import uuid
+from django.core.cache import cache
+from django.db import connection, transaction
+from becas_sntsa.models import Seccion, Puesto, Jurisdiccion, LugarAdscripcion, Grado
+
+CATALOG_MODELS = (Seccion, Puesto, Jurisdiccion, LugarAdscripcion, Grado)
+
+# Key of the version of a catalog table in the shared cache
+VERSION_KEY = 'becas_sntsa:catalogo:{}:version'
+
+_lock = threading.Lock()
+# (version, rows, rows by pk) of every loaded table, by model
+_catalogs = {}
+
+# Tables changed by the open transaction of each thread: the outermost
+# atomic block of the transaction and the (atomic blocks, version, rows,
+# rows by pk) read since, by model
+_local = threading.local()
+
+
+def get_pending(model):
+    """
+    Returns the entry of a table changed by the open transaction of this
+    thread, dropping the ones of transactions that ended.
+    """
+    pending = getattr(_local, 'pending', None)
+    if not pending:
+        return None
+    bloque = connection.atomic_blocks[0] if connection.in_atomic_block else None
+    for changed, entry in list(pending.items()):
+        if entry[0] is not bloque:
+            del pending[changed]
+    return pending.get(model)
+
+
+def get_version(model) -> str:
+    """
+    Returns the current version of a catalog table, creating one if the
+    shared cache does not have it (e.g. after a restart or an eviction).
+    With a cache that stores nothing (DummyCache) every call returns a new
+    version, so nothing is served from the process cache either.
+    """
+    key = VERSION_KEY.format(model._meta.label_lower)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key) or uuid.uuid4().hex
+    return version
+
+
+def load(model) -> tuple:
+    """
+    Returns the cached rows of a catalog table, reloading them when the table
+    changed since they were loaded.
+
+    Returns:
+        tuple: The list of rows, in the default order of the model, and a
+               dict of the rows by primary key.
+    """
+    version = get_version(model)
+    pending = get_pending(model)
+    if pending is not None:
+        # The rows may not be committed, keep them for this transaction and
+        # reload them when a savepoint ends, it may have been rolled back
+        bloques = tuple(connection.atomic_blocks)
+        if pending[1] is None or pending[1][:2] != (bloques, version):
+            rows = list(model._default_manager.all())
+            pending = _local.pending[model] = (pending[0], (bloques, version, rows, {row.pk: row for row in rows}))
+        return pending[1][2], pending[1][3]
+
+    cached = _catalogs.get(model)
+    if cached is None or cached[0] != version:
+        rows = list(model._default_manager.all())
+        cached = (version, rows, {row.pk: row for row in rows})
+        with _lock:
+            _catalogs[model] = cached
+    return cached[1], cached[2]
+
+
+def get_catalog(model) -> list:
+    """
+    Returns the rows of a catalog table from the process cache.
+
+    Args:
+        model (Model): One of CATALOG_MODELS.
+
+    Returns:
+        list: The rows, shared between requests, so they must not be modified.
+    """
+    return load(model)[0]
+
+
+def get_catalog_row(model, pk):
+    """
+    Returns one row of a catalog table from the process cache.
+
+    Args:
+        model (Model): One of CATALOG_MODELS.
+        pk (int): The primary key of the row.
+
+    Returns:
+        Model: The row, or None if it does not exist.
+    """
+    return load(model)[1].get(pk)
+
+
+def discard(model):
+    """
+    Discards the cached rows of a catalog table in this process only, so the
+    next read reloads them.
+    """
+    with _lock:
+        _catalogs.pop(model, None)
+    pending = get_pending(model)
+    if pending is not None:
+        _local.pending[model] = (pending[0], None)
+
+
+def invalidate(model):
+    """
+    Discards the cached rows of a catalog table in every process.
+
+    The version is changed right away, and again when the transaction
+    commits, so a process that reloads the table before the commit does not
+    keep the old rows. Until the transaction ends, this thread reads the
+    table apart from the other ones (see load).
+    """
+    def bump():
+        cache.set(VERSION_KEY.format(model._meta.label_lower), uuid.uuid4().hex, timeout=None)
+
+    discard(model)
+    if connection.in_atomic_block:
+        if getattr(_local, 'pending', None) is None:
+            _local.pending = {}
+        _local.pending[model] = (connection.atomic_blocks[0], None)
+    bump()
+    transaction.on_commit(bump)
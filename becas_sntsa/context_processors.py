@@ -0,0 +1,14 @@
+"""
+Template context processors for the becas_sntsa app.
+"""
+from django.conf import settings
+
+
+def fragment_cache(request) -> dict:
+    """
+    Adds the timeout of the cached template fragments to the context.
+
+    Returns:
+        dict: The fragment_cache_timeout variable.
+    """
+    return {'fragment_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT}
@@ -0,0 +1,273 @@
+"""
+Spreadsheet exports of the scholarship applications.
+
+The rows come from one flat query joining the three Solicitud subclasses,
+read with a chunked iterator and encoded as CSV or XLSX while they are
+streamed, so memory use does not grow with the number of applications.
+"""
+import csv
+import re
+import zipfile
+from xml.sax.saxutils import escape
+from django.db.models import Case, CharField, Q, Value, When
+from django.db.models.functions import Coalesce
+from becas_sntsa.ganadores import TIPOS
+from becas_sntsa.models import Solicitud
+
+# Rows fetched from the database per round trip
+CHUNK_SIZE = 2000
+
+# Rows encoded per chunk of the response, to avoid a write per row
+ROWS_PER_CHUNK = 500
+
+# Header and lookup of every column, in order
+COLUMNS = [
+    ('ID', 'pk'),
+    ('Tipo', 'tipo'),
+    ('Estado', 'estado'),
+    ('Fecha de solicitud', 'fecha_solicitud'),
+    ('CURP del becario', 'becario__curp'),
+    ('Nombre del becario', 'becario__nombre'),
+    ('Apellido paterno del becario', 'becario__apellido_paterno'),
+    ('Apellido materno del becario', 'becario__apellido_materno'),
+    ('CURP del trabajador', 'becario__trabajador__username'),
+    ('Nombre del trabajador', 'becario__trabajador__trabajador__nombre'),
+    ('Apellido paterno del trabajador', 'becario__trabajador__trabajador__apellido_paterno'),
+    ('Apellido materno del trabajador', 'becario__trabajador__trabajador__apellido_materno'),
+    ('Jurisdicción', 'becario__trabajador__trabajador__jurisdiccion__clave'),
+    ('Lugar de adscripción', 'becario__trabajador__trabajador__lugar_adscripcion__nombre'),
+    ('Grado', 'grado'),
+    ('Promedio', 'promedio'),
+    ('Carrera', 'solicitudexcelencia__carrera'),
+]
+
+FORMATS = ('csv', 'xlsx')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Characters not allowed in XML 1.0 documents
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def tipo_expression():
+    """
+    Returns an expression with the type name of each Solicitud, from the
+    subclass row joined to it.
+
+    Returns:
+        Case: The tipo_nombre of the subclass, or '' for bare Solicitud rows.
+    """
+    return Case(
+        *[When(**{'{}__isnull'.format(model._meta.model_name): False}, then=Value(model.tipo_nombre))
+          for model in TIPOS.values()],
+        default=Value(''),
+        output_field=CharField(),
+    )
+
+
+def export_queryset(estado=None, tipos=None, desde=None, hasta=None):
+    """
+    Builds the flat query of the exported applications.
+
+    Args:
+        estado (str): Only export applications in this estado.
+        tipos (list): Only export applications of these types (keys of TIPOS).
+        desde (date): Only export applications made on or after this date.
+        hasta (date): Only export applications made on or before this date.
+
+    Returns:
+        QuerySet: Tuples with the values of COLUMNS, ordered by id.
+    """
+    queryset = Solicitud.objects.all()
+    if estado:
+        queryset = queryset.filter(estado=estado)
+    if tipos:
+        filtro = Q()
+        for tipo in tipos:
+            filtro |= Q(**{'{}__isnull'.format(TIPOS[tipo]._meta.model_name): False})
+        queryset = queryset.filter(filtro)
+    if desde:
+        queryset = queryset.filter(fecha_solicitud__gte=desde)
+    if hasta:
+        queryset = queryset.filter(fecha_solicitud__lte=hasta)
+
+    return queryset.annotate(
+        tipo=tipo_expression(),
+        grado=Coalesce('solicitudaprovechamiento__grado__nombre', 'solicitudexcelencia__grado__nombre'),
+        promedio=Coalesce('solicitudaprovechamiento__promedio', 'solicitudexcelencia__promedio'),
+    ).order_by('pk').values_list(*[lookup for _, lookup in COLUMNS])
+
+
+def export_rows(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yields the rows of an export query with the estados as their labels.
+
+    Args:
+        queryset (QuerySet): The query returned by export_queryset.
+        chunk_size (int): The rows fetched from the database per round trip.
+
+    Yields:
+        tuple: The values of one application, in the order of COLUMNS.
+    """
+    estados = dict(Solicitud.ESTADO_CHOICES)
+    indice = [lookup for _, lookup in COLUMNS].index('estado')
+    for row in queryset.iterator(chunk_size=chunk_size):
+        row = list(row)
+        row[indice] = estados.get(row[indice], row[indice])
+        yield row
+
+
+class Echo:
+    """
+    A file-like object that returns what is written to it, to encode CSV
+    rows one at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """
+    Encodes rows as CSV, with a header and a BOM so spreadsheets detect UTF-8.
+
+    Args:
+        rows (iterable): The rows returned by export_rows.
+
+    Yields:
+        bytes: Chunks of the CSV document.
+    """
+    writer = csv.writer(Echo())
+    yield ('\ufeff' + writer.writerow([header for header, _ in COLUMNS])).encode('utf-8')
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow(['' if value is None else value for value in row]))
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+
+
+class ZipStream:
+    """
+    A write-only, unseekable file that collects what zipfile writes to it, so
+    the archive can be streamed while it is built.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Solicitudes" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def xlsx_cell(value) -> str:
+    """
+    Encodes a value as an inline cell of a worksheet.
+    """
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return '<c t="n"><v>{}</v></c>'.format(value)
+    texto = INVALID_XML_CHARS.sub('', str(value))
+    return '<c t="inlineStr"><is><t xml:space="preserve">{}</t></is></c>'.format(escape(texto))
+
+
+def stream_xlsx(rows):
+    """
+    Encodes rows as a single-sheet XLSX workbook, built with zipfile as the
+    rows are read. Text cells are inline strings, so no shared strings table
+    has to be kept in memory.
+
+    Args:
+        rows (iterable): The rows returned by export_rows.
+
+    Yields:
+        bytes: Chunks of the XLSX archive.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archivo:
+        for name, content in XLSX_PARTS.items():
+            archivo.writestr(name, content)
+        yield stream.pop()
+
+        with archivo.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            hoja.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            hoja.write('<row>{}</row>'.format(''.join(xlsx_cell(header) for header, _ in COLUMNS)).encode('utf-8'))
+            chunk = []
+            for row in rows:
+                chunk.append('<row>{}</row>'.format(''.join(xlsx_cell(value) for value in row)))
+                if len(chunk) >= ROWS_PER_CHUNK:
+                    hoja.write(''.join(chunk).encode('utf-8'))
+                    chunk = []
+                    yield stream.pop()
+            hoja.write(''.join(chunk).encode('utf-8'))
+            hoja.write(b'</sheetData></worksheet>')
+    yield stream.pop()
+
+
+def stream_export(formato, rows):
+    """
+    Encodes rows in the given format.
+
+    Args:
+        formato (str): One of FORMATS.
+        rows (iterable): The rows returned by export_rows.
+
+    Returns:
+        iterator: The chunks of the document as bytes.
+    """
+    return stream_csv(rows) if formato == 'csv' else stream_xlsx(rows)
@@ -7,7 +7,9 @@ import re
 from django import forms
 from django.forms import ModelForm
 from django.core.exceptions import ValidationError
-from becas_sntsa.models import Trabajador, Becario, SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial
+from becas_sntsa.catalogs import discard, get_catalog, get_catalog_row
+from becas_sntsa.ganadores import TIPOS
+from becas_sntsa.models import Trabajador, Becario, Solicitud, SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial
 
 def validar_curp(curp):
     """
@@ -17,6 +19,59 @@ def validar_curp(curp):
     if not re.match(regex, curp):
         raise ValidationError('El formato de la CURP no es válido.')
 
+class CatalogChoiceIterator(forms.models.ModelChoiceIterator):
+    """
+    Iterates over the choices of a catalog from the process cache instead of
+    querying the table.
+    """
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in get_catalog(self.queryset.model):
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(get_catalog(self.queryset.model)) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(get_catalog(self.queryset.model))
+
+
+class CatalogChoiceField(forms.ModelChoiceField):
+    """
+    A ModelChoiceField for the catalog tables (see catalogs.CATALOG_MODELS)
+    that renders and validates its choices from the process cache, so forms
+    do not query the catalogs. A choice missing from the cache is looked up
+    in the table before it is rejected.
+    """
+    iterator = CatalogChoiceIterator
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.queryset.model):
+            return value
+        try:
+            pk = int(value)
+        except (TypeError, ValueError):
+            pk = None
+        obj = get_catalog_row(self.queryset.model, pk) if pk is not None else None
+        if obj is None and pk is not None:
+            # The row may have been added by a process that does not share
+            # the cache, check the table and reload it
+            obj = self.queryset.filter(pk=pk).first()
+            if obj is not None:
+                discard(self.queryset.model)
+        if obj is None:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return obj
+
+
 class TrabajadorCreateForm(ModelForm):
     """
     A form for creating a new worker.
@@ -31,6 +86,12 @@ class TrabajadorCreateForm(ModelForm):
         widgets = {
             'correo': forms.EmailInput(),
         }
+        field_classes = {
+            'seccion': CatalogChoiceField,
+            'puesto': CatalogChoiceField,
+            'jurisdiccion': CatalogChoiceField,
+            'lugar_adscripcion': CatalogChoiceField,
+        }
 
 
 class BecarioCreateForm(ModelForm):
@@ -113,6 +174,7 @@ class SolicitudAprovechamientoCreateForm(forms.ModelForm):
         model = SolicitudAprovechamiento
         fields = ['becario', 'grado', 'promedio',
                   'boleta', 'recibo_nomina', 'ine']
+        field_classes = {'grado': CatalogChoiceField}
 
     def __init__(self, *args, **kwargs):
         """
@@ -158,6 +220,7 @@ class SolicitudExcelenciaCreateForm(forms.ModelForm):
         model = SolicitudExcelencia
         fields = ['becario', 'grado', 'promedio',
                   'boleta', 'recibo_nomina', 'ine', 'carrera']
+        field_classes = {'grado': CatalogChoiceField}
 
     def __init__(self, *args, **kwargs):
         """
@@ -217,3 +280,69 @@ class SolicitudEspecialCreateForm(forms.ModelForm):
         super(SolicitudEspecialCreateForm, self).__init__(*args, **kwargs)
         self.fields['becario'].queryset = Becario.objects.filter(
             trabajador=user)
+
+
+TIPO_CHOICES = [(tipo, model.tipo_nombre) for tipo, model in TIPOS.items()]
+
+
+class TiposFormMixin:
+    """
+    Limits the choices of the tipos field of a form to the application types
+    the user has permission for.
+    """
+
+    def __init__(self, *args, tipos=None, **kwargs):
+        """
+        Args:
+            tipos (list, optional): The allowed types, keys of TIPO_CHOICES
+                                    (default: all).
+        """
+        super().__init__(*args, **kwargs)
+        if tipos is not None:
+            self.fields['tipos'].choices = [choice for choice in TIPO_CHOICES if choice[0] in tipos]
+
+
+class ImportarGanadoresForm(TiposFormMixin, forms.Form):
+    """
+    A form for importing the results list of a scholarship call.
+    """
+    archivo = forms.FileField(label='Lista de resultados (PDF)')
+    tipos = forms.MultipleChoiceField(
+        label='Tipos de solicitud incluidos en la lista',
+        choices=TIPO_CHOICES,
+        widget=forms.CheckboxSelectMultiple,
+    )
+    dry_run = forms.BooleanField(
+        label='Solo vista previa (no aplicar cambios)', required=False, initial=True)
+    notificar = forms.BooleanField(
+        label='Notificar a los trabajadores por correo', required=False, initial=True)
+
+
+class ExportarSolicitudesForm(TiposFormMixin, forms.Form):
+    """
+    A form for filtering the applications exported to a spreadsheet.
+    """
+    formato = forms.ChoiceField(
+        label='Formato', choices=[('xlsx', 'Excel (XLSX)'), ('csv', 'CSV')], initial='xlsx')
+    estado = forms.ChoiceField(
+        label='Estado', choices=[('', 'Todos')] + Solicitud.ESTADO_CHOICES, required=False)
+    tipos = forms.MultipleChoiceField(
+        label='Tipos de solicitud (todos si no se marca ninguno)',
+        choices=TIPO_CHOICES,
+        widget=forms.CheckboxSelectMultiple,
+        required=False,
+    )
+    desde = forms.DateField(
+        label='Solicitadas desde', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    hasta = forms.DateField(
+        label='Solicitadas hasta', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean(self):
+        """
+        Validates that the date range is not reversed.
+        """
+        cleaned_data = super().clean()
+        desde, hasta = cleaned_data.get('desde'), cleaned_data.get('hasta')
+        if desde and hasta and desde > hasta:
+            raise forms.ValidationError('La fecha inicial debe ser anterior a la final.')
+        return cleaned_data
@@ -0,0 +1,187 @@
+"""
+Import of the scholarship results lists.
+
+The results are published as PDF files, in December for the excellence
+scholarships and in June for the achievement and special ones. This module
+extracts the winners from those lists, matches them in memory against the
+applications waiting for results and applies every transition in bulk.
+"""
+import re
+from collections import namedtuple
+from django.db import transaction
+from pypdf import PdfReader
+from becas_sntsa.matching import NameMatcher, normalize_name
+from becas_sntsa.models import Solicitud, SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial, UPDATE_BATCH_SIZE, send_estado_notifications
+
+# Application types that can be imported, keyed by the name used in the forms
+TIPOS = {
+    'aprovechamiento': SolicitudAprovechamiento,
+    'excelencia': SolicitudExcelencia,
+    'especial': SolicitudEspecial,
+}
+
+CURP_REGEX = re.compile(r'\b([A-Z][AEIOUX][A-Z]{2}\d{6}[HM][A-Z]{5}[A-Z0-9]\d)\b')
+
+# Leading row numbers and separators of the results tables
+ROW_NUMBER_REGEX = re.compile(r'^\s*\d+[\s.\-)]*')
+
+# Words of the headers, totals and footers of the lists, never of a name
+NOT_NAME_WORDS = frozenset({
+    'ASIGNADAS', 'BECA', 'BECAS', 'CURP', 'FOLIO', 'GANADORES', 'HOJA', 'LISTA', 'NOMBRE', 'PAGINA',
+    'RESULTADOS', 'TOTAL', 'TOTALES',
+})
+
+Ganador = namedtuple('Ganador', ['curp', 'nombre'])
+Transicion = namedtuple('Transicion', ['solicitud_id', 'curp', 'nombre', 'tipo', 'promedio'])
+
+
+def extract_lines(archivo):
+    """
+    Yields the text lines of a results list, one page at a time.
+
+    Args:
+        archivo (file): A binary file object with a PDF or plain text list.
+
+    Yields:
+        str: Each line of text of the list.
+    """
+    header = archivo.read(4)
+    archivo.seek(0)
+    if header == b'%PDF':
+        for page in PdfReader(archivo).pages:
+            yield from (page.extract_text() or '').splitlines()
+    else:
+        for line in archivo:
+            yield line.decode('utf-8', errors='replace').rstrip('\r\n')
+
+
+def parse_ganadores(lines):
+    """
+    Extracts the winners from the lines of a results list.
+
+    Every line that contains a CURP is a winner, the rest of the line (without
+    the row number) is taken as the winner's name. Numbered rows without a
+    CURP are winners identified only by their name, when they look like one:
+    three or more words, without digits or the words of NOT_NAME_WORDS (e.g.
+    "2 TOTAL DE BECAS ASIGNADAS").
+
+    Args:
+        lines (iterable): The text lines of the list.
+
+    Yields:
+        Ganador: The CURP and name of each winner.
+    """
+    for line in lines:
+        match = CURP_REGEX.search(line.upper())
+        if match:
+            nombre = (line[:match.start()] + ' ' + line[match.end():]).strip()
+            nombre = ' '.join(ROW_NUMBER_REGEX.sub('', nombre).split())
+            yield Ganador(match.group(1), nombre)
+        elif ROW_NUMBER_REGEX.match(line):
+            nombre = ' '.join(ROW_NUMBER_REGEX.sub('', line).split())
+            palabras = normalize_name(nombre).split()
+            if len(palabras) >= 3 and not any(caracter.isdigit() for caracter in nombre) \
+                    and NOT_NAME_WORDS.isdisjoint(palabras):
+                yield Ganador(None, nombre)
+
+
+class ImportPlan:
+    """
+    The transitions that importing a results list would apply.
+
+    Attributes:
+        ganadores (list): Transitions of pending applications to 'T'.
+        no_ganadores (list): Transitions of pending applications to 'F'.
+        no_encontrados (list): Winners of the list without a pending application.
+        por_nombre (list): Tuples of (Ganador, Transicion) of the winners that
+                           were matched by name instead of by CURP.
+    """
+
+    def __init__(self, ganadores, no_ganadores, no_encontrados, por_nombre=None):
+        self.ganadores = ganadores
+        self.no_ganadores = no_ganadores
+        self.no_encontrados = no_encontrados
+        self.por_nombre = por_nombre or []
+
+    def apply(self, notificar=True):
+        """
+        Applies every transition in one transaction with bulk updates.
+
+        Args:
+            notificar (bool): Whether to notify the workers of the new estado.
+        """
+        with transaction.atomic():
+            for estado, transiciones in (('T', self.ganadores), ('F', self.no_ganadores)):
+                ids = [transicion.solicitud_id for transicion in transiciones]
+                for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+                    Solicitud.objects.filter(
+                        pk__in=ids[start:start + UPDATE_BATCH_SIZE], estado='P').update(estado=estado)
+            if notificar:
+                send_estado_notifications(
+                    [transicion.solicitud_id for transicion in self.ganadores + self.no_ganadores])
+
+
+def plan_import(ganadores, tipos):
+    """
+    Matches the winners of a list against the applications waiting for
+    results ('P') of the given types.
+
+    Winners are matched by CURP, and a listed CURP without a pending
+    application is not found even if another applicant has the same name.
+    Only winners listed without a CURP are matched by name; when a name
+    matches several applications equally well the one with the best
+    promedio wins.
+
+    Args:
+        ganadores (iterable): The winners extracted from the list.
+        tipos (list): The application types covered by the list, keys of TIPOS.
+
+    Returns:
+        ImportPlan: The transitions to apply.
+    """
+    pendientes = {}
+    matcher = NameMatcher()
+    for tipo in tipos:
+        model = TIPOS[tipo]
+        promedio = 'promedio' if any(field.name == 'promedio' for field in model._meta.fields) else 'pk'
+        rows = model.objects.filter(estado='P').values_list(
+            'pk', 'becario__curp', 'becario__nombre', 'becario__apellido_paterno',
+            'becario__apellido_materno', 'becario__nombre_normalizado', 'becario__clave_fonetica', promedio)
+        for pk, curp, nombre, paterno, materno, normalizado, fonetica, valor in rows.iterator(chunk_size=2000):
+            transicion = Transicion(pk, curp, ' '.join(parte for parte in (nombre, paterno, materno) if parte),
+                                    tipo, valor if promedio == 'promedio' else None)
+            pendientes.setdefault(curp.upper(), []).append(transicion)
+            matcher.add(transicion, transicion.nombre, transicion.promedio,
+                        nombre_normalizado=normalizado, clave_fonetica=fonetica)
+
+    ganadores_plan = []
+    sin_curp = []
+    no_encontrados = []
+    vistos = set()
+    for ganador in ganadores:
+        if ganador.curp is None:
+            sin_curp.append(ganador)
+            continue
+        if ganador.curp in vistos:
+            # Winners listed more than once
+            continue
+        vistos.add(ganador.curp)
+        transiciones = pendientes.pop(ganador.curp, None)
+        if transiciones:
+            ganadores_plan.extend(transiciones)
+        else:
+            no_encontrados.append(ganador)
+
+    asignadas = set(ganadores_plan)
+    por_nombre = []
+    for ganador in sin_curp:
+        transicion = matcher.match(ganador.nombre, exclude=asignadas) if ganador.nombre else None
+        if transicion is None:
+            no_encontrados.append(ganador)
+            continue
+        asignadas.add(transicion)
+        pendientes[transicion.curp.upper()].remove(transicion)
+        ganadores_plan.append(transicion)
+        por_nombre.append((ganador, transicion))
+    no_ganadores = [transicion for transiciones in pendientes.values() for transicion in transiciones]
+    return ImportPlan(ganadores_plan, no_ganadores, no_encontrados, por_nombre)
@@ -0,0 +1,786 @@
+"""
+Load testing for the becas_sntsa app.
+
+The bench_load command replays weighted user journeys over real HTTP, against
+the app served in-process by a threaded WSGI server, against gunicorn
+started with the profiles of gunicorn.conf.py or against a local server,
+and reports the latency percentiles and the throughput of every
+endpoint. Activation emails go through the outbox to a local SMTP sink.
+"""
+import http.client
+import http.cookies
+import os
+import re
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode, urlsplit
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+from django.conf import settings
+from django.db import connection, connections
+
+JOURNEYS = {}
+
+# Hosts accepted for the database and the target server
+LOCAL_HOSTS = ('', 'localhost', '127.0.0.1', '::1')
+
+ESTADOS_CURP = ('AS', 'BC', 'CH', 'DF', 'GT', 'JC', 'MC', 'NL', 'PL', 'VZ', 'YN', 'ZS')
+
+Response = namedtuple('Response', ['status', 'headers', 'body'])
+
+
+class JourneyError(Exception):
+    """
+    Raised when a step of a journey gets an unexpected response.
+    """
+
+
+def journey(name):
+    """
+    Registers a user journey under the given name.
+
+    A journey is called with a Session and the LoadContext of the run, and
+    raises JourneyError when a step fails.
+
+    Args:
+        name (str): The name used to weight the journey from the command line.
+
+    Returns:
+        function: The decorator that registers the journey.
+    """
+    def decorator(func):
+        JOURNEYS[name] = func
+        return func
+    return decorator
+
+
+def check_local_database(settings_dict):
+    """
+    Ensures the database is SQLite or a PostgreSQL server on this machine.
+
+    Args:
+        settings_dict (dict): The settings of the database connection.
+
+    Raises:
+        ValueError: If the database is neither SQLite nor a local PostgreSQL.
+    """
+    engine = settings_dict['ENGINE']
+    if engine.endswith('sqlite3'):
+        return
+    host = settings_dict.get('HOST') or ''
+    if engine.endswith(('postgresql', 'postgis')) and (host in LOCAL_HOSTS or host.startswith('/')):
+        return
+    raise ValueError('Load tests only run against SQLite or a local PostgreSQL, not {} on {!r}.'.format(engine, host))
+
+
+def check_local_url(url):
+    """
+    Ensures the target URL points to a server on this machine.
+
+    Args:
+        url (str): The base URL of the server.
+
+    Raises:
+        ValueError: If the URL is not an http URL of a local host.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != 'http' or parts.hostname not in LOCAL_HOSTS:
+        raise ValueError('Load tests only target http://localhost or http://127.0.0.1, not {}.'.format(url))
+
+
+def synthetic_pdf(texto, size=0) -> bytes:
+    """
+    Builds a valid one page PDF, padded with a comment up to the given size.
+
+    Args:
+        texto (str): The ASCII text shown on the page.
+        size (int): The minimum size of the document in bytes.
+
+    Returns:
+        bytes: The PDF document.
+    """
+    contenido = 'BT /F1 12 Tf 72 720 Td ({}) Tj ET'.format(texto.replace('(', '').replace(')', ''))
+    objetos = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R '
+        '/Resources << /Font << /F1 5 0 R >> >> >>',
+        '<< /Length {} >>\nstream\n{}\nendstream'.format(len(contenido), contenido),
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    pdf = b'%PDF-1.4\n'
+    offsets = []
+    for numero, objeto in enumerate(objetos, 1):
+        offsets.append(len(pdf))
+        pdf += '{} 0 obj\n{}\nendobj\n'.format(numero, objeto).encode('ascii')
+    relleno = size - len(pdf) - 200
+    if relleno > 0:
+        pdf += b'%' + b'0' * (relleno - 2) + b'\n'
+    xref = len(pdf)
+    pdf += 'xref\n0 {}\n0000000000 65535 f \n'.format(len(objetos) + 1).encode('ascii')
+    for offset in offsets:
+        pdf += '{:010d} 00000 n \n'.format(offset).encode('ascii')
+    pdf += 'trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n'.format(len(objetos) + 1, xref).encode('ascii')
+    return pdf
+
+
+def random_curp(rng) -> str:
+    """
+    Generates a random CURP accepted by the signup view and the becario form.
+
+    Args:
+        rng (random.Random): The random number generator.
+
+    Returns:
+        str: A randomly generated CURP.
+    """
+    letras = string.ascii_uppercase
+    consonantes = 'BCDFGHJKLMNPQRSTVWXYZ'
+    return ''.join([
+        rng.choice(consonantes), rng.choice('AEIOU'), rng.choice(letras), rng.choice(letras),
+        '{:02d}{:02d}{:02d}'.format(rng.randint(0, 99), rng.randint(1, 12), rng.randint(1, 28)),
+        rng.choice('HM'), rng.choice(ESTADOS_CURP),
+        rng.choice(consonantes), rng.choice(consonantes), rng.choice(consonantes),
+        rng.choice(letras + string.digits), str(rng.randint(0, 9)),
+    ])
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of the values.
+
+    Args:
+        values (list): The sorted values.
+        percent (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The value below which the given percent of the values fall.
+    """
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+def encode_multipart(fields, files):
+    """
+    Encodes a form as multipart/form-data.
+
+    Args:
+        fields (dict): The form fields.
+        files (dict): The uploaded files as {field: (filename, content)}.
+
+    Returns:
+        tuple: The request body and its content type.
+    """
+    boundary = uuid.uuid4().hex
+    partes = []
+    for name, value in fields.items():
+        partes.append('--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'.format(
+            boundary, name, value).encode('utf-8'))
+    for name, (filename, content) in files.items():
+        partes.append('--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\n'
+                      'Content-Type: application/pdf\r\n\r\n'.format(boundary, name, filename).encode('utf-8'))
+        partes.append(content + b'\r\n')
+    partes.append('--{}--\r\n'.format(boundary).encode('ascii'))
+    return b''.join(partes), 'multipart/form-data; boundary={}'.format(boundary)
+
+
+def select_options(body, name):
+    """
+    Returns the values of the options of a select rendered in a page.
+
+    Args:
+        body (str): The HTML of the page.
+        name (str): The name of the select.
+
+    Returns:
+        list: The non-empty option values.
+    """
+    select = re.search(r'<select name="{}"[^>]*>(.*?)</select>'.format(re.escape(name)), body, re.S)
+    if select is None:
+        return []
+    return [value for value in re.findall(r'<option value="([^"]*)"', select.group(1)) if value]
+
+
+class Recorder:
+    """
+    Collects the latency of every request, thread-safe.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tiempos = {}
+        self.errores = {}
+
+    def record(self, endpoint, ms, ok):
+        with self.lock:
+            self.tiempos.setdefault(endpoint, []).append(ms)
+            if not ok:
+                self.errores[endpoint] = self.errores.get(endpoint, 0) + 1
+
+    def report(self, duracion) -> dict:
+        """
+        Summarizes the recorded requests.
+
+        Args:
+            duracion (float): The wall time of the run in seconds.
+
+        Returns:
+            dict: The statistics of every endpoint, keyed by 'METHOD name'.
+        """
+        endpoints = {}
+        for endpoint, tiempos in sorted(self.tiempos.items()):
+            tiempos = sorted(tiempos)
+            endpoints[endpoint] = {
+                'count': len(tiempos),
+                'errors': self.errores.get(endpoint, 0),
+                'mean_ms': round(sum(tiempos) / len(tiempos), 2),
+                'p50_ms': round(percentile(tiempos, 50), 2),
+                'p95_ms': round(percentile(tiempos, 95), 2),
+                'p99_ms': round(percentile(tiempos, 99), 2),
+                'max_ms': round(tiempos[-1], 2),
+                'throughput_rps': round(len(tiempos) / duracion, 2) if duracion else None,
+            }
+        return endpoints
+
+
+class Session:
+    """
+    An HTTP client with its own cookies, like one browser of a user.
+
+    Every request is timed and recorded under the given endpoint name. Form
+    posts include the CSRF token of the session cookie.
+    """
+
+    def __init__(self, base_url, recorder, timeout=60):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.recorder = recorder
+        self.timeout = timeout
+        self.cookies = {}
+
+    def request(self, endpoint, method, path, body=None, content_type=None, expect=(200,)) -> Response:
+        """
+        Sends a request without following redirects.
+
+        Args:
+            endpoint (str): The name the request is recorded under.
+            method (str): The HTTP method.
+            path (str): The path of the URL.
+            body (bytes): The request body.
+            content_type (str): The content type of the body.
+            expect (tuple): The accepted status codes.
+
+        Returns:
+            Response: The status, headers and decoded body.
+
+        Raises:
+            JourneyError: If the status is not one of the expected ones.
+        """
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join('{}={}'.format(key, value) for key, value in self.cookies.items())
+        if content_type:
+            headers['Content-Type'] = content_type
+        conexion = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        start = time.perf_counter()
+        try:
+            conexion.request(method, path, body=body, headers=headers)
+            respuesta = conexion.getresponse()
+            contenido = respuesta.read()
+        except OSError as e:
+            self.recorder.record('{} {}'.format(method, endpoint), (time.perf_counter() - start) * 1000, False)
+            raise JourneyError('{} {}: {}'.format(method, path, e))
+        finally:
+            conexion.close()
+        ok = respuesta.status in expect
+        self.recorder.record('{} {}'.format(method, endpoint), (time.perf_counter() - start) * 1000, ok)
+
+        for header in respuesta.headers.get_all('Set-Cookie') or []:
+            cookie = http.cookies.SimpleCookie()
+            cookie.load(header)
+            for key, morsel in cookie.items():
+                if morsel['max-age'] == '0' or not morsel.value:
+                    self.cookies.pop(key, None)
+                else:
+                    self.cookies[key] = morsel.value
+        if not ok:
+            raise JourneyError('{} {} returned {}'.format(method, path, respuesta.status))
+        return Response(respuesta.status, respuesta.headers, contenido.decode('utf-8', errors='replace'))
+
+    def get(self, endpoint, path, expect=(200,)) -> Response:
+        return self.request(endpoint, 'GET', path, expect=expect)
+
+    def post(self, endpoint, path, fields, files=None, expect=(302,)) -> Response:
+        """
+        Posts a form, as multipart/form-data when it has files.
+        """
+        fields = dict(fields, csrfmiddlewaretoken=self.cookies.get('csrftoken', ''))
+        if files:
+            body, content_type = encode_multipart(fields, files)
+        else:
+            body, content_type = urlencode(fields).encode('utf-8'), 'application/x-www-form-urlencoded'
+        return self.request(endpoint, 'POST', path, body, content_type, expect)
+
+
+class LoadContext:
+    """
+    The shared state of a load run, passed to every journey.
+
+    Attributes:
+        catalogs (dict): The primary keys of each catalog, keyed by field name.
+        cuentas (list): The (username, password) of the ready, approved accounts.
+        pdf_size (int): The size in bytes of the uploaded PDFs.
+        sink (SMTPSink): The SMTP server receiving the activation emails.
+        email_timeout (float): Seconds to wait for an activation email.
+    """
+
+    def __init__(self, catalogs, cuentas, pdf_size, sink, email_timeout):
+        self.catalogs = catalogs
+        self.cuentas = cuentas
+        self.pdf_size = pdf_size
+        self.sink = sink
+        self.email_timeout = email_timeout
+        self.lock = threading.Lock()
+        self.curps = set()
+
+    def new_curp(self, rng) -> str:
+        """
+        Returns a random CURP not used before in this run.
+        """
+        with self.lock:
+            while True:
+                curp = random_curp(rng)
+                if curp not in self.curps:
+                    self.curps.add(curp)
+                    return curp
+
+    def pdf(self, texto) -> tuple:
+        """
+        Returns an upload of a synthetic PDF as (filename, content).
+        """
+        return '{}.pdf'.format(texto.lower()), synthetic_pdf(texto, self.pdf_size)
+
+    def activation_path(self, correo) -> str:
+        """
+        Waits for the activation email of an address and returns its link.
+
+        Args:
+            correo (str): The address the email is sent to.
+
+        Returns:
+            str: The path of the activation link.
+
+        Raises:
+            JourneyError: If no email arrives before the timeout.
+        """
+        limite = time.monotonic() + self.email_timeout
+        while time.monotonic() < limite:
+            with self.sink.lock:
+                mensajes = [mensaje for _, destinatarios, mensaje in self.sink.messages if correo in destinatarios]
+            for mensaje in mensajes:
+                link = re.search(r'https?://[^/\s]+(/activate/[^/\s]+/[^/\s]+/)', mensaje.get_payload(decode=True).decode())
+                if link:
+                    return link.group(1)
+            time.sleep(0.05)
+        raise JourneyError('No activation email for {}'.format(correo))
+
+    def approve(self, username):
+        """
+        Approves a worker like a staff member would, notification included.
+        """
+        from becas_sntsa.models import Trabajador
+
+        try:
+            trabajador = Trabajador.objects.get(usuario__username=username)
+            trabajador.aprobado = True
+            trabajador.save()
+        finally:
+            connection.close()
+
+
+def seed_accounts(numero, password, rng, pdf_size) -> list:
+    """
+    Creates approved workers with one scholar each, for the journeys of
+    returning users.
+
+    Args:
+        numero (int): The number of accounts.
+        password (str): The password of every account.
+        rng (random.Random): The random number generator.
+        pdf_size (int): The size in bytes of the stored PDFs.
+
+    Returns:
+        list: The (username, password) of the accounts.
+    """
+    from django.contrib.auth.hashers import make_password
+    from django.core.files.base import ContentFile
+    from becas_sntsa.models import User, Trabajador, Becario, Seccion, Puesto, Jurisdiccion, LugarAdscripcion
+
+    # Hash once, every account shares the password
+    hashed = make_password(password)
+    catalogs = {
+        'seccion': Seccion.objects.first(),
+        'puesto': Puesto.objects.first(),
+        'jurisdiccion': Jurisdiccion.objects.first(),
+        'lugar_adscripcion': LugarAdscripcion.objects.first(),
+    }
+    cuentas = []
+    for _ in range(numero):
+        curp = random_curp(rng)
+        while User.objects.filter(username=curp).exists():
+            curp = random_curp(rng)
+        user = User.objects.create(username=curp, password=hashed, email='{}@example.com'.format(curp.lower()))
+        Trabajador.objects.create(
+            usuario=user, nombre='Carga', apellido_paterno='Trabajador', telefono='5512345678',
+            correo=user.email, aprobado=True,
+            talon_pago_archivo=ContentFile(synthetic_pdf(curp, pdf_size), name='{}.pdf'.format(curp.lower())),
+            **catalogs
+        )
+        Becario.objects.create(
+            trabajador=user, nombre='Carga', apellido_paterno='Becario', curp=random_curp(rng),
+            curp_archivo=ContentFile(synthetic_pdf(curp, pdf_size), name='{}.pdf'.format(curp.lower())),
+            acta_nacimiento=ContentFile(synthetic_pdf(curp, pdf_size), name='{}.pdf'.format(curp.lower())),
+        )
+        cuentas.append((curp, password))
+    return cuentas
+
+
+def solicitar(session, context, rng):
+    """
+    Opens the form of a random type of solicitud and submits it for one of the
+    scholars of the session user.
+    """
+    tipo = rng.choice(['aprovechamiento', 'excelencia', 'especial'])
+    endpoint = 'create_solicitud_{}'.format(tipo)
+    path = '/becas/{}/'.format(endpoint)
+    becarios = select_options(session.get(endpoint, path).body, 'becario')
+    if not becarios:
+        raise JourneyError('No becarios to apply for')
+    fields = {'becario': rng.choice(becarios)}
+    files = {'recibo_nomina': context.pdf('RECIBO'), 'ine': context.pdf('INE')}
+    if tipo == 'especial':
+        fields.update(diagnostico_medico='Carga', tipo_educacion='Carga')
+        files.update(certificado_medico=context.pdf('MEDICO'), certificado_escolar=context.pdf('ESCOLAR'))
+    else:
+        fields.update(grado=rng.choice(context.catalogs['grado']), promedio='{:.1f}'.format(rng.uniform(8, 10)))
+        files['boleta'] = context.pdf('BOLETA')
+        if tipo == 'excelencia':
+            fields['carrera'] = 'Carga'
+    # A becario with a pending solicitud of the same type gets the form back
+    session.post(endpoint, path, fields, files, expect=(200, 302))
+
+
+def signin(session, context, rng):
+    """
+    Signs in with one of the ready accounts, returning its username.
+    """
+    username, password = rng.choice(context.cuentas)
+    session.get('signin', '/signin/')
+    session.post('signin', '/signin/', {'username': username, 'password': password})
+    return username
+
+
+@journey('alta')
+def journey_alta(session, context, rng):
+    """
+    A new worker signs up, registers, activates the account, waits for the
+    approval, registers a scholar and applies for a scholarship.
+    """
+    curp = context.new_curp(rng)
+    password = 'Carga-{}'.format(curp)
+    correo = '{}@example.com'.format(curp.lower())
+    session.get('signup', '/signup/')
+    session.post('signup', '/signup/', {'username': curp, 'password1': password, 'password2': password})
+    session.get('create_trabajador', '/becas/create_trabajador/')
+    session.post('create_trabajador', '/becas/create_trabajador/', {
+        'nombre': 'Carga', 'apellido_paterno': 'Trabajador', 'apellido_materno': 'Alta',
+        'telefono': '55{:08d}'.format(rng.randrange(10 ** 8)), 'correo': correo,
+        'seccion': rng.choice(context.catalogs['seccion']),
+        'puesto': rng.choice(context.catalogs['puesto']),
+        'jurisdiccion': rng.choice(context.catalogs['jurisdiccion']),
+        'lugar_adscripcion': rng.choice(context.catalogs['lugar_adscripcion']),
+    }, {'talon_pago_archivo': context.pdf('TALON')}, expect=(200,))
+    session.get('activate', context.activation_path(correo), expect=(302,))
+    context.approve(curp)
+    session.get('create_becario', '/becas/create_becario/')
+    session.post('create_becario', '/becas/create_becario/', {
+        'nombre': 'Carga', 'apellido_paterno': 'Becario', 'apellido_materno': 'Alta',
+        'curp': context.new_curp(rng),
+    }, {'curp_archivo': context.pdf('CURP'), 'acta_nacimiento': context.pdf('ACTA')})
+    solicitar(session, context, rng)
+    session.get('ver_solicitudes', '/becas/ver_solicitudes/')
+
+
+@journey('solicitud')
+def journey_solicitud(session, context, rng):
+    """
+    A returning worker signs in and applies for a scholarship.
+    """
+    signin(session, context, rng)
+    solicitar(session, context, rng)
+    session.get('ver_solicitudes', '/becas/ver_solicitudes/')
+
+
+@journey('consulta')
+def journey_consulta(session, context, rng):
+    """
+    A returning worker signs in, reviews their scholars and applications,
+    opens a scholar to download one of its documents and signs out.
+    """
+    signin(session, context, rng)
+    session.get('becas', '/becas/')
+    becarios = re.findall(r'href="(/becas/editar_becario/\d+/)"', session.get('ver_becarios', '/becas/ver_becarios/').body)
+    session.get('ver_solicitudes', '/becas/ver_solicitudes/')
+    if becarios:
+        archivo = re.search(r'href="(/media/[^"]+)"', session.get('editar_becario', rng.choice(becarios)).body)
+        if archivo:
+            session.get('download_file', archivo.group(1))
+    session.get('signout', '/signout/', expect=(302,))
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    """
+    Request handler that does not log every request to stderr.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """
+    A WSGI server handling each request in its own thread.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class InProcessServer:
+    """
+    Serves a WSGI application on an ephemeral local port in a background
+    thread, as a context manager. Each request is handled in a thread of its
+    own, or all of them in the serving thread when not threaded, so they
+    can reuse one database connection.
+
+    Attributes:
+        url (str): The base URL of the server.
+    """
+
+    def __init__(self, application, threaded=True):
+        server_class = ThreadingWSGIServer if threaded else WSGIServer
+        self.server = make_server('127.0.0.1', 0, application, server_class, QuietWSGIRequestHandler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+
+    def serve(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            # Without threads the requests share the connection of this thread
+            connections.close_all()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class InProcessASGIServer:
+    """
+    Serves an ASGI application with uvicorn on an ephemeral local port in a
+    background thread, as a context manager. Needs uvicorn.
+
+    Attributes:
+        url (str): The base URL of the server.
+    """
+
+    def __init__(self, application, timeout=30):
+        import uvicorn
+
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.url = 'http://127.0.0.1:{}'.format(port)
+        self.server = uvicorn.Server(uvicorn.Config(
+            application, host='127.0.0.1', port=port, lifespan='off', log_level='warning', access_log=False))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.timeout = timeout
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + self.timeout
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError('uvicorn did not start')
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *args):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+class GunicornServer:
+    """
+    Runs the app with gunicorn on an ephemeral local port, with one of the
+    profiles of gunicorn.conf.py, as a context manager. The server uses the
+    settings and the database of this process, with the environment
+    variables in env added.
+
+    Attributes:
+        url (str): The base URL of the server.
+    """
+
+    def __init__(self, profile, env=None, timeout=60):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+        self.url = 'http://127.0.0.1:{}'.format(self.port)
+        self.args = [
+            sys.executable, '-m', 'gunicorn',
+            '--config', os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'),
+            '--bind', '127.0.0.1:{}'.format(self.port),
+        ]
+        self.env = dict(os.environ, **(env or {}), GUNICORN_PROFILE=profile, URL=self.url)
+        self.timeout = timeout
+        self.process = None
+        self.log = None
+
+    def __enter__(self):
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(self.args, env=self.env, cwd=settings.BASE_DIR,
+                                        stdout=subprocess.DEVNULL, stderr=self.log)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if self.process.poll() is not None:
+                self.log.seek(0)
+                error = self.log.read().decode('utf-8', errors='replace').strip().splitlines()
+                self.log.close()
+                raise RuntimeError('gunicorn exited with status {}: {}'.format(
+                    self.process.returncode, error[-1] if error else ''))
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                if time.monotonic() > deadline:
+                    self.__exit__()
+                    raise RuntimeError('gunicorn did not start in {} seconds'.format(self.timeout))
+                time.sleep(0.2)
+
+    def __exit__(self, *args):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+
+class OutboxWorker(threading.Thread):
+    """
+    Delivers the queued emails to the given SMTP port until stopped, like the
+    send_outbox command does in production.
+    """
+
+    def __init__(self, port, interval=0.05):
+        super().__init__(daemon=True)
+        self.port = port
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        from django.core.mail import get_connection
+        from becas_sntsa.models import EmailOutbox
+
+        smtp = get_connection('django.core.mail.backends.smtp.EmailBackend', host='127.0.0.1', port=self.port,
+                              username='', password='', use_tls=False, use_ssl=False)
+        try:
+            while not self.stopped.is_set():
+                batch = EmailOutbox.objects.claim()
+                if batch:
+                    EmailOutbox.objects.deliver(batch, smtp)
+                else:
+                    smtp.close()
+                    self.stopped.wait(self.interval)
+        finally:
+            smtp.close()
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_load(base_url, context, plan, concurrency) -> dict:
+    """
+    Runs the planned journeys with the given number of concurrent users.
+
+    Args:
+        base_url (str): The base URL of the server.
+        context (LoadContext): The shared state of the run.
+        plan (list): The (journey name, random.Random) of every journey, in order.
+        concurrency (int): The number of journeys run at the same time.
+
+    Returns:
+        dict: The report of the run.
+    """
+    recorder = Recorder()
+    pendientes = list(reversed(plan))
+    resultados = {name: {'completed': 0, 'failed': 0} for name, _ in plan}
+    errores = []
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    if not pendientes:
+                        return
+                    name, rng = pendientes.pop()
+                try:
+                    JOURNEYS[name](Session(base_url, recorder), context, rng)
+                    estado = 'completed'
+                except JourneyError as e:
+                    estado = 'failed'
+                    with lock:
+                        errores.append('{}: {}'.format(name, e))
+                with lock:
+                    resultados[name][estado] += 1
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracion = time.perf_counter() - start
+
+    endpoints = recorder.report(duracion)
+    total = sum(stats['count'] for stats in endpoints.values())
+    return {
+        'url': base_url,
+        'concurrency': concurrency,
+        'duration_s': round(duracion, 2),
+        'requests': total,
+        'throughput_rps': round(total / duracion, 2) if duracion else None,
+        'journeys': resultados,
+        'errors': errores[:20],
+        'endpoints': endpoints,
+    }
@@ -0,0 +1,31 @@
+"""
+A Django management command to rebuild the file ownership index.
+"""
+from django.core.management.base import BaseCommand
+from becas_sntsa.models import MediaFile
+
+
+class Command(BaseCommand):
+    """
+    A Django management command to rebuild the MediaFile index from the rows
+    that reference uploaded files.
+    """
+    help = 'Rebuild the file ownership index used to authorize downloads'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of index entries inserted per query (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        total = MediaFile.objects.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} files.'))
@@ -0,0 +1,222 @@
+"""
+A Django management command to load test the app with simulated users.
+"""
+import json
+import os
+import random
+import tempfile
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from becas_sntsa.load import JOURNEYS, LoadContext, GunicornServer, InProcessServer, OutboxWorker, check_local_database, check_local_url, run_load, seed_accounts
+from becas_sntsa.models import Seccion, Puesto, Jurisdiccion, LugarAdscripcion, Grado
+from becas_sntsa.smtp_sink import SMTPSink
+
+
+def parse_mix(value):
+    """
+    Parses journey weights given as name=weight pairs separated by commas.
+    """
+    mix = {}
+    for pair in value.split(','):
+        name, _, weight = pair.partition('=')
+        if name not in JOURNEYS:
+            raise ValueError(name)
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Command(BaseCommand):
+    """
+    A Django management command that replays weighted user journeys over HTTP
+    with concurrent users and reports the latency percentiles and throughput
+    of every endpoint as JSON.
+
+    By default the app is served in-process by a threaded WSGI server over a
+    throwaway test database. With --profile it starts gunicorn with each
+    given profile of gunicorn.conf.py in turn, over this project's database,
+    to compare them. With --url it targets a local server (gunicorn) that
+    shares this project's database and delivers its emails to the SMTP sink
+    opened by the command.
+    """
+    help = 'Load test the app with concurrent simulated users and report latency per endpoint'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        parser.add_argument(
+            '--url',
+            help='Base URL of a local server to target instead of serving the app in-process'
+        )
+        parser.add_argument(
+            '--profile',
+            action='append',
+            help='Start gunicorn with this profile of gunicorn.conf.py (gthread, sync, uvicorn) and target it, '
+                 'can be repeated to compare profiles'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Number of simulated users running journeys at the same time (default: 4)'
+        )
+        parser.add_argument(
+            '--journeys',
+            type=int,
+            default=40,
+            help='Total number of journeys to run (default: 40)'
+        )
+        parser.add_argument(
+            '--mix',
+            type=parse_mix,
+            default='alta=2,solicitud=3,consulta=5',
+            help='Journey weights as name=weight pairs (default: alta=2,solicitud=3,consulta=5). '
+                 'Available: {}'.format(', '.join(sorted(JOURNEYS)))
+        )
+        parser.add_argument(
+            '--accounts',
+            type=int,
+            default=20,
+            help='Approved accounts created for the journeys of returning users (default: 20)'
+        )
+        parser.add_argument(
+            '--pdf-kb',
+            type=int,
+            default=64,
+            help='Size in KB of the synthetic PDFs uploaded (default: 64)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Seed of the journey plan and the generated data (default: random)'
+        )
+        parser.add_argument(
+            '--smtp-port',
+            type=int,
+            default=1025,
+            help='Port of the local SMTP sink when targeting --url (default: 1025)'
+        )
+        parser.add_argument(
+            '--email-timeout',
+            type=float,
+            default=30,
+            help='Seconds to wait for an activation email (default: 30)'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the JSON report to this file instead of stdout'
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        if options['url'] and options['profile']:
+            raise CommandError('--url and --profile cannot be used together.')
+        try:
+            check_local_database(connection.settings_dict)
+            if options['url']:
+                check_local_url(options['url'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        rng = random.Random(options['seed'])
+        nombres = sorted(options['mix'])
+        pesos = [options['mix'][name] for name in nombres]
+        plan = [(name, random.Random(rng.getrandbits(64)))
+                for name in rng.choices(nombres, weights=pesos, k=options['journeys'])]
+
+        if options['url']:
+            with SMTPSink(port=options['smtp_port']) as sink:
+                report = self.run(options['url'], sink, plan, rng, options)
+            report['mode'] = 'url'
+        elif options['profile']:
+            report = {'mode': 'gunicorn', 'profiles': {}}
+            for profile in options['profile']:
+                report['profiles'][profile] = self.run_gunicorn(profile, plan, rng, options)
+        else:
+            report = self.run_in_process(plan, rng, options)
+            report['mode'] = 'in-process'
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as archivo:
+                archivo.write(output + '\n')
+            self.stderr.write('Report written to {}'.format(options['output']))
+        else:
+            self.stdout.write(output)
+
+    def run(self, url, sink, plan, rng, options) -> dict:
+        """
+        Creates the accounts of returning users and runs the journeys.
+        """
+        catalogs = {
+            'seccion': list(Seccion.objects.values_list('pk', flat=True)),
+            'puesto': list(Puesto.objects.values_list('pk', flat=True)),
+            'jurisdiccion': list(Jurisdiccion.objects.values_list('pk', flat=True)),
+            'lugar_adscripcion': list(LugarAdscripcion.objects.values_list('pk', flat=True)),
+            'grado': list(Grado.objects.values_list('pk', flat=True)),
+        }
+        if not all(catalogs.values()):
+            raise CommandError('The catalogs are empty, load them with: python manage.py loaddata initial_data.json')
+        pdf_size = options['pdf_kb'] * 1024
+        cuentas = []
+        if any(name != 'alta' for name, _ in plan):
+            cuentas = seed_accounts(options['accounts'], 'Carga-{}'.format(rng.getrandbits(32)), rng, pdf_size)
+        context = LoadContext(catalogs, cuentas, pdf_size, sink, options['email_timeout'])
+        return run_load(url, context, plan, options['concurrency'])
+
+    def run_gunicorn(self, profile, plan, rng, options) -> dict:
+        """
+        Starts gunicorn with a profile over this project's database and runs
+        the journeys against it, delivering the outbox to an in-process SMTP
+        sink.
+        """
+        try:
+            # The approvals are notified from this process, the activations from gunicorn
+            remitente = settings.DEFAULT_FROM_EMAIL or 'becas@localhost'
+            with override_settings(DEFAULT_FROM_EMAIL=remitente), SMTPSink(port=options['smtp_port']) as sink, \
+                    GunicornServer(profile, {'DEFAULT_FROM_EMAIL': remitente}) as server:
+                worker = OutboxWorker(sink.port)
+                worker.start()
+                try:
+                    return self.run(server.url, sink, plan, rng, options)
+                finally:
+                    worker.stop()
+        except RuntimeError as e:
+            raise CommandError('Profile {}: {}'.format(profile, e))
+
+    def run_in_process(self, plan, rng, options) -> dict:
+        """
+        Serves the app in-process over a throwaway test database and runs the
+        journeys against it, delivering the outbox to an in-process SMTP sink.
+        """
+        setup_test_environment(debug=False)
+        with tempfile.TemporaryDirectory() as directorio:
+            if connection.vendor == 'sqlite':
+                # A file database, the in-memory one cannot be shared by the
+                # server threads, with write transactions taking the lock
+                # upfront instead of failing to upgrade it under concurrency
+                connection.settings_dict['TEST']['NAME'] = os.path.join(directorio, 'bench_load.sqlite3')
+                connection.settings_dict['OPTIONS'].setdefault('transaction_mode', 'IMMEDIATE')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                call_command('loaddata', 'initial_data.json', verbosity=0)
+                media_root = os.path.join(directorio, 'media')
+                with override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['127.0.0.1', 'localhost'],
+                                       DEFAULT_FROM_EMAIL=settings.DEFAULT_FROM_EMAIL or 'becas@localhost'), \
+                        SMTPSink() as sink, InProcessServer(WSGIHandler()) as server:
+                    worker = OutboxWorker(sink.port)
+                    worker.start()
+                    try:
+                        return self.run(server.url, sink, plan, rng, options)
+                    finally:
+                        worker.stop()
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
@@ -0,0 +1,68 @@
+"""
+A Django management command to run the benchmark scenarios of the app.
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from becas_sntsa.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    """
+    A Django management command to run benchmark scenarios against a
+    throwaway test database.
+    """
+    help = 'Run benchmark scenarios against a throwaway test database'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        parser.add_argument(
+            'scenarios',
+            nargs='*',
+            help='Scenarios to run (default: all). Available: {}'.format(', '.join(sorted(SCENARIOS)))
+        )
+        parser.add_argument(
+            '--sizes',
+            type=lambda value: [int(size) for size in value.split(',')],
+            default=[1, 10, 100],
+            help='Comma separated dataset sizes used by the scenarios (default: 1,10,100)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of repetitions averaged per measurement (default: 5)'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the results as JSON'
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        names = options['scenarios'] or sorted(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError('Unknown scenarios: {}'.format(', '.join(unknown)))
+
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = {name: SCENARIOS[name](options) for name in names}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, rows in results.items():
+            self.stdout.write(self.style.SUCCESS(name))
+            for row in rows:
+                self.stdout.write('  ' + '  '.join('{}={}'.format(key, value) for key, value in row.items()))
@@ -0,0 +1,73 @@
+"""
+A Django management command to prepare the database and the static files on startup.
+"""
+import time
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from becas_sntsa.bootstrap import PHASES, get_fingerprint, get_stored, store
+
+
+class Command(BaseCommand):
+    """
+    A Django management command that runs makemigrations, migrate, loaddata
+    and collectstatic, skipping every phase whose inputs did not change since
+    it last ran, and reports how long each phase took.
+    """
+    help = 'Run makemigrations, migrate, loaddata and collectstatic, skipping the phases that are up to date'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        parser.add_argument(
+            '--fixture',
+            default='initial_data.json',
+            help='Fixture loaded by the loaddata phase (default: initial_data.json)'
+        )
+        parser.add_argument(
+            '--skip',
+            action='append',
+            default=[],
+            choices=PHASES,
+            help='Do not run this phase, can be repeated'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Run every phase, even the ones that are up to date'
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        verbosity = max(options['verbosity'] - 1, 0)
+        commands = {
+            'makemigrations': lambda: call_command('makemigrations', verbosity=verbosity),
+            'migrate': lambda: call_command('migrate', interactive=False, verbosity=verbosity),
+            'loaddata': lambda: call_command('loaddata', options['fixture'], verbosity=verbosity),
+            'collectstatic': lambda: call_command('collectstatic', interactive=False, verbosity=verbosity),
+        }
+        # Fingerprints of database phases that ran before the table to store them existed
+        pendientes = []
+        total = time.perf_counter()
+        for fase in PHASES:
+            if fase in options['skip']:
+                self.stdout.write(f'{fase:<15} disabled')
+                continue
+            start = time.perf_counter()
+            huella = get_fingerprint(fase, options['fixture'])
+            check = time.perf_counter() - start
+            if not options['force'] and huella == get_stored(fase):
+                self.stdout.write(f'{fase:<15} skipped   fingerprint {check:6.2f}s')
+                continue
+
+            start = time.perf_counter()
+            commands[fase]()
+            if fase == 'makemigrations':
+                # It may have written new migrations
+                huella = get_fingerprint(fase)
+            pendientes = [pendiente for pendiente in pendientes + [(fase, huella)] if not store(*pendiente)]
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'{fase:<15} ran       fingerprint {check:6.2f}s   run {elapsed:6.2f}s')
+        self.stdout.write(self.style.SUCCESS(f'Bootstrap done in {time.perf_counter() - total:.2f}s.'))
@@ -0,0 +1,116 @@
+"""
+A Django management command to build the demo database snapshot.
+"""
+import os
+import shutil
+import time
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models
+from django.test import override_settings
+from becas_sntsa.load import synthetic_pdf
+from becas_sntsa.models import MEDIA_OWNER_LOOKUPS
+
+# Credentials of the demo superuser
+ADMIN_USERNAME = 'admin'
+ADMIN_EMAIL = 'admin@example.com'
+ADMIN_PASSWORD = 'admin'
+
+
+def add_synthetic_media(pdf_size) -> int:
+    """
+    Uploads a synthetic PDF to every empty file field of the workers,
+    scholars and applications, and indexes them.
+
+    Args:
+        pdf_size (int): The size of every document in bytes.
+
+    Returns:
+        int: The number of files written.
+    """
+    total = 0
+    for model in MEDIA_OWNER_LOOKUPS:
+        campos = [field.name for field in model._meta.concrete_fields if isinstance(field, models.FileField)]
+        for instance in model.objects.all():
+            vacios = [campo for campo in campos if not getattr(instance, campo)]
+            for campo in vacios:
+                texto = '{} {} {}'.format(model._meta.verbose_name, instance.pk, campo)
+                getattr(instance, campo).save('{}.pdf'.format(campo), ContentFile(synthetic_pdf(texto, pdf_size)),
+                                              save=False)
+            if vacios:
+                instance.save(update_fields=vacios)
+                total += len(vacios)
+    return total
+
+
+class Command(BaseCommand):
+    """
+    A Django management command that builds a ready demo database, with the
+    catalogs, the superuser and test users with their documents, so the
+    container can start in demo mode by copying it instead of migrating and
+    generating the data on every boot. It is run when the image is built.
+    """
+    help = 'Build the demo SQLite database and media files in a directory'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        parser.add_argument(
+            'output',
+            help='Directory to write db.sqlite3 and media/ to, replacing them'
+        )
+        parser.add_argument(
+            '--num_users',
+            type=int,
+            default=10,
+            help='Number of users (trabajadores) to create (default: 10)'
+        )
+        parser.add_argument(
+            '--pdf-kb',
+            type=int,
+            default=16,
+            help='Size in KB of the synthetic documents (default: 16)'
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        if connection.vendor != 'sqlite':
+            raise CommandError('The demo snapshot is a SQLite database, run the command with DEMO=True.')
+        path = os.path.join(options['output'], 'db.sqlite3')
+        media_root = os.path.join(options['output'], 'media')
+        os.makedirs(options['output'], exist_ok=True)
+        for anterior in (path, path + '-journal'):
+            if os.path.exists(anterior):
+                os.remove(anterior)
+        shutil.rmtree(media_root, ignore_errors=True)
+
+        # Build the snapshot instead of the project's database
+        connection.close()
+        connection.settings_dict['NAME'] = path
+        verbosity = max(options['verbosity'] - 1, 0)
+        total = time.perf_counter()
+        with override_settings(MEDIA_ROOT=media_root):
+            start = time.perf_counter()
+            call_command('bootstrap', skip=['makemigrations', 'collectstatic'], verbosity=verbosity, stdout=self.stdout)
+            self.stdout.write(f'{"database":<15} {time.perf_counter() - start:6.2f}s')
+
+            start = time.perf_counter()
+            User.objects.create_superuser(ADMIN_USERNAME, ADMIN_EMAIL, ADMIN_PASSWORD)
+            call_command('generate_users', num_users=options['num_users'], stdout=self.stdout)
+            self.stdout.write(f'{"users":<15} {time.perf_counter() - start:6.2f}s')
+
+            start = time.perf_counter()
+            archivos = add_synthetic_media(options['pdf_kb'] * 1024)
+            self.stdout.write(f'{"media":<15} {time.perf_counter() - start:6.2f}s')
+
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+        connection.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'Demo snapshot written to {options["output"]} in {time.perf_counter() - total:.2f}s: '
+            f'{options["num_users"]} users, {archivos} files.'))
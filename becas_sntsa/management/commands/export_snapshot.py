@@ -0,0 +1,60 @@
+"""
+A Django management command to write a columnar snapshot of the data.
+"""
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from becas_sntsa.snapshot import BATCH_SIZE, FORMATS, TABLES, require_pyarrow, write_table
+
+
+class Command(BaseCommand):
+    """
+    A Django management command that writes the trabajadores, becarios and
+    solicitudes tables to Parquet or Arrow IPC files for analysis, with the
+    catalogs as dictionary-encoded columns and the sex and birth date derived
+    from the CURPs. Needs pyarrow.
+    """
+    help = 'Write the trabajadores, becarios and solicitudes to Parquet or Arrow files'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        parser.add_argument(
+            'directory',
+            help='Directory where one file per table is written'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default='parquet',
+            help='File format (default: parquet)'
+        )
+        parser.add_argument(
+            '--table',
+            action='append',
+            choices=TABLES,
+            help='Only write this table, can be repeated (default: all)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Rows read and written per batch (default: {})'.format(BATCH_SIZE)
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        try:
+            require_pyarrow()
+        except ImportError as e:
+            raise CommandError(e)
+        os.makedirs(options['directory'], exist_ok=True)
+        for name in options['table'] or TABLES:
+            start = time.perf_counter()
+            path = os.path.join(options['directory'], '{}.{}'.format(name, options['format']))
+            total = write_table(name, path, options['format'], options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{total} {name} written to {path} in {time.perf_counter() - start:.2f}s.'))
@@ -0,0 +1,90 @@
+"""
+A Django management command to export the applications to a spreadsheet.
+"""
+import sys
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from becas_sntsa.exports import CHUNK_SIZE, FORMATS, export_queryset, export_rows, stream_export
+from becas_sntsa.ganadores import TIPOS
+from becas_sntsa.models import Solicitud
+
+
+class Command(BaseCommand):
+    """
+    A Django management command that writes the applications matching the
+    given filters as CSV or XLSX, streaming them from a chunked query like
+    the export page of the admin.
+    """
+    help = 'Export the solicitudes with their becario, trabajador, grado and promedio as CSV or XLSX'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        parser.add_argument(
+            'output',
+            help='File to write, or - for the standard output'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Format of the file (default: from the extension of the output, else csv)'
+        )
+        parser.add_argument(
+            '--estado',
+            choices=[estado for estado, _ in Solicitud.ESTADO_CHOICES],
+            help='Only export the solicitudes in this estado'
+        )
+        parser.add_argument(
+            '--tipo',
+            action='append',
+            choices=sorted(TIPOS),
+            help='Only export solicitudes of this type, can be repeated (default: all)'
+        )
+        parser.add_argument(
+            '--desde',
+            type=date.fromisoformat,
+            help='Only export solicitudes made on or after this date (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--hasta',
+            type=date.fromisoformat,
+            help='Only export solicitudes made on or before this date (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Rows fetched from the database per round trip (default: {})'.format(CHUNK_SIZE)
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        formato = options['format'] or ('xlsx' if options['output'].endswith('.xlsx') else 'csv')
+        if options['desde'] and options['hasta'] and options['desde'] > options['hasta']:
+            raise CommandError('--desde must not be later than --hasta.')
+
+        start = time.perf_counter()
+        total = 0
+
+        def counted(rows):
+            nonlocal total
+            for row in rows:
+                total += 1
+                yield row
+
+        queryset = export_queryset(options['estado'], options['tipo'], options['desde'], options['hasta'])
+        chunks = stream_export(formato, counted(export_rows(queryset, options['chunk_size'])))
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            with open(options['output'], 'wb') as archivo:
+                for chunk in chunks:
+                    archivo.write(chunk)
+        self.stderr.write(self.style.SUCCESS(
+            f'{total} solicitudes exported as {formato} in {time.perf_counter() - start:.2f}s.'))
@@ -2,12 +2,30 @@
 A Django management command to generate users, scholars, and applications for testing purposes.
 """
 from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import partial
+import django
 import random
+import time
 from faker import Faker
-from becas_sntsa.models import User, Trabajador, Becario, Solicitud, Seccion, Puesto, Jurisdiccion, LugarAdscripcion, Grado, SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial
+from becas_sntsa.models import User, Trabajador, Becario, Solicitud, Seccion, Puesto, Jurisdiccion, LugarAdscripcion, Grado, SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial, ConteoSolicitud
 
+# Workers generated per shard in bulk mode, fixed so that the data only
+# depends on the seed and not on the number of processes
+SHARD_SIZE = 100
 
-def generate_curp(nombre, apellido_paterno, apellido_materno):
+# Range of the application dates in bulk mode, fixed to keep runs reproducible
+FECHA_INICIO = date(2015, 1, 1)
+FECHA_FIN = date(2025, 12, 31)
+
+_faker = None
+
+
+def generate_curp(nombre, apellido_paterno, apellido_materno, rng=random):
     """
     Generates a random Mexican CURP.
 
@@ -15,6 +33,8 @@ def generate_curp(nombre, apellido_paterno, apellido_materno):
         nombre (str): The first name.
         apellido_paterno (str): The paternal last name.
         apellido_materno (str): The maternal last name.
+        rng (random.Random): The random number generator (default: the
+                             global one of the random module).
 
     Returns:
         str: A randomly generated CURP.
@@ -32,27 +52,27 @@ def generate_curp(nombre, apellido_paterno, apellido_materno):
     # First letter of the first name
     curp += nombre[0].upper()
     # Random two last digits of year of birth
-    year = random.randint(0, 99)
+    year = rng.randint(0, 99)
     curp += str(year).zfill(2)
     # Month of birth
-    month = random.randint(1, 12)
+    month = rng.randint(1, 12)
     curp += str(month).zfill(2)
     # Day of birth
-    day = random.randint(1, 31)
+    day = rng.randint(1, 31)
     curp += str(day).zfill(2)
     # Random sex
-    curp += random.choice(["H", "M"])
+    curp += rng.choice(["H", "M"])
     # Random state
     letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
     for _ in range(2):
-        curp += random.choice(letters)
+        curp += rng.choice(letters)
     # Random consonants
     consonants = "BCDFGHJKLMNPQRSTVWXYZ"
     for _ in range(3):
-        curp += random.choice(consonants)
+        curp += rng.choice(consonants)
     # Two random digits
     for _ in range(2):
-        curp += str(random.randint(0, 9))
+        curp += str(rng.randint(0, 9))
 
     return curp
 
@@ -226,6 +246,270 @@ def create_solicitud(becario: Becario) -> Solicitud:
     return solicitud
 
 
+def load_catalogs() -> dict:
+    """
+    Loads the primary keys of the catalog tables once, for the bulk mode, in
+    a fixed order so the same --seed picks the same rows.
+
+    Returns:
+        dict: The primary keys of each catalog, keyed by field name.
+    """
+    return {
+        'seccion': list(Seccion.objects.order_by('pk').values_list('pk', flat=True)),
+        'puesto': list(Puesto.objects.order_by('pk').values_list('pk', flat=True)),
+        'jurisdiccion': list(Jurisdiccion.objects.order_by('pk').values_list('pk', flat=True)),
+        'lugar_adscripcion': list(LugarAdscripcion.objects.order_by('pk').values_list('pk', flat=True)),
+        'grado': list(Grado.objects.order_by('pk').values_list('pk', flat=True)),
+    }
+
+
+def build_trabajador(fake, rng, catalogs, options) -> dict:
+    """
+    Generates the data of a worker with their scholars and applications,
+    without touching the database.
+
+    Args:
+        fake (Faker): The shared Faker instance.
+        rng (random.Random): The random number generator.
+        catalogs (dict): The catalog primary keys returned by load_catalogs.
+        options (dict): The ranges of becarios and solicitudes, keyed like
+                        the command options.
+
+    Returns:
+        dict: The field values of the worker, under 'trabajador', and of their
+              scholars, under 'becarios', each with its 'solicitudes' as
+              (model, parent fields, child fields) tuples.
+    """
+    nombre = fake.first_name()
+    apellido_paterno = fake.last_name()
+    apellido_materno = fake.last_name()
+    trabajador = {
+        'nombre': nombre,
+        'apellido_paterno': apellido_paterno,
+        'apellido_materno': apellido_materno,
+        'telefono': str(rng.randint(1000000000, 9999999999)),
+        'correo': fake.email(),
+        'curp': generate_curp(nombre, apellido_paterno, apellido_materno, rng),
+        'seccion_id': rng.choice(catalogs['seccion']),
+        'puesto_id': rng.choice(catalogs['puesto']),
+        'jurisdiccion_id': rng.choice(catalogs['jurisdiccion']),
+        'lugar_adscripcion_id': rng.choice(catalogs['lugar_adscripcion']),
+        'aprobado': rng.choice([True, False]),
+    }
+
+    estados = [estado for estado, _ in Solicitud.ESTADO_CHOICES]
+    becarios = []
+    for _ in range(rng.randint(options['min_becarios'], options['max_becarios'])):
+        nombre = fake.first_name()
+        apellido_paterno = fake.last_name()
+        apellido_materno = fake.last_name()
+        solicitudes = []
+        # Only one solicitud per becario can wait for results
+        en_espera = False
+        for _ in range(rng.randint(options['min_solicitudes'], options['max_solicitudes'])):
+            estado = rng.choice(estados)
+            if estado == 'P':
+                estado = 'F' if en_espera else 'P'
+                en_espera = True
+            parent = {
+                'fecha_solicitud': fake.date_between_dates(FECHA_INICIO, FECHA_FIN),
+                'estado': estado,
+                'notas': fake.text(max_nb_chars=200) if estado == 'E' else '',
+            }
+            model = rng.choice([SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial])
+            if model is SolicitudEspecial:
+                child = {
+                    'diagnostico_medico': fake.text(max_nb_chars=128),
+                    'tipo_educacion': fake.text(max_nb_chars=128),
+                }
+            else:
+                child = {
+                    'grado_id': rng.choice(catalogs['grado']),
+                    'promedio': float(rng.randint(70, 100)) / 10,
+                }
+                if model is SolicitudExcelencia:
+                    child['carrera'] = fake.text(max_nb_chars=128)
+            solicitudes.append((model, parent, child))
+        becarios.append({
+            'nombre': nombre,
+            'apellido_paterno': apellido_paterno,
+            'apellido_materno': apellido_materno,
+            'curp': generate_curp(nombre, apellido_paterno, apellido_materno, rng),
+            'solicitudes': solicitudes,
+        })
+    trabajador['becarios'] = becarios
+    return trabajador
+
+
+def generate_shard(catalogs, options, seed, shard, size) -> list:
+    """
+    Generates the workers of one shard from a seed derived from the run seed
+    and the shard number.
+
+    Args:
+        catalogs (dict): The catalog primary keys returned by load_catalogs.
+        options (dict): The ranges of becarios and solicitudes.
+        seed (int): The seed of the run.
+        shard (int): The number of the shard.
+        size (int): The number of workers of the shard.
+
+    Returns:
+        list: The workers generated by build_trabajador.
+    """
+    global _faker
+    if _faker is None:
+        # Building a Faker is slow, each process reseeds its own
+        _faker = Faker('es_MX')
+    rng = random.Random('{}:{}'.format(seed, shard))
+    _faker.seed_instance(rng.getrandbits(64))
+    return [build_trabajador(_faker, rng, catalogs, options) for _ in range(size)]
+
+
+def generate_trabajadores(catalogs, options, seed, num_users, workers=1):
+    """
+    Generates workers in fixed-size shards, in a pool of processes when
+    workers is greater than one, yielding them in shard order.
+
+    The output only depends on the seed, whatever the number of workers.
+
+    Args:
+        catalogs (dict): The catalog primary keys returned by load_catalogs.
+        options (dict): The ranges of becarios and solicitudes.
+        seed (int): The seed of the run.
+        num_users (int): The number of workers to generate.
+        workers (int): The number of processes.
+
+    Yields:
+        dict: The workers generated by build_trabajador.
+    """
+    shards = range(0, -(-num_users // SHARD_SIZE))
+    sizes = [min(SHARD_SIZE, num_users - shard * SHARD_SIZE) for shard in shards]
+    generate = partial(generate_shard, catalogs, options, seed)
+    if workers <= 1:
+        for shard, size in zip(shards, sizes):
+            yield from generate(shard, size)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        for trabajadores in pool.map(generate, shards, sizes):
+            yield from trabajadores
+
+
+def bulk_insert_children(model, objs):
+    """
+    Inserts the child rows of a multi-table inheritance model whose parent
+    rows already exist.
+
+    bulk_create refuses multi-table inheritance models, so the rows are
+    inserted with a plain multi-row INSERT built with connection.ops.
+
+    Args:
+        model (type): The child model.
+        objs (list): The child instances, with the parent link set.
+    """
+    fields = model._meta.local_concrete_fields
+    columnas = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    # As many rows per INSERT as the database accepts, like bulk_create
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    with connection.cursor() as cursor:
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            sql = 'INSERT INTO {} ({}) {}'.format(
+                connection.ops.quote_name(model._meta.db_table), columnas,
+                connection.ops.bulk_insert_sql(fields, [['%s'] * len(fields)] * len(batch)))
+            cursor.execute(sql, [field.get_db_prep_save(field.pre_save(obj, True), connection)
+                                 for obj in batch for field in fields])
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = connection.alias
+
+
+class BulkWriter:
+    """
+    Buffers generated workers and inserts them with bulk_create, one batch of
+    workers per transaction.
+
+    Every user shares the same password hash, computed once.
+
+    Attributes:
+        counts (dict): The number of rows inserted per model name.
+    """
+
+    def __init__(self, password, batch_size):
+        self.password = make_password(password)
+        self.batch_size = batch_size
+        self.buffer = []
+        self.usernames = set()
+        self.counts = {'users': 0, 'trabajadores': 0, 'becarios': 0, 'solicitudes': 0}
+
+    @property
+    def rows(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, trabajador):
+        """
+        Buffers a worker generated by build_trabajador, flushing full batches.
+        """
+        self.buffer.append(trabajador)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Inserts the buffered workers with their scholars and applications.
+        """
+        if not self.buffer:
+            return
+        buffer, self.buffer = self.buffer, []
+
+        # CURPs are random, skip the ones already taken
+        curps = {trabajador['curp'] for trabajador in buffer}
+        taken = set(User.objects.filter(username__in=curps).values_list('username', flat=True))
+        datos = []
+        for trabajador in buffer:
+            if trabajador['curp'] in taken or trabajador['curp'] in self.usernames:
+                continue
+            self.usernames.add(trabajador['curp'])
+            datos.append(trabajador)
+
+        with transaction.atomic():
+            users = User.objects.bulk_create(
+                [User(username=trabajador['curp'], password=self.password) for trabajador in datos])
+
+            trabajadores, becarios = [], []
+            conteos = Counter()
+            for user, trabajador in zip(users, datos):
+                campos = {key: value for key, value in trabajador.items() if key not in ('curp', 'becarios')}
+                trabajadores.append(Trabajador(usuario=user, **campos))
+                for becario in trabajador['becarios']:
+                    instance = Becario(trabajador_id=user.pk, **{
+                        key: value for key, value in becario.items() if key != 'solicitudes'})
+                    # bulk_create does not call save()
+                    instance.set_claves_nombre()
+                    becarios.append((instance, becario['solicitudes']))
+                    for model, parent, child in becario['solicitudes']:
+                        tipo = model._meta.model_name.removeprefix('solicitud')
+                        conteos[parent['estado'], tipo, trabajador['jurisdiccion_id'], child.get('grado_id')] += 1
+            Trabajador.objects.bulk_create(trabajadores)
+            Becario.objects.bulk_create([becario for becario, _ in becarios])
+
+            # Parents first, then the child rows pointing to them
+            solicitudes = [(model, Solicitud(becario_id=becario.pk, **parent), child)
+                           for becario, lista in becarios for model, parent, child in lista]
+            Solicitud.objects.bulk_create([parent for _, parent, _ in solicitudes])
+            hijos = {}
+            for model, parent, child in solicitudes:
+                hijos.setdefault(model, []).append(model(solicitud_ptr_id=parent.pk, **child))
+            for model, objs in hijos.items():
+                bulk_insert_children(model, objs)
+            # Raw inserts skip Solicitud.save(), count them here
+            ConteoSolicitud.objects.sumar(conteos)
+
+        self.counts['users'] += len(users)
+        self.counts['trabajadores'] += len(trabajadores)
+        self.counts['becarios'] += len(becarios)
+        self.counts['solicitudes'] += len(solicitudes)
+
+
 class Command(BaseCommand):
     """
     A Django management command to generate test data.
@@ -266,6 +550,33 @@ class Command(BaseCommand):
             default=5,
             help='Maximum number of solicitudes per becario (default: 5)'
         )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Insert the rows with bulk_create in batches, for large datasets'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of users inserted per batch in bulk mode (default: 500)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes generating the data, implies --bulk (default: 1)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Seed of the bulk mode, the same seed gives the same data for any --workers (default: random)'
+        )
+        parser.add_argument(
+            '--password',
+            default='becas-sntsa',
+            help='Password of every user in bulk mode, where it is hashed once (default: becas-sntsa)'
+        )
 
     def handle(self, *args, **options):
         """
@@ -284,6 +595,10 @@ class Command(BaseCommand):
             )
         )
 
+        if options['bulk'] or options['workers'] > 1:
+            self.generate_bulk(options)
+            return
+
         for i in range(num_users):
             trabajador = create_trabajador()
             # Create from min_becarios to max_becarios Becarios for each Trabajador
@@ -303,3 +618,34 @@ class Command(BaseCommand):
             self.style.SUCCESS(
                 f'Successfully created {num_users} users with their becarios and solicitudes!')
         )
+
+    def generate_bulk(self, options):
+        """
+        Generates the data in seeded shards, across processes with --workers,
+        with cached catalogs, and inserts it in order from this process in
+        batches, reporting the insertion rate.
+        """
+        catalogs = load_catalogs()
+        if not all(catalogs.values()):
+            self.stderr.write(self.style.ERROR(
+                'The catalogs are empty, load them with: python manage.py loaddata initial_data.json'))
+            return
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        self.stdout.write(f'Seed: {seed}')
+        rangos = {key: options[key] for key in ('min_becarios', 'max_becarios', 'min_solicitudes', 'max_solicitudes')}
+
+        writer = BulkWriter(options['password'], options['batch_size'])
+        start = time.perf_counter()
+        trabajadores = generate_trabajadores(catalogs, rangos, seed, options['num_users'], options['workers'])
+        for i, trabajador in enumerate(trabajadores):
+            writer.add(trabajador)
+            if (i + 1) % options['batch_size'] == 0:
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'Created {i + 1}/{options["num_users"]} users ({writer.rows / elapsed:.0f} rows/s)...')
+        writer.flush()
+
+        elapsed = time.perf_counter() - start
+        counts = writer.counts
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully created {counts["users"]} users, {counts["becarios"]} becarios and '
+            f'{counts["solicitudes"]} solicitudes in {elapsed:.1f}s ({writer.rows / elapsed:.0f} rows/s).'))
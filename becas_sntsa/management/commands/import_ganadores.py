@@ -0,0 +1,79 @@
+"""
+A Django management command to import the winners of a results list.
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from becas_sntsa.ganadores import TIPOS, extract_lines, parse_ganadores, plan_import
+
+
+class Command(BaseCommand):
+    """
+    A Django management command that reads a results list (PDF) and updates
+    the estado of every application waiting for results.
+
+    Applications listed in the file become 'T' (Beca otorgada) and the rest
+    of the pending applications of the given types become 'F' (Beca no
+    otorgada).
+    """
+    help = 'Import the winners of a results list and update the pending solicitudes'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        parser.add_argument(
+            'archivo',
+            help='Path of the results list (PDF or plain text)'
+        )
+        parser.add_argument(
+            '--tipo',
+            action='append',
+            choices=sorted(TIPOS),
+            required=True,
+            help='Application type covered by the list, can be repeated'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the changes without applying them'
+        )
+        parser.add_argument(
+            '--no-notificar',
+            action='store_true',
+            help='Do not email the workers about the new estado'
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        start = time.perf_counter()
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                plan = plan_import(parse_ganadores(extract_lines(archivo)), options['tipo'])
+        except OSError as e:
+            raise CommandError(f'Could not read {options["archivo"]}: {e}')
+
+        if options['verbosity'] > 1:
+            for transicion in plan.ganadores:
+                self.stdout.write(f'+ T {transicion.curp} {transicion.nombre} ({transicion.tipo})')
+            for transicion in plan.no_ganadores:
+                self.stdout.write(f'- F {transicion.curp} {transicion.nombre} ({transicion.tipo})')
+        for ganador, transicion in plan.por_nombre:
+            self.stdout.write(self.style.NOTICE(
+                f'~ Por nombre: "{ganador.nombre}" -> {transicion.curp} {transicion.nombre} ({transicion.tipo})'))
+        for ganador in plan.no_encontrados:
+            self.stdout.write(self.style.WARNING(
+                f'? Sin solicitud en espera: {ganador.curp} {ganador.nombre}'))
+
+        self.stdout.write(
+            f'{len(plan.ganadores)} ganadores, {len(plan.no_ganadores)} no ganadores, '
+            f'{len(plan.no_encontrados)} no encontrados ({len(plan.por_nombre)} por nombre).'
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run, no changes were applied.'))
+            return
+
+        plan.apply(notificar=not options['no_notificar'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Import applied in {time.perf_counter() - start:.2f}s.'))
@@ -0,0 +1,39 @@
+"""
+A Django management command to rebuild the application counters.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from becas_sntsa.models import ConteoSolicitud
+
+
+class Command(BaseCommand):
+    """
+    A Django management command to rebuild the ConteoSolicitud counters from
+    the applications, for when they drift (e.g. after loading a fixture or
+    editing the database by hand).
+    """
+    help = 'Rebuild the counters of solicitudes per estado, tipo, jurisdiccion and grado'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report the counters that drifted, failing if there are any'
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        diferencias = ConteoSolicitud.objects.diferencias()
+        for clave, guardado, actual in diferencias:
+            self.stdout.write(f'{clave}: {guardado} counted, {actual} actual')
+        if options['check']:
+            if diferencias:
+                raise CommandError(f'{len(diferencias)} counters drifted.')
+            self.stdout.write(self.style.SUCCESS('The counters are up to date.'))
+            return
+        total = ConteoSolicitud.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} counters, {len(diferencias)} had drifted.'))
@@ -0,0 +1,73 @@
+"""
+A Django management command to deliver the queued emails.
+"""
+import smtplib
+import time
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from becas_sntsa.models import EmailOutbox
+
+
+class Command(BaseCommand):
+    """
+    A Django management command that sends the emails of the EmailOutbox
+    queue in batches over a single SMTP connection.
+
+    Several workers can run at the same time, each batch is claimed with
+    SELECT ... FOR UPDATE SKIP LOCKED. Failed emails are retried with
+    exponential backoff.
+    """
+    help = 'Send the queued emails, in a loop or once with --once'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of emails claimed and sent per batch (default: 100)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to wait when the queue is empty (default: 5)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Send the emails that are due and exit'
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        connection = get_connection()
+        enviados = fallidos = 0
+        try:
+            while True:
+                batch = EmailOutbox.objects.claim(options['batch_size'])
+                if not batch:
+                    # Do not keep an idle connection open while waiting
+                    connection.close()
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                try:
+                    connection.open()
+                except (smtplib.SMTPException, OSError) as e:
+                    self.stderr.write(f'Could not connect to the SMTP server: {e}')
+                batch_enviados, batch_fallidos = EmailOutbox.objects.deliver(batch, connection)
+                enviados += batch_enviados
+                fallidos += batch_fallidos
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{batch_enviados} sent, {batch_fallidos} failed.')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+        self.stdout.write(self.style.SUCCESS(f'{enviados} emails sent, {fallidos} failed.'))
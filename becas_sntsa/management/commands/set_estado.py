@@ -0,0 +1,85 @@
+"""
+A Django management command to change the estado of applications in bulk.
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from django.db.models import Q
+from becas_sntsa.ganadores import TIPOS
+from becas_sntsa.models import Solicitud
+
+
+class Command(BaseCommand):
+    """
+    A Django management command that changes the estado of the applications
+    matching the given filters with bulk updates, the command line equivalent
+    of the estado actions of the admin.
+    """
+    help = 'Change the estado of the matching solicitudes and notify the workers'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        estados = [estado for estado, _ in Solicitud.ESTADO_CHOICES]
+        parser.add_argument(
+            'estado',
+            choices=estados,
+            help='New estado of the solicitudes'
+        )
+        parser.add_argument(
+            '--desde',
+            choices=estados,
+            help='Only change the solicitudes currently in this estado'
+        )
+        parser.add_argument(
+            '--tipo',
+            action='append',
+            choices=sorted(TIPOS),
+            help='Only change solicitudes of this type, can be repeated (default: all)'
+        )
+        parser.add_argument(
+            '--id',
+            action='append',
+            type=int,
+            dest='ids',
+            help='Only change the solicitud with this id, can be repeated'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many solicitudes would change'
+        )
+        parser.add_argument(
+            '--no-notificar',
+            action='store_true',
+            help='Do not email the workers about the new estado'
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        start = time.perf_counter()
+        queryset = Solicitud.objects.all()
+        if options['desde']:
+            queryset = queryset.filter(estado=options['desde'])
+        if options['tipo']:
+            tipos = Q()
+            for tipo in options['tipo']:
+                tipos |= Q(**{'{}__isnull'.format(TIPOS[tipo]._meta.model_name): False})
+            queryset = queryset.filter(tipos)
+        if options['ids']:
+            queryset = queryset.filter(pk__in=options['ids'])
+
+        if options['dry_run']:
+            total = queryset.exclude(estado=options['estado']).count()
+            self.stdout.write(self.style.WARNING(f'Dry run, {total} solicitudes would change.'))
+            return
+
+        try:
+            ids = queryset.cambiar_estado(options['estado'], notificar=not options['no_notificar'])
+        except IntegrityError as e:
+            raise CommandError(f'A becario cannot have more than one solicitud in estado P: {e}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(ids)} solicitudes changed to {options["estado"]} in {time.perf_counter() - start:.2f}s.'))
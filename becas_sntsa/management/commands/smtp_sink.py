@@ -0,0 +1,41 @@
+"""
+A Django management command to run a local SMTP sink.
+"""
+from django.core.management.base import BaseCommand
+from becas_sntsa.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    """
+    A Django management command that runs an SMTP server which accepts every
+    message and prints a summary of it, to try the email outbox locally with
+    EMAIL_HOST=127.0.0.1, EMAIL_PORT=<port> and EMAIL_USE_TLS=False.
+    """
+    help = 'Run a local SMTP server that accepts and prints every message'
+
+    def add_arguments(self, parser):
+        """
+        Adds command-line arguments to the command.
+        """
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=1025,
+            help='Port to listen on (default: 1025)'
+        )
+
+    def handle(self, *args, **options):
+        """
+        The main logic of the command.
+        """
+        with SMTPSink(port=options['port']) as sink:
+            self.stdout.write(self.style.SUCCESS(f'SMTP sink listening on 127.0.0.1:{sink.port}'))
+            recibidos = 0
+            try:
+                while True:
+                    sink.thread.join(1)
+                    for remitente, destinatarios, mensaje in sink.messages[recibidos:]:
+                        self.stdout.write(f'{remitente} -> {", ".join(destinatarios)}: {mensaje["Subject"]}')
+                    recibidos = len(sink.messages)
+            except KeyboardInterrupt:
+                pass
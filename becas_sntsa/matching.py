@@ -0,0 +1,209 @@
+"""
+Approximate name matching for the becas_sntsa app.
+
+The results lists identify the winners by name, which is often written
+without accents, with the surnames first or with small typos. This module
+normalizes names, derives order-insensitive phonetic keys and trigrams from
+them and provides NameMatcher, an in-memory index that resolves a name to the
+best candidate without scanning every entry.
+"""
+import re
+import unicodedata
+
+NON_LETTERS_REGEX = re.compile(r'[^A-Z ]+')
+
+# Ordered spelling rules that map Spanish letters with the same sound to one
+# symbol, applied to each word of the name
+PHONETIC_RULES = [
+    (re.compile(r'CH'), '#'),
+    (re.compile(r'LL'), 'Y'),
+    (re.compile(r'QU'), 'K'),
+    (re.compile(r'GU(?=[EI])'), 'G'),
+    (re.compile(r'G(?=[EI])'), 'J'),
+    (re.compile(r'C(?=[EI])'), 'S'),
+    (re.compile(r'[CQ]'), 'K'),
+    (re.compile(r'Z'), 'S'),
+    (re.compile(r'V'), 'B'),
+    (re.compile(r'W'), 'U'),
+    (re.compile(r'X'), 'J'),
+    (re.compile(r'H'), ''),
+    (re.compile(r'Y(?![AEIOU])'), 'I'),
+    (re.compile(r'(.)\1+'), r'\1'),
+]
+
+
+def normalize_name(*partes) -> str:
+    """
+    Normalizes a name for comparisons: accents removed, uppercase, only
+    letters and single spaces.
+
+    Args:
+        *partes (str): The parts of the name, e.g. nombre and apellidos. Empty
+                       or None parts are ignored.
+
+    Returns:
+        str: The normalized name.
+    """
+    texto = ' '.join(parte for parte in partes if parte)
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = ''.join(letra for letra in texto if not unicodedata.combining(letra))
+    return ' '.join(NON_LETTERS_REGEX.sub(' ', texto.upper()).split())
+
+
+def phonetic_key(nombre_normalizado) -> str:
+    """
+    Builds an order-insensitive phonetic key of a normalized name.
+
+    Names that sound the same in Spanish (e.g. 'JIMENEZ' and 'XIMENES') and
+    names with their words in a different order share the same key.
+
+    Args:
+        nombre_normalizado (str): A name returned by normalize_name.
+
+    Returns:
+        str: The phonetic key.
+    """
+    palabras = []
+    for palabra in nombre_normalizado.split():
+        for regex, reemplazo in PHONETIC_RULES:
+            palabra = regex.sub(reemplazo, palabra)
+        if palabra:
+            palabras.append(palabra)
+    return ' '.join(sorted(palabras))
+
+
+def trigrams(nombre_normalizado) -> frozenset:
+    """
+    Returns the trigrams of the words of a normalized name.
+
+    Args:
+        nombre_normalizado (str): A name returned by normalize_name.
+
+    Returns:
+        frozenset: The trigrams of every word, padded with spaces.
+    """
+    grams = set()
+    for palabra in nombre_normalizado.split():
+        palabra = '  {} '.format(palabra)
+        grams.update(palabra[i:i + 3] for i in range(len(palabra) - 2))
+    return frozenset(grams)
+
+
+def similarity(grams_a, grams_b) -> float:
+    """
+    Returns the Jaccard similarity of two trigram sets.
+    """
+    if not grams_a or not grams_b:
+        return 0.0
+    comunes = len(grams_a & grams_b)
+    return comunes / (len(grams_a) + len(grams_b) - comunes)
+
+
+class NameMatcher:
+    """
+    In-memory index that resolves a name to the most similar entry.
+
+    Entries are looked up by exact normalized name, then by phonetic key and
+    finally through the rarest trigrams of the name, so each lookup only
+    scores a handful of candidates. When several candidates are equally
+    similar, the one with the highest promedio wins.
+
+    Attributes:
+        min_similarity (float): The minimum trigram similarity to accept a
+                                candidate found through its trigrams.
+        rare_trigrams (int): The number of rarest trigrams of the name used to
+                             gather candidates when no key matches.
+    """
+
+    def __init__(self, min_similarity=0.6, rare_trigrams=4):
+        self.min_similarity = min_similarity
+        self.rare_trigrams = rare_trigrams
+        self.entries = []
+        self.exact = {}
+        self.phonetic = {}
+        self.postings = {}
+
+    def add(self, payload, nombre, promedio=None, nombre_normalizado=None, clave_fonetica=None):
+        """
+        Adds an entry to the index.
+
+        Args:
+            payload (object): The value returned when the entry matches.
+            nombre (str): The name of the entry.
+            promedio (float, optional): The average used to break ties.
+            nombre_normalizado (str, optional): The precomputed normalized name.
+            clave_fonetica (str, optional): The precomputed phonetic key.
+        """
+        nombre_normalizado = nombre_normalizado or normalize_name(nombre)
+        clave_fonetica = clave_fonetica or phonetic_key(nombre_normalizado)
+        grams = trigrams(nombre_normalizado)
+        index = len(self.entries)
+        self.entries.append((payload, grams, promedio))
+        self.exact.setdefault(' '.join(sorted(nombre_normalizado.split())), []).append(index)
+        self.phonetic.setdefault(clave_fonetica, []).append(index)
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(index)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def rare_candidates(self, grams):
+        """
+        Gathers the entries that share one of the rarest trigrams of a name.
+
+        Args:
+            grams (frozenset): The trigrams of the name.
+
+        Returns:
+            set: The indexes of the candidates.
+        """
+        postings = sorted((self.postings[gram] for gram in grams if gram in self.postings), key=len)
+        indexes = set()
+        for posting in postings[:self.rare_trigrams]:
+            indexes.update(posting)
+        return indexes
+
+    def best(self, grams, indexes, min_similarity, exclude):
+        """
+        Scores the candidates and returns the payload of the best one.
+
+        Equally similar candidates are resolved by the highest promedio.
+        """
+        best = None
+        best_key = None
+        for index in indexes:
+            payload, entry_grams, promedio = self.entries[index]
+            if payload in exclude:
+                continue
+            score = similarity(grams, entry_grams)
+            if score < min_similarity:
+                continue
+            key = (round(score, 6), promedio if promedio is not None else -1)
+            if best_key is None or key > best_key:
+                best, best_key = payload, key
+        return best
+
+    def match(self, nombre, exclude=()):
+        """
+        Resolves a name to the best matching entry.
+
+        Candidates sharing the exact normalized name or the phonetic key are
+        accepted regardless of their similarity, the ones found through rare
+        trigrams need at least min_similarity.
+
+        Args:
+            nombre (str): The name to look up.
+            exclude (set, optional): Payloads that can no longer be matched.
+
+        Returns:
+            object or None: The payload of the best entry, None if no entry is
+                            similar enough.
+        """
+        nombre_normalizado = normalize_name(nombre)
+        grams = trigrams(nombre_normalizado)
+        best = self.best(grams, self.exact.get(' '.join(sorted(nombre_normalizado.split())), ()), 0.0, exclude)
+        if best is None:
+            best = self.best(grams, self.phonetic.get(phonetic_key(nombre_normalizado), ()), 0.0, exclude)
+        if best is None:
+            best = self.best(grams, self.rare_candidates(grams), self.min_similarity, exclude)
+        return best
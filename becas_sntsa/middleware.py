@@ -0,0 +1,87 @@
+"""
+Middleware for the becas_sntsa app.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.functional import SimpleLazyObject
+from becas_sntsa.models import Trabajador
+
+
+def get_trabajador(request):
+    """
+    Returns the 'Trabajador' profile of the user of a request.
+
+    Args:
+        request (HttpRequest): The request object.
+
+    Returns:
+        Trabajador: The profile, or None for anonymous users and users
+                    without one.
+    """
+    if not hasattr(request, '_cached_trabajador'):
+        trabajador = None
+        if request.user.is_authenticated:
+            try:
+                trabajador = request.user.trabajador
+            except Trabajador.DoesNotExist:
+                pass
+        request._cached_trabajador = trabajador
+    return request._cached_trabajador
+
+
+class TrabajadorMiddleware:
+    """
+    Sets request.trabajador to the profile of the user, loaded once per
+    request on first access. It evaluates as false for anonymous users and
+    users without a profile. Must come after AuthenticationMiddleware.
+
+    It runs in the mode of the handler, sync under WSGI and async under
+    ASGI, so it never adds a thread switch. Async views must not touch
+    request.trabajador, its first access queries the database.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.trabajador = SimpleLazyObject(lambda: get_trabajador(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.trabajador = SimpleLazyObject(lambda: get_trabajador(request))
+        return await self.get_response(request)
+
+
+class AsgiUrlconfMiddleware:
+    """
+    Routes the requests of the ASGI application to ASGI_URLCONF, whose
+    downloads and account activation are async views. The WSGI requests keep
+    ROOT_URLCONF and its sync views.
+
+    Like TrabajadorMiddleware, it runs in the mode of the handler.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if isinstance(request, ASGIRequest):
+            request.urlconf = settings.ASGI_URLCONF
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.urlconf = settings.ASGI_URLCONF
+        return await self.get_response(request)
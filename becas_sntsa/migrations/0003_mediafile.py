@@ -0,0 +1,58 @@
+# Generated by Django 5.2.13 on 2026-10-18 13:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+OWNER_LOOKUPS = {
+    'Trabajador': 'usuario_id',
+    'Becario': 'trabajador_id',
+    'SolicitudAprovechamiento': 'becario__trabajador_id',
+    'SolicitudExcelencia': 'becario__trabajador_id',
+    'SolicitudEspecial': 'becario__trabajador_id',
+}
+
+
+def backfill_media_files(apps, schema_editor):
+    """
+    Indexes the files uploaded before the MediaFile table existed.
+    """
+    MediaFile = apps.get_model('becas_sntsa', 'MediaFile')
+    for model_name, owner_lookup in OWNER_LOOKUPS.items():
+        model = apps.get_model('becas_sntsa', model_name)
+        file_fields = [field.name for field in model._meta.concrete_fields
+                       if isinstance(field, models.FileField)]
+        batch = []
+        for pk, usuario_id, *rutas in model.objects.values_list('pk', owner_lookup, *file_fields).iterator():
+            for tipo, ruta in zip(file_fields, rutas):
+                if ruta:
+                    batch.append(MediaFile(ruta=ruta, usuario_id=usuario_id, tipo=tipo,
+                                           modelo=model._meta.model_name, objeto_id=pk))
+        MediaFile.objects.bulk_create(batch, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('becas_sntsa', '0002_trabajador_pending_email'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ruta', models.CharField(max_length=255, unique=True)),
+                ('tipo', models.CharField(max_length=32)),
+                ('modelo', models.CharField(max_length=32)),
+                ('objeto_id', models.BigIntegerField()),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['modelo', 'objeto_id'], name='mediafile_objeto_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_media_files, migrations.RunPython.noop),
+    ]
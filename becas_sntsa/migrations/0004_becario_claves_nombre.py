@@ -0,0 +1,38 @@
+# Generated by Django 5.2.13 on 2026-10-18 13:58
+
+from django.db import migrations, models
+from becas_sntsa.matching import normalize_name, phonetic_key
+
+
+def set_claves_nombre(apps, schema_editor):
+    """
+    Computes the name search keys of the existing scholars.
+    """
+    Becario = apps.get_model('becas_sntsa', 'Becario')
+    becarios = list(Becario.objects.only('nombre', 'apellido_paterno', 'apellido_materno'))
+    for becario in becarios:
+        becario.nombre_normalizado = normalize_name(
+            becario.nombre, becario.apellido_paterno, becario.apellido_materno)
+        becario.clave_fonetica = phonetic_key(becario.nombre_normalizado)
+    Becario.objects.bulk_update(becarios, ['nombre_normalizado', 'clave_fonetica'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('becas_sntsa', '0003_mediafile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='becario',
+            name='clave_fonetica',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=400),
+        ),
+        migrations.AddField(
+            model_name='becario',
+            name='nombre_normalizado',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=400),
+        ),
+        migrations.RunPython(set_claves_nombre, migrations.RunPython.noop),
+    ]
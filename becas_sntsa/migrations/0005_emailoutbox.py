@@ -0,0 +1,33 @@
+# Generated by Django 5.2.13 on 2026-10-18 14:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('becas_sntsa', '0004_becario_claves_nombre'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asunto', models.CharField(max_length=255)),
+                ('cuerpo', models.TextField()),
+                ('remitente', models.CharField(blank=True, max_length=255)),
+                ('destinatarios', models.JSONField(default=list)),
+                ('estado', models.CharField(choices=[('P', 'Pendiente'), ('E', 'Enviado'), ('F', 'Fallido')], default='P', max_length=1)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('siguiente_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('enviado', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'siguiente_intento'], name='emailoutbox_pendiente_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.13 on 2026-10-18 14:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Coalesce
+
+
+def build_conteos(apps, schema_editor):
+    """
+    Counts the existing applications.
+    """
+    Solicitud = apps.get_model('becas_sntsa', 'Solicitud')
+    ConteoSolicitud = apps.get_model('becas_sntsa', 'ConteoSolicitud')
+    tipo = Case(
+        *[When(**{'solicitud{}__isnull'.format(tipo): False}, then=Value(tipo))
+          for tipo in ('aprovechamiento', 'excelencia', 'especial')],
+        default=Value(''),
+        output_field=models.CharField(),
+    )
+    rows = Solicitud.objects.order_by().values(
+        'estado',
+        tipo=tipo,
+        jurisdiccion_id=F('becario__trabajador__trabajador__jurisdiccion'),
+        grado_id=Coalesce('solicitudaprovechamiento__grado', 'solicitudexcelencia__grado'),
+    ).annotate(total=Count('pk'))
+    ConteoSolicitud.objects.bulk_create([
+        ConteoSolicitud(
+            clave=':'.join('' if row[campo] is None else str(row[campo])
+                           for campo in ('estado', 'tipo', 'jurisdiccion_id', 'grado_id')),
+            **row)
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('becas_sntsa', '0005_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoSolicitud',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('estado', models.CharField(choices=[('R', 'Solicitud recibida'), ('E', 'Error en documentos, revisar notas'), ('P', 'En espera de resultados'), ('T', 'Beca otorgada'), ('F', 'Beca no otorgada')], max_length=1)),
+                ('tipo', models.CharField(blank=True, max_length=32)),
+                ('total', models.IntegerField(default=0)),
+                ('grado', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='becas_sntsa.grado')),
+                ('jurisdiccion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='becas_sntsa.jurisdiccion')),
+            ],
+        ),
+        migrations.RunPython(build_conteos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.13 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('becas_sntsa', '0006_conteosolicitud'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BootstrapFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fase', models.CharField(max_length=32, unique=True)),
+                ('huella', models.CharField(max_length=64)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
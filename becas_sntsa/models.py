@@ -6,14 +6,19 @@ It includes models for workers, scholars, applications, and related data.
 """
 import logging
 import smtplib
+from collections import Counter
+from datetime import timedelta
 from urllib.parse import urlparse
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import Case, Count, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.query import ModelIterable
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 from django.conf import settings
+from becas_sntsa.matching import normalize_name, phonetic_key
 
 # Create your models here.
 
@@ -119,7 +124,103 @@ class Grado(models.Model):
         return "{} - {}".format(self.clave, self.nombre)
 
 
-class Trabajador(models.Model):
+class TrackedFieldsMixin:
+    """
+    Remembers the values of tracked_fields as loaded from the database, so
+    save() and the signal handlers can detect transitions without querying
+    the row again.
+
+    Attributes:
+        tracked_fields (tuple): The names of the fields to remember.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_tracked_fields()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self.snapshot_tracked_fields(fields)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.snapshot_tracked_fields(kwargs.get('update_fields'))
+
+    def get_tracked_value(self, field):
+        """
+        Returns the current value of a tracked field in the same form it is
+        loaded from the database (ids for relations, names for files).
+        """
+        value = self.__dict__[field.attname]
+        if isinstance(field, models.FileField):
+            return getattr(value, 'name', value) or ''
+        return value
+
+    def snapshot_tracked_fields(self, fields=None):
+        """
+        Records the current values of the loaded tracked fields as their
+        values in the database.
+
+        Args:
+            fields (iterable, optional): Only record these fields.
+        """
+        snapshot = self.__dict__.setdefault('_tracked_snapshot', {})
+        for name in self.tracked_fields:
+            field = self._meta.get_field(name)
+            if (fields is None or name in fields or field.attname in fields) and field.attname in self.__dict__:
+                snapshot[name] = self.get_tracked_value(field)
+
+    def get_initial_values(self) -> dict:
+        """
+        Returns the values of the tracked fields stored in the database.
+
+        Instances loaded from the database answer from their snapshot, the
+        row is only queried for instances built by hand with a primary key.
+
+        Returns:
+            dict: The stored values by field name, empty if the row does not
+                  exist yet.
+        """
+        if self.pk is None:
+            return {}
+        snapshot = self.__dict__.setdefault('_tracked_snapshot', {})
+        missing = [self._meta.get_field(name) for name in self.tracked_fields if name not in snapshot]
+        if missing:
+            row = type(self)._base_manager.filter(pk=self.pk).values(*[field.attname for field in missing]).first()
+            if row is None:
+                return {}
+            for field in missing:
+                value = row[field.attname]
+                snapshot[field.name] = value or '' if isinstance(field, models.FileField) else value
+        return snapshot
+
+    def has_changed(self, *names) -> bool:
+        """
+        Checks whether any of the given fields differs from the database.
+
+        Fields that are not tracked, and rows that do not exist yet, always
+        count as changed.
+
+        Args:
+            *names (str): The names of the fields to check.
+
+        Returns:
+            bool: True if any of the fields changed.
+        """
+        snapshot = self.__dict__.get('_tracked_snapshot', {})
+        for name in names:
+            if name not in snapshot:
+                return True
+            field = self._meta.get_field(name)
+            if field.attname in self.__dict__ and self.get_tracked_value(field) != snapshot[name]:
+                return True
+        return False
+
+
+class Trabajador(TrackedFieldsMixin, models.Model):
     """
     Represents a worker who can apply for scholarships for their children.
 
@@ -159,16 +260,22 @@ class Trabajador(models.Model):
     # Campo temporal para correo pendiente de verificación
     pending_email = models.EmailField(null=True, blank=True)
 
+    tracked_fields = ('aprobado', 'usuario', 'talon_pago_archivo', 'jurisdiccion')
+
     def save(self, *args, **kwargs):
-        send_approval = False
-        if self.pk:
-            try:
-                old = Trabajador.objects.get(pk=self.pk)
-                if not old.aprobado and self.aprobado:
-                    send_approval = True
-            except Trabajador.DoesNotExist:
-                pass
-        super().save(*args, **kwargs)
+        initial = self.get_initial_values()
+        send_approval = 'aprobado' in initial and not initial['aprobado'] and self.aprobado
+        if not initial or self.has_changed('jurisdiccion', 'usuario'):
+            # The counters of the applications of the worker's users move to
+            # the new jurisdiction, from none when the worker is new
+            usuarios = {self.usuario_id, initial.get('usuario')} - {None}
+            solicitudes = Solicitud.objects.filter(becario__trabajador__in=usuarios)
+            with transaction.atomic():
+                antes = solicitudes.conteos()
+                super().save(*args, **kwargs)
+                ConteoSolicitud.objects.aplicar(antes, solicitudes.conteos())
+        else:
+            super().save(*args, **kwargs)
         
         if send_approval:
             _parsed = urlparse(settings.URL)
@@ -180,17 +287,16 @@ class Trabajador(models.Model):
                 'domain': domain,
                 'scheme': scheme,
             })
-            def send_approval_email():
-                try:
-                    email = EmailMessage(subject, message, to=[self.correo])
-                    email.send()
-                except (smtplib.SMTPException, OSError):
-                    logger.exception(
-                        "No se pudo enviar correo de aprobación para trabajador_id=%s",
-                        self.pk
-                    )
-
-            transaction.on_commit(send_approval_email)
+            EmailOutbox.objects.enqueue(EmailMessage(subject, message, to=[self.correo]))
+
+    def get_propietario_id(self) -> int:
+        """
+        Returns the id of the user that owns the files of this worker.
+
+        Returns:
+            int: The id of the worker's user.
+        """
+        return self.usuario_id
 
     def __str__(self):
         """
@@ -202,7 +308,7 @@ class Trabajador(models.Model):
         return "{}".format(self.usuario.username)
 
 
-class Becario(models.Model):
+class Becario(TrackedFieldsMixin, models.Model):
     """
     Represents a scholar (a worker's child) who is the beneficiary of a scholarship.
 
@@ -214,6 +320,9 @@ class Becario(models.Model):
         curp (str): The scholar's CURP.
         curp_archivo (FileField): The scholar's CURP document.
         acta_nacimiento (FileField): The scholar's birth certificate.
+        nombre_normalizado (str): The full name without accents in uppercase,
+                                  used to match the results lists.
+        clave_fonetica (str): The phonetic key of the full name.
     """
     trabajador = models.ForeignKey(User, on_delete=models.CASCADE)
 
@@ -225,6 +334,35 @@ class Becario(models.Model):
 
     acta_nacimiento = models.FileField(upload_to='acta_nacimiento/')
 
+    # Claves de búsqueda por nombre, se calculan al guardar
+    nombre_normalizado = models.CharField(max_length=400, blank=True, db_index=True, editable=False)
+    clave_fonetica = models.CharField(max_length=400, blank=True, db_index=True, editable=False)
+
+    tracked_fields = ('trabajador', 'curp_archivo', 'acta_nacimiento')
+
+    def save(self, *args, **kwargs):
+        self.set_claves_nombre()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'nombre', 'apellido_paterno', 'apellido_materno'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'nombre_normalizado', 'clave_fonetica'}
+        if self.get_initial_values() and self.has_changed('trabajador'):
+            # The applications now count in the jurisdiction of the new worker
+            solicitudes = Solicitud.objects.filter(becario=self.pk)
+            with transaction.atomic():
+                antes = solicitudes.conteos()
+                super().save(*args, **kwargs)
+                ConteoSolicitud.objects.aplicar(antes, solicitudes.conteos())
+        else:
+            super().save(*args, **kwargs)
+
+    def set_claves_nombre(self):
+        """
+        Computes the normalized name and phonetic key from the name fields.
+        """
+        self.nombre_normalizado = normalize_name(
+            self.nombre, self.apellido_paterno, self.apellido_materno)
+        self.clave_fonetica = phonetic_key(self.nombre_normalizado)
+
     def __str__(self):
         """
         Returns a string representation of the scholar.
@@ -234,6 +372,15 @@ class Becario(models.Model):
         """
         return "{}".format(self.curp)
 
+    def get_propietario_id(self) -> int:
+        """
+        Returns the id of the user that owns the files of this scholar.
+
+        Returns:
+            int: The id of the worker's user.
+        """
+        return self.trabajador_id
+
     def get_sexo(self) -> str:
         """
         Extracts the sex of the scholar from their CURP.
@@ -263,7 +410,141 @@ class Becario(models.Model):
         return "{}-{}-{}".format(full_year, month, day)
 
 
-class Solicitud(models.Model):
+# Number of ids per query in bulk operations, below the parameter limit of
+# every backend
+UPDATE_BATCH_SIZE = 900
+
+
+class SolicitudSubclassIterable(ModelIterable):
+    """
+    Yields the rows of a select_subclasses() queryset as instances of their
+    concrete subclass, built from the joined subclass columns.
+    """
+
+    def __iter__(self):
+        queryset = self.queryset
+        links = queryset.get_subclass_links()
+        parent_fields = [field.attname for field in queryset.model._meta.concrete_fields]
+        parent_fields += list(queryset.query.annotation_select)
+        for obj in super().__iter__():
+            child = next((obj._state.fields_cache.get(link) for link in links
+                          if obj._state.fields_cache.get(link) is not None), None)
+            if child is None:
+                yield obj
+                continue
+            for attname in parent_fields:
+                if attname in obj.__dict__:
+                    child.__dict__.setdefault(attname, obj.__dict__[attname])
+            for name, value in obj._state.fields_cache.items():
+                if name not in links:
+                    child._state.fields_cache.setdefault(name, value)
+            child.snapshot_tracked_fields()
+            yield child
+
+
+class SolicitudQuerySet(models.QuerySet):
+    """
+    QuerySet of the applications, with polymorphic loading and bulk
+    operations that skip the per-instance save().
+    """
+
+    def get_subclass_links(self) -> list:
+        """
+        Returns the names of the one-to-one links from the model to its
+        multi-table subclasses.
+        """
+        return [relation.name for relation in self.model._meta.related_objects
+                if relation.one_to_one and relation.field.remote_field.parent_link]
+
+    def select_subclasses(self):
+        """
+        Returns the applications as instances of their concrete subclass
+        (SolicitudAprovechamiento, SolicitudExcelencia or SolicitudEspecial)
+        with their becario, all from one joined query.
+
+        Returns:
+            SolicitudQuerySet: The polymorphic queryset.
+        """
+        queryset = self.select_related('becario', *self.get_subclass_links())
+        queryset._iterable_class = SolicitudSubclassIterable
+        return queryset
+
+    def conteos(self) -> list:
+        """
+        Counts the applications of the queryset by the dimensions of
+        ConteoSolicitud, with one grouped query.
+
+        Returns:
+            list: Tuples of (estado, tipo, jurisdiccion_id, grado_id, total).
+        """
+        queryset = self if self.model is Solicitud else Solicitud.objects.filter(pk__in=self.values('pk'))
+        tipo = Case(
+            *[When(**{'{}__isnull'.format(link): False}, then=Value(link.removeprefix('solicitud')))
+              for link in queryset.get_subclass_links()],
+            default=Value(''),
+            output_field=models.CharField(),
+        )
+        rows = queryset.order_by().values(
+            'estado',
+            tipo=tipo,
+            jurisdiccion_id=models.F('becario__trabajador__trabajador__jurisdiccion'),
+            grado_id=Coalesce('solicitudaprovechamiento__grado', 'solicitudexcelencia__grado'),
+        ).annotate(total=Count('pk'))
+        return [(row['estado'], row['tipo'], row['jurisdiccion_id'], row['grado_id'], row['total'])
+                for row in rows]
+
+    def update(self, **kwargs) -> int:
+        """
+        Updates the rows of the queryset, moving their ConteoSolicitud
+        counters in the same transaction when the estado changes.
+
+        The rows are locked before they are counted, so a concurrent change
+        of their estado cannot slip between the count and the UPDATE, and
+        only the locked rows are updated, in batches of UPDATE_BATCH_SIZE
+        ids to stay under the query parameter limits.
+
+        Returns:
+            int: The number of updated rows.
+        """
+        if 'estado' not in kwargs:
+            return super().update(**kwargs)
+        filas = 0
+        antes = []
+        with transaction.atomic():
+            ids = list(self.select_for_update().values_list('pk', flat=True))
+            for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+                bloqueadas = self.filter(pk__in=ids[start:start + UPDATE_BATCH_SIZE])
+                antes += bloqueadas.conteos()
+                filas += super(SolicitudQuerySet, bloqueadas).update(**kwargs)
+            ConteoSolicitud.objects.aplicar(antes, [(kwargs['estado'], tipo, jurisdiccion_id, grado_id, total)
+                                                    for _, tipo, jurisdiccion_id, grado_id, total in antes])
+        return filas
+
+    def cambiar_estado(self, estado, notificar=True) -> list:
+        """
+        Changes the estado of every application of the queryset with one
+        UPDATE per batch of ids, and queues the notifications in bulk.
+
+        Applications that already have the estado are left untouched and
+        not notified.
+
+        Args:
+            estado (str): The new estado, a key of Solicitud.ESTADO_CHOICES.
+            notificar (bool): Whether to notify the workers of the new estado.
+
+        Returns:
+            list: The ids of the changed applications.
+        """
+        ids = list(self.exclude(estado=estado).values_list('pk', flat=True))
+        with transaction.atomic():
+            for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+                Solicitud.objects.filter(pk__in=ids[start:start + UPDATE_BATCH_SIZE]).update(estado=estado)
+            if notificar:
+                send_estado_notifications(ids)
+        return ids
+
+
+class Solicitud(TrackedFieldsMixin, models.Model):
     """
     Represents a scholarship application.
 
@@ -295,42 +576,95 @@ class Solicitud(models.Model):
         max_length=1, choices=ESTADO_CHOICES, default='P')
     notas = models.TextField(null=True, blank=True)
 
+    objects = SolicitudQuerySet.as_manager()
+
+    tracked_fields = ('estado', 'notas', 'becario', 'recibo_nomina', 'ine')
+    # Fields that decide the ConteoSolicitud counter of the application
+    conteo_fields = ('estado', 'becario')
+    # Name of the type shown to the workers
+    tipo_nombre = 'Solicitud'
+
     def save(self, *args, **kwargs):
-        send_status_update = False
-        if self.pk:
-            try:
-                old = Solicitud.objects.get(pk=self.pk)
-                if old.estado != self.estado or old.notas != self.notas:
-                    send_status_update = True
-            except Solicitud.DoesNotExist:
-                pass
-        super().save(*args, **kwargs)
+        initial = self.get_initial_values()
+        send_status_update = bool(initial) and (
+            initial['estado'] != self.estado or initial['notas'] != self.notas)
+        if initial and not self.has_changed(*self.conteo_fields):
+            super().save(*args, **kwargs)
+        elif type(self) is Solicitud:
+            # The type is only known from the subclass rows
+            with transaction.atomic():
+                antes = Solicitud.objects.filter(pk=self.pk).conteos() if initial else []
+                super().save(*args, **kwargs)
+                ConteoSolicitud.objects.aplicar(antes, Solicitud.objects.filter(pk=self.pk).conteos())
+        else:
+            # Before saving, which replaces the stored values with the current ones
+            deltas = self.get_conteo_deltas(initial)
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                ConteoSolicitud.objects.sumar(deltas)
 
         if send_status_update:
-            _parsed = urlparse(settings.URL)
-            domain = _parsed.netloc
-            scheme = _parsed.scheme
-            subject = 'Actualización en tu solicitud de beca - Becas SNTSA'
-            trabajador_obj = self.becario.trabajador.trabajador
-            message = render_to_string('estado_solicitud.html', {
-                'trabajador': trabajador_obj,
-                'becario': self.becario,
-                'solicitud': self,
-                'domain': domain,
-                'scheme': scheme,
-            })
+            EmailOutbox.objects.enqueue(self.build_estado_email())
+
+    def get_conteo_deltas(self, initial) -> Counter:
+        """
+        Returns the changes to the ConteoSolicitud counters of saving this
+        application, from its stored and current values, without reading
+        the application again.
 
-            def send_status_email():
-                try:
-                    email = EmailMessage(subject, message, to=[trabajador_obj.correo])
-                    email.send()
-                except (smtplib.SMTPException, OSError):
-                    logger.exception(
-                        "No se pudo enviar correo de estado para solicitud_id=%s",
-                        self.pk
-                    )
+        Args:
+            initial (dict): The stored values of the tracked fields, empty
+                            for a new application.
 
-            transaction.on_commit(send_status_email)
+        Returns:
+            Counter: +1 for the current counter and -1 for the stored one,
+                     keyed by (estado, tipo, jurisdiccion_id, grado_id).
+        """
+        tipo = self._meta.model_name.removeprefix('solicitud')
+        jurisdicciones = {}
+
+        def get_jurisdiccion(becario_id):
+            if becario_id not in jurisdicciones:
+                jurisdicciones[becario_id] = Trabajador.objects.filter(
+                    usuario__becario=becario_id).values_list('jurisdiccion_id', flat=True).first()
+            return jurisdicciones[becario_id]
+
+        deltas = Counter()
+        deltas[self.estado, tipo, get_jurisdiccion(self.becario_id), getattr(self, 'grado_id', None)] += 1
+        if initial:
+            deltas[initial['estado'], tipo, get_jurisdiccion(initial['becario']), initial.get('grado')] -= 1
+        return deltas
+
+    def build_estado_email(self) -> EmailMessage:
+        """
+        Builds the email that notifies the worker of the current estado and
+        notas of the application.
+
+        Returns:
+            EmailMessage: The notification addressed to the worker.
+        """
+        _parsed = urlparse(settings.URL)
+        domain = _parsed.netloc
+        scheme = _parsed.scheme
+        subject = 'Actualización en tu solicitud de beca - Becas SNTSA'
+        trabajador_obj = self.becario.trabajador.trabajador
+        message = render_to_string('estado_solicitud.html', {
+            'trabajador': trabajador_obj,
+            'becario': self.becario,
+            'solicitud': self,
+            'domain': domain,
+            'scheme': scheme,
+        })
+        return EmailMessage(subject, message, to=[trabajador_obj.correo])
+
+    def get_propietario_id(self) -> int:
+        """
+        Returns the id of the user that owns the files of this application.
+
+        Returns:
+            int: The id of the worker's user.
+        """
+        return self.becario.trabajador_id
 
     class Meta:
         """
@@ -359,6 +693,10 @@ class SolicitudAprovechamiento(Solicitud):
     promedio = models.FloatField()
     boleta = models.FileField(upload_to='boleta/')
 
+    tracked_fields = Solicitud.tracked_fields + ('boleta', 'grado')
+    conteo_fields = Solicitud.conteo_fields + ('grado',)
+    tipo_nombre = 'Aprovechamiento'
+
     def __str__(self):
         """
         Returns a string representation of the application.
@@ -385,6 +723,10 @@ class SolicitudExcelencia(Solicitud):
     boleta = models.FileField(upload_to='boleta/')
     carrera = models.CharField(max_length=128)
 
+    tracked_fields = Solicitud.tracked_fields + ('boleta', 'grado')
+    conteo_fields = Solicitud.conteo_fields + ('grado',)
+    tipo_nombre = 'Excelencia'
+
     def __str__(self):
         """
         Returns a string representation of the application.
@@ -411,6 +753,9 @@ class SolicitudEspecial(Solicitud):
     certificado_escolar = models.FileField(
         upload_to='certificado_escolar/')
 
+    tracked_fields = Solicitud.tracked_fields + ('certificado_medico', 'certificado_escolar')
+    tipo_nombre = 'Educación Especial'
+
     def __str__(self):
         """
         Returns a string representation of the application.
@@ -419,3 +764,505 @@ class SolicitudEspecial(Solicitud):
             str: A summary of the application.
         """
         return "{} - {} - {}".format(self.becario, self.fecha_solicitud, self.estado)
+
+
+def send_estado_notifications(solicitud_ids):
+    """
+    Notifies the workers of a batch of applications whose estado changed.
+
+    The emails are rendered from one query per batch of ids, with the
+    scholars and workers joined in, and enqueued in the outbox with one
+    insert.
+
+    Args:
+        solicitud_ids (list): The ids of the applications to notify.
+    """
+    emails = []
+    for start in range(0, len(solicitud_ids), UPDATE_BATCH_SIZE):
+        solicitudes = Solicitud.objects.filter(
+            pk__in=solicitud_ids[start:start + UPDATE_BATCH_SIZE]).select_related('becario__trabajador__trabajador')
+        emails.extend(solicitud.build_estado_email() for solicitud in solicitudes)
+    EmailOutbox.objects.enqueue(*emails)
+
+
+class ConteoSolicitudManager(models.Manager):
+    """
+    Manager that keeps the application counters in sync with the
+    applications, in the same transaction as the changes.
+    """
+
+    def aplicar(self, antes, despues):
+        """
+        Moves the counters from the counts of some applications before a
+        change to their counts after it.
+
+        Args:
+            antes (list): The conteos() of the applications before the change.
+            despues (list): The conteos() of the applications after the change.
+        """
+        deltas = Counter()
+        for *dimensiones, total in antes:
+            deltas[tuple(dimensiones)] -= total
+        for *dimensiones, total in despues:
+            deltas[tuple(dimensiones)] += total
+        self.sumar(deltas)
+
+    def sumar(self, deltas):
+        """
+        Adds to the counters, creating the missing ones.
+
+        The counters are created first and then locked with SELECT ... FOR
+        UPDATE, so concurrent transactions add to them one after the other.
+
+        Args:
+            deltas (dict): The amount to add to each counter, keyed by tuples
+                           of (estado, tipo, jurisdiccion_id, grado_id).
+        """
+        deltas = {ConteoSolicitud.build_clave(*dimensiones): (dimensiones, delta)
+                  for dimensiones, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        claves = sorted(deltas)
+        with transaction.atomic(savepoint=False):
+            self.bulk_create([
+                ConteoSolicitud(clave=clave, estado=estado, tipo=tipo, jurisdiccion_id=jurisdiccion_id,
+                                grado_id=grado_id)
+                for clave, ((estado, tipo, jurisdiccion_id, grado_id), _) in deltas.items()
+            ], ignore_conflicts=True)
+            for start in range(0, len(claves), UPDATE_BATCH_SIZE):
+                conteos = list(self.select_for_update().filter(
+                    clave__in=claves[start:start + UPDATE_BATCH_SIZE]).order_by('clave'))
+                for conteo in conteos:
+                    conteo.total += deltas[conteo.clave][1]
+                self.bulk_update(conteos, ['total'])
+
+    def diferencias(self) -> list:
+        """
+        Compares the counters with the applications.
+
+        Returns:
+            list: Tuples of (clave, stored total, actual total) of every
+                  counter that drifted.
+        """
+        actuales = {ConteoSolicitud.build_clave(*dimensiones): total
+                    for *dimensiones, total in Solicitud.objects.conteos()}
+        guardados = dict(self.values_list('clave', 'total'))
+        return [(clave, guardados.get(clave, 0), actuales.get(clave, 0))
+                for clave in sorted(actuales.keys() | guardados.keys())
+                if guardados.get(clave, 0) != actuales.get(clave, 0)]
+
+    def rebuild(self) -> int:
+        """
+        Rebuilds every counter from the applications.
+
+        Returns:
+            int: The number of counters.
+        """
+        conteos = [
+            ConteoSolicitud(clave=ConteoSolicitud.build_clave(estado, tipo, jurisdiccion_id, grado_id),
+                            estado=estado, tipo=tipo, jurisdiccion_id=jurisdiccion_id, grado_id=grado_id,
+                            total=total)
+            for estado, tipo, jurisdiccion_id, grado_id, total in Solicitud.objects.conteos()
+        ]
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(conteos)
+        return len(conteos)
+
+
+class ConteoSolicitud(models.Model):
+    """
+    The number of applications with the same estado, type, jurisdiction and
+    grade, so the statistics are read from a few rows instead of scanning
+    the applications.
+
+    Attributes:
+        clave (str): The dimensions joined, unique even when some are null.
+        estado (str): The estado of the applications.
+        tipo (str): The type of the applications, a key of ganadores.TIPOS.
+        jurisdiccion (Jurisdiccion, optional): The jurisdiction of the worker.
+        grado (Grado, optional): The grade, for the types that have one.
+        total (int): The number of applications.
+    """
+    clave = models.CharField(max_length=64, unique=True)
+    estado = models.CharField(max_length=1, choices=Solicitud.ESTADO_CHOICES)
+    tipo = models.CharField(max_length=32, blank=True)
+    jurisdiccion = models.ForeignKey(Jurisdiccion, null=True, blank=True, on_delete=models.CASCADE)
+    grado = models.ForeignKey(Grado, null=True, blank=True, on_delete=models.CASCADE)
+    total = models.IntegerField(default=0)
+
+    objects = ConteoSolicitudManager()
+
+    @staticmethod
+    def build_clave(estado, tipo, jurisdiccion_id, grado_id) -> str:
+        """
+        Joins the dimensions of a counter into its unique key.
+        """
+        return ':'.join('' if valor is None else str(valor) for valor in (estado, tipo, jurisdiccion_id, grado_id))
+
+    def __str__(self):
+        """
+        Returns a string representation of the counter.
+
+        Returns:
+            str: The key and the total.
+        """
+        return "{} = {}".format(self.clave, self.total)
+
+
+# Models whose files are served through download_file, with the lookup of the
+# user that owns them
+MEDIA_OWNER_LOOKUPS = {
+    Trabajador: 'usuario_id',
+    Becario: 'trabajador_id',
+    SolicitudAprovechamiento: 'becario__trabajador_id',
+    SolicitudExcelencia: 'becario__trabajador_id',
+    SolicitudEspecial: 'becario__trabajador_id',
+}
+
+
+class MediaFileManager(models.Manager):
+    """
+    Manager that keeps the file ownership index in sync with the models
+    that own uploaded files.
+    """
+
+    def index_instance(self, instance):
+        """
+        Indexes every file of the given instance, replacing the entries of
+        files that are no longer referenced by it.
+
+        Args:
+            instance (Model): A Trabajador, Becario or Solicitud instance.
+        """
+        modelo = instance._meta.model_name
+        usuario_id = instance.get_propietario_id()
+        archivos = [
+            MediaFile(ruta=getattr(instance, field.name).name, usuario_id=usuario_id,
+                      tipo=field.name, modelo=modelo, objeto_id=instance.pk)
+            for field in instance._meta.concrete_fields
+            if isinstance(field, models.FileField) and getattr(instance, field.name)
+        ]
+        self.filter(modelo=modelo, objeto_id=instance.pk).exclude(
+            ruta__in=[archivo.ruta for archivo in archivos]).delete()
+        if archivos:
+            self.bulk_create(
+                archivos,
+                update_conflicts=True,
+                unique_fields=['ruta'],
+                update_fields=['usuario', 'tipo', 'modelo', 'objeto_id'],
+            )
+
+    def remove_instance(self, instance):
+        """
+        Removes the index entries of the files of the given instance.
+
+        Args:
+            instance (Model): A Trabajador, Becario or Solicitud instance.
+        """
+        self.filter(modelo=instance._meta.model_name, objeto_id=instance.pk).delete()
+
+    def rebuild(self, batch_size=1000) -> int:
+        """
+        Rebuilds the whole index from the rows that reference files.
+
+        Args:
+            batch_size (int): The number of entries inserted per query.
+
+        Returns:
+            int: The number of indexed files.
+        """
+        total = 0
+        with transaction.atomic():
+            self.all().delete()
+            for model, owner_lookup in MEDIA_OWNER_LOOKUPS.items():
+                modelo = model._meta.model_name
+                file_fields = [field.name for field in model._meta.concrete_fields
+                               if isinstance(field, models.FileField)]
+                rows = model.objects.values_list('pk', owner_lookup, *file_fields)
+                batch = []
+                for pk, usuario_id, *rutas in rows.iterator(chunk_size=batch_size):
+                    for tipo, ruta in zip(file_fields, rutas):
+                        if ruta:
+                            batch.append(MediaFile(ruta=ruta, usuario_id=usuario_id, tipo=tipo,
+                                                   modelo=modelo, objeto_id=pk))
+                    if len(batch) >= batch_size:
+                        self.bulk_create(batch, ignore_conflicts=True)
+                        total += len(batch)
+                        batch = []
+                self.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+        return total
+
+    def user_owns(self, user, ruta) -> bool:
+        """
+        Checks whether a file belongs to the given user.
+
+        Args:
+            user (User): The user requesting the file.
+            ruta (str): The path of the file relative to MEDIA_ROOT.
+
+        Returns:
+            bool: True if the file is indexed as owned by the user.
+        """
+        return self.filter(ruta=ruta, usuario=user).exists()
+
+    async def auser_owns(self, user, ruta) -> bool:
+        """
+        Async version of user_owns, for async views.
+        """
+        return await self.filter(ruta=ruta, usuario=user).aexists()
+
+
+class MediaFile(models.Model):
+    """
+    Ownership index of the uploaded files, used to authorize downloads with a
+    single indexed lookup.
+
+    Attributes:
+        ruta (str): The path of the file relative to MEDIA_ROOT.
+        usuario (User): The user that owns the file.
+        tipo (str): The name of the file field, e.g. 'boleta' or 'ine'.
+        modelo (str): The model name of the row that references the file.
+        objeto_id (int): The primary key of the row that references the file.
+    """
+    ruta = models.CharField(max_length=255, unique=True)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=32)
+    modelo = models.CharField(max_length=32)
+    objeto_id = models.BigIntegerField()
+
+    objects = MediaFileManager()
+
+    class Meta:
+        """
+        Meta options for the MediaFile model.
+        """
+        indexes = [
+            models.Index(fields=['modelo', 'objeto_id'], name='mediafile_objeto_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the indexed file.
+
+        Returns:
+            str: The path of the file.
+        """
+        return self.ruta
+
+
+class EmailOutboxManager(models.Manager):
+    """
+    Manager of the persistent email queue.
+
+    Emails are enqueued in the same transaction as the change that triggers
+    them and delivered later by the send_outbox command, so requests never
+    wait for the SMTP server.
+    """
+
+    def enqueue(self, *emails) -> list:
+        """
+        Adds emails to the queue.
+
+        Args:
+            *emails (EmailMessage): The emails to send.
+
+        Returns:
+            list: The created EmailOutbox rows.
+        """
+        return self.bulk_create([
+            EmailOutbox(asunto=email.subject, cuerpo=email.body, remitente=email.from_email or '',
+                        destinatarios=list(email.to))
+            for email in emails
+        ])
+
+    def claim(self, batch_size=100, lease=300) -> list:
+        """
+        Claims a batch of due emails for the current worker.
+
+        The rows are locked with SELECT ... FOR UPDATE SKIP LOCKED (where the
+        backend supports it) so concurrent workers never claim the same rows,
+        and their next attempt is moved forward by the lease so they are
+        retried if the worker dies before reporting the result.
+
+        Args:
+            batch_size (int): The maximum number of emails to claim.
+            lease (int): Seconds before unreported emails become due again.
+
+        Returns:
+            list: The claimed EmailOutbox rows.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                self.select_for_update(skip_locked=True)
+                .filter(estado='P', siguiente_intento__lte=now)
+                .order_by('siguiente_intento', 'pk')[:batch_size]
+            )
+            if batch:
+                self.filter(pk__in=[email.pk for email in batch]).update(
+                    siguiente_intento=now + timedelta(seconds=lease))
+        return batch
+
+    def deliver(self, batch, connection):
+        """
+        Sends a claimed batch over an open SMTP connection and records the
+        result of every email.
+
+        Failed emails are retried with exponential backoff until they reach
+        EmailOutbox.MAX_INTENTOS attempts. An email refused by the server (or
+        with an invalid address) only fails itself, a lost connection fails
+        the rest of the batch.
+
+        Args:
+            batch (list): The EmailOutbox rows returned by claim.
+            connection (BaseEmailBackend): The open email backend to reuse.
+
+        Returns:
+            tuple: The number of sent and failed emails.
+        """
+        enviados = []
+        fallidos = []
+        pendientes = list(batch)
+        while pendientes:
+            email = pendientes.pop(0)
+            try:
+                email.as_message(connection).send()
+            except (smtplib.SMTPException, OSError, ValueError) as e:
+                logger.warning("No se pudo enviar el correo id=%s a %s: %s",
+                               email.pk, ', '.join(email.destinatarios), e)
+                # SMTPException subclasses OSError: refused recipients or
+                # data only fail this email, the connection is still usable
+                if isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)) or \
+                        (isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)):
+                    # The server is unreachable, retry the rest of the batch later
+                    connection.close()
+                    pendientes.insert(0, email)
+                    for email in pendientes:
+                        email.registrar_fallo(e)
+                    fallidos.extend(pendientes)
+                    break
+                email.registrar_fallo(e)
+                fallidos.append(email)
+            else:
+                email.estado = 'E'
+                email.intentos += 1
+                email.enviado = timezone.now()
+                enviados.append(email)
+        with transaction.atomic():
+            self.bulk_update(enviados, ['estado', 'intentos', 'enviado'])
+            self.bulk_update(fallidos, ['estado', 'intentos', 'siguiente_intento', 'ultimo_error'])
+        return len(enviados), len(fallidos)
+
+
+class EmailOutbox(models.Model):
+    """
+    An email waiting to be sent by the send_outbox command.
+
+    Attributes:
+        asunto (str): The subject of the email.
+        cuerpo (str): The body of the email.
+        remitente (str): The sender, DEFAULT_FROM_EMAIL when empty.
+        destinatarios (list): The recipient addresses.
+        estado (str): 'P' pending, 'E' sent or 'F' failed for good.
+        intentos (int): The number of delivery attempts.
+        siguiente_intento (datetime): When the email is due for delivery.
+        ultimo_error (str): The error of the last failed attempt.
+        creado (datetime): When the email was enqueued.
+        enviado (datetime): When the email was sent.
+    """
+    ESTADO_CHOICES = [
+        ('P', 'Pendiente'),
+        ('E', 'Enviado'),
+        ('F', 'Fallido'),
+    ]
+    # Attempts before giving up on an email
+    MAX_INTENTOS = 8
+    # Delay before the first retry, doubled on every attempt
+    REINTENTO_BASE = 60
+    REINTENTO_MAXIMO = 6 * 60 * 60
+
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField()
+    remitente = models.CharField(max_length=255, blank=True)
+    destinatarios = models.JSONField(default=list)
+    estado = models.CharField(max_length=1, choices=ESTADO_CHOICES, default='P')
+    intentos = models.PositiveIntegerField(default=0)
+    siguiente_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    enviado = models.DateTimeField(null=True, blank=True)
+
+    objects = EmailOutboxManager()
+
+    class Meta:
+        """
+        Meta options for the EmailOutbox model.
+        """
+        indexes = [
+            models.Index(fields=['estado', 'siguiente_intento'], name='emailoutbox_pendiente_idx'),
+        ]
+
+    def as_message(self, connection=None) -> EmailMessage:
+        """
+        Builds the EmailMessage of the queued email.
+
+        Args:
+            connection (BaseEmailBackend, optional): The backend used to send it.
+
+        Returns:
+            EmailMessage: The email ready to be sent.
+        """
+        return EmailMessage(self.asunto, self.cuerpo, self.remitente or None,
+                            self.destinatarios, connection=connection)
+
+    def registrar_fallo(self, error):
+        """
+        Records a failed attempt and schedules the next one with exponential
+        backoff, or marks the email as failed after MAX_INTENTOS attempts.
+
+        Args:
+            error (Exception): The error raised while sending.
+        """
+        self.intentos += 1
+        self.ultimo_error = str(error)
+        if self.intentos >= self.MAX_INTENTOS:
+            self.estado = 'F'
+        else:
+            retraso = min(self.REINTENTO_BASE * 2 ** (self.intentos - 1), self.REINTENTO_MAXIMO)
+            self.siguiente_intento = timezone.now() + timedelta(seconds=retraso)
+
+    def __str__(self):
+        """
+        Returns a string representation of the queued email.
+
+        Returns:
+            str: The subject and recipients of the email.
+        """
+        return "{} - {}".format(self.asunto, ', '.join(self.destinatarios))
+
+
+class BootstrapFingerprint(models.Model):
+    """
+    The fingerprint of the inputs of a startup phase (migrations, fixtures)
+    the last time it ran against this database, so the bootstrap command can
+    skip it while they do not change.
+
+    Attributes:
+        fase (str): The name of the phase, e.g. 'migrate' or 'loaddata'.
+        huella (str): The SHA-256 of the inputs of the phase.
+        actualizado (datetime): When the phase last ran.
+    """
+    fase = models.CharField(max_length=32, unique=True)
+    huella = models.CharField(max_length=64)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """
+        Returns a string representation of the fingerprint.
+
+        Returns:
+            str: The phase and its fingerprint.
+        """
+        return "{}: {}".format(self.fase, self.huella)
@@ -0,0 +1,106 @@
+"""
+Signal handlers for the becas_sntsa app.
+
+This file keeps derived data, such as the file ownership index, the
+application counters and the cached catalogs, in sync with the models it is
+built from.
+"""
+from django.db import models
+from django.db.models.signals import post_save, post_delete, pre_delete
+from becas_sntsa.catalogs import CATALOG_MODELS, invalidate
+from becas_sntsa.models import ConteoSolicitud, MediaFile, MEDIA_OWNER_LOOKUPS, Solicitud, Trabajador
+
+
+def get_media_fields(model) -> tuple:
+    """
+    Returns the fields that determine the index entries of a model: its file
+    fields and the relation that leads to the owner.
+    """
+    owner = MEDIA_OWNER_LOOKUPS[model].split('__')[0]
+    owner = model._meta.get_field(owner.removesuffix('_id')).name
+    return (owner,) + tuple(field.name for field in model._meta.concrete_fields
+                            if isinstance(field, models.FileField))
+
+
+# Fields checked before reindexing an updated instance, by model
+MEDIA_FIELDS = {model: get_media_fields(model) for model in MEDIA_OWNER_LOOKUPS}
+
+
+def index_media_files(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Indexes the files of a saved instance.
+
+    Updates that do not touch the files or their owner are skipped. Raw saves
+    (e.g. loaddata) are skipped too, use the backfill_media_files command to
+    index them.
+    """
+    if raw:
+        return
+    if not created and not instance.has_changed(*MEDIA_FIELDS[sender]):
+        return
+    MediaFile.objects.index_instance(instance)
+
+
+def remove_media_files(sender, instance, **kwargs):
+    """
+    Removes the files of a deleted instance from the index.
+    """
+    MediaFile.objects.remove_instance(instance)
+
+
+for model in MEDIA_OWNER_LOOKUPS:
+    post_save.connect(index_media_files, sender=model,
+                      dispatch_uid='index_media_files_{}'.format(model._meta.model_name))
+    post_delete.connect(remove_media_files, sender=model,
+                        dispatch_uid='remove_media_files_{}'.format(model._meta.model_name))
+
+
+def descontar_solicitud(sender, instance, **kwargs):
+    """
+    Subtracts a deleted application from its counter.
+
+    Runs before the rows are deleted, in the same transaction, while the
+    scholar and the worker it is counted by are still there. Deleting a
+    subclass instance deletes its Solicitud parent too, so only the parent
+    is counted.
+    """
+    ConteoSolicitud.objects.aplicar(Solicitud.objects.filter(pk=instance.pk).conteos(), [])
+
+
+pre_delete.connect(descontar_solicitud, sender=Solicitud, dispatch_uid='descontar_solicitud')
+
+
+def mover_solicitudes_trabajador(sender, instance, origin=None, **kwargs):
+    """
+    Moves the counters of the applications of a deleted worker's user to no
+    jurisdiction.
+
+    The scholars belong to the user, not to the worker, so the applications
+    outlive a worker deleted on its own. When the deletion cascades from the
+    user, its applications are deleted too and descontar_solicitud already
+    subtracts them.
+    """
+    if not (isinstance(origin, Trabajador) or (isinstance(origin, models.QuerySet) and origin.model is Trabajador)):
+        return
+    despues = Solicitud.objects.filter(becario__trabajador=instance.usuario_id).conteos()
+    antes = [(estado, tipo, instance.jurisdiccion_id, grado_id, total)
+             for estado, tipo, _, grado_id, total in despues]
+    ConteoSolicitud.objects.aplicar(antes, despues)
+
+
+post_delete.connect(mover_solicitudes_trabajador, sender=Trabajador, dispatch_uid='mover_solicitudes_trabajador')
+
+
+def invalidate_catalog(sender, **kwargs):
+    """
+    Discards the cached rows of a catalog table that changed, raw saves
+    (e.g. loaddata) included.
+    """
+    invalidate(sender)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=model,
+                      dispatch_uid='invalidate_catalog_save_{}'.format(model._meta.model_name))
+    post_delete.connect(invalidate_catalog, sender=model,
+                        dispatch_uid='invalidate_catalog_delete_{}'.format(model._meta.model_name))
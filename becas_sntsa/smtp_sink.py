@@ -0,0 +1,104 @@
+"""
+A local SMTP server that accepts and keeps every message.
+
+It is used by the tests, the benchmarks and the smtp_sink command to exercise
+the real SMTP delivery path (send_outbox) without an external mail server.
+"""
+import socketserver
+import threading
+from email import message_from_bytes
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one SMTP session, implementing the subset of the protocol used by
+    smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP and QUIT.
+    """
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost SMTP sink')
+        remitente, destinatarios = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            comando = line.decode('ascii', errors='replace').strip()
+            verbo = comando[:4].upper()
+            if verbo == 'EHLO':
+                self.reply('250-localhost')
+                self.reply('250 8BITMIME')
+            elif verbo == 'HELO':
+                self.reply('250 localhost')
+            elif verbo == 'MAIL':
+                remitente, destinatarios = comando.partition(':')[2].strip(), []
+                self.reply('250 OK')
+            elif verbo == 'RCPT':
+                destinatario = comando.partition(':')[2].strip().strip('<>')
+                if destinatario in self.server.refused:
+                    self.reply('550 Mailbox unavailable')
+                else:
+                    destinatarios.append(destinatario)
+                    self.reply('250 OK')
+            elif verbo == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                with self.server.lock:
+                    self.server.messages.append((remitente, destinatarios, message_from_bytes(b''.join(lines))))
+                self.reply('250 OK')
+            elif verbo in ('RSET', 'NOOP'):
+                remitente, destinatarios = None, []
+                self.reply('250 OK')
+            elif verbo == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Threaded SMTP server that stores the received messages in memory.
+
+    Use it as a context manager to serve in a background thread::
+
+        with SMTPSink() as sink:
+            ...  # send to ('127.0.0.1', sink.port)
+            sink.messages
+
+    Attributes:
+        messages (list): Tuples of (sender, recipients, email.message.Message).
+        connections (int): The number of SMTP sessions opened.
+        refused (set): Addresses rejected with a 550 reply.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, refused=()):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.messages = []
+        self.connections = 0
+        self.refused = set(refused)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,227 @@
+"""
+Columnar snapshots of the scholarship tables for analysis.
+
+The export_snapshot command writes the workers, the scholars and the
+applications of every type to Parquet or Arrow IPC files. Rows are read
+with chunked values_list queries and converted to Arrow record batches, the
+catalog foreign keys are stored as dictionary-encoded columns and the sex
+and birth date are derived from the CURP with vectorized compute kernels.
+
+pyarrow is an optional dependency, only needed by this module.
+"""
+import itertools
+from collections import namedtuple
+from django.db.models.functions import Coalesce
+from becas_sntsa.exports import tipo_expression
+from becas_sntsa.ganadores import TIPOS
+from becas_sntsa.models import Seccion, Puesto, Jurisdiccion, LugarAdscripcion, Grado, Trabajador, Becario, Solicitud
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pq = None
+
+FORMATS = ('parquet', 'arrow')
+
+# Names of the exported tables, described by get_tables
+TABLES = ('trabajadores', 'becarios', 'solicitudes')
+
+# Rows per record batch
+BATCH_SIZE = 50000
+
+# Two digit years above this one are taken as 19xx, like Becario.get_fecha_nacimiento
+CURP_PIVOT_YEAR = 23
+
+Column = namedtuple('Column', ['name', 'lookup', 'type'])
+
+
+class Dictionary:
+    """
+    A fixed dictionary for a categorical column: the database values it
+    encodes and the label stored for each of them.
+    """
+
+    def __init__(self, keys, labels, key_type='int64'):
+        self.keys = list(keys)
+        self.labels = [str(label) for label in labels]
+        self.key_type = key_type
+
+    @classmethod
+    def from_catalog(cls, model, label_field):
+        """
+        Builds the dictionary of a catalog table, labelled by one of its fields.
+        """
+        rows = list(model.objects.order_by('pk').values_list('pk', label_field))
+        return cls([pk for pk, _ in rows], [label for _, label in rows])
+
+    @property
+    def arrow_type(self):
+        return pa.dictionary(pa.int32(), pa.string())
+
+    def encode(self, values):
+        """
+        Encodes a column of database values as a DictionaryArray.
+        """
+        indices = pc.index_in(pa.array(values, type=self.key_type), value_set=pa.array(self.keys, type=self.key_type))
+        return pa.DictionaryArray.from_arrays(indices.cast(pa.int32()), pa.array(self.labels, type=pa.string()))
+
+
+def require_pyarrow():
+    """
+    Raises ImportError when pyarrow is not installed.
+    """
+    if pa is None:
+        raise ImportError('Snapshots need pyarrow, install it with: pip install pyarrow')
+
+
+def get_tables() -> dict:
+    """
+    Describes the exported tables, loading the catalog dictionaries.
+
+    Returns:
+        dict: (queryset, columns, curp column) of every table, keyed by name.
+    """
+    secciones = Dictionary.from_catalog(Seccion, 'numero')
+    puestos = Dictionary.from_catalog(Puesto, 'clave')
+    jurisdicciones = Dictionary.from_catalog(Jurisdiccion, 'clave')
+    lugares = Dictionary.from_catalog(LugarAdscripcion, 'nombre')
+    grados = Dictionary.from_catalog(Grado, 'nombre')
+    estados = [estado for estado, _ in Solicitud.ESTADO_CHOICES]
+    tipos = [model.tipo_nombre for model in TIPOS.values()]
+
+    string, int64, float64 = pa.string(), pa.int64(), pa.float64()
+    return {
+        'trabajadores': (Trabajador.objects.all(), [
+            Column('id', 'pk', int64),
+            Column('usuario_id', 'usuario_id', int64),
+            Column('curp', 'usuario__username', string),
+            Column('nombre', 'nombre', string),
+            Column('apellido_paterno', 'apellido_paterno', string),
+            Column('apellido_materno', 'apellido_materno', string),
+            Column('telefono', 'telefono', string),
+            Column('correo', 'correo', string),
+            Column('seccion', 'seccion_id', secciones),
+            Column('puesto', 'puesto_id', puestos),
+            Column('jurisdiccion', 'jurisdiccion_id', jurisdicciones),
+            Column('lugar_adscripcion', 'lugar_adscripcion_id', lugares),
+            Column('aprobado', 'aprobado', pa.bool_()),
+        ], 'curp'),
+        'becarios': (Becario.objects.all(), [
+            Column('id', 'pk', int64),
+            Column('trabajador_usuario_id', 'trabajador_id', int64),
+            Column('curp', 'curp', string),
+            Column('nombre', 'nombre', string),
+            Column('apellido_paterno', 'apellido_paterno', string),
+            Column('apellido_materno', 'apellido_materno', string),
+            Column('nombre_normalizado', 'nombre_normalizado', string),
+        ], 'curp'),
+        'solicitudes': (Solicitud.objects.annotate(
+            tipo=tipo_expression(),
+            grado_id=Coalesce('solicitudaprovechamiento__grado', 'solicitudexcelencia__grado'),
+            promedio=Coalesce('solicitudaprovechamiento__promedio', 'solicitudexcelencia__promedio'),
+        ), [
+            Column('id', 'pk', int64),
+            Column('becario_id', 'becario_id', int64),
+            Column('tipo', 'tipo', Dictionary(tipos, tipos, 'string')),
+            Column('estado', 'estado', Dictionary(estados, estados, 'string')),
+            Column('fecha_solicitud', 'fecha_solicitud', pa.date32()),
+            Column('notas', 'notas', string),
+            Column('grado', 'grado_id', grados),
+            Column('promedio', 'promedio', float64),
+            Column('carrera', 'solicitudexcelencia__carrera', string),
+            Column('diagnostico_medico', 'solicitudespecial__diagnostico_medico', string),
+            Column('tipo_educacion', 'solicitudespecial__tipo_educacion', string),
+        ], None),
+    }
+
+
+def curp_columns(curps):
+    """
+    Derives the sex and the birth date from a column of CURPs, vectorized
+    equivalents of Becario.get_sexo and Becario.get_fecha_nacimiento.
+
+    Args:
+        curps (pyarrow.StringArray): The CURPs.
+
+    Returns:
+        tuple: The sex ('H' or 'M') and the birth date arrays. Dates that do
+               not exist, like February 31, are null.
+    """
+    sexo = pc.utf8_slice_codeunits(curps, 10, 11)
+    year = pc.utf8_slice_codeunits(curps, 4, 6)
+    # Two digit strings compare like the numbers they hold
+    siglo = pc.if_else(pc.greater(year, '{:02d}'.format(CURP_PIVOT_YEAR)), '19', '20')
+    texto = pc.binary_join_element_wise(siglo, year, pc.utf8_slice_codeunits(curps, 6, 10), '')
+    fecha = pc.strptime(texto, format='%Y%m%d', unit='s', error_is_null=True)
+    # strptime rolls impossible days over to the next month, keep exact matches only
+    valida = pc.equal(pc.strftime(fecha, format='%Y%m%d'), texto)
+    return sexo, pc.if_else(valida, pc.cast(fecha, pa.date32()), pa.scalar(None, pa.date32()))
+
+
+def get_schema(columns, curp):
+    """
+    Returns the Arrow schema of a table, with the derived CURP columns.
+    """
+    fields = [pa.field(column.name, column.type.arrow_type if isinstance(column.type, Dictionary) else column.type)
+              for column in columns]
+    if curp:
+        fields += [pa.field('sexo', pa.string()), pa.field('fecha_nacimiento', pa.date32())]
+    return pa.schema(fields)
+
+
+def iter_batches(queryset, columns, curp, batch_size=BATCH_SIZE):
+    """
+    Reads a table in chunks and converts each chunk to a record batch.
+
+    Args:
+        queryset (QuerySet): The rows of the table.
+        columns (list): The Column of every exported value.
+        curp (str): The name of the column to derive the sex and birth date
+                    from, or None.
+        batch_size (int): The number of rows per batch.
+
+    Yields:
+        pyarrow.RecordBatch: The rows of each chunk.
+    """
+    schema = get_schema(columns, curp)
+    rows = queryset.order_by('pk').values_list(*[column.lookup for column in columns]).iterator(chunk_size=batch_size)
+    while True:
+        chunk = list(itertools.islice(rows, batch_size))
+        if not chunk:
+            return
+        arrays = []
+        for column, values in zip(columns, zip(*chunk)):
+            if isinstance(column.type, Dictionary):
+                arrays.append(column.type.encode(values))
+            else:
+                arrays.append(pa.array(values, type=column.type))
+        if curp:
+            arrays.extend(curp_columns(arrays[[column.name for column in columns].index(curp)]))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_table(name, path, formato='parquet', batch_size=BATCH_SIZE) -> int:
+    """
+    Writes one of the tables of get_tables to a file, batch by batch.
+
+    Args:
+        name (str): The name of the table.
+        path (str): The file to write.
+        formato (str): 'parquet' or 'arrow' (Arrow IPC file).
+        batch_size (int): The number of rows per batch.
+
+    Returns:
+        int: The number of rows written.
+    """
+    require_pyarrow()
+    queryset, columns, curp = get_tables()[name]
+    schema = get_schema(columns, curp)
+    writer = pq.ParquetWriter(path, schema) if formato == 'parquet' else pa.ipc.new_file(path, schema)
+    total = 0
+    with writer:
+        for batch in iter_batches(queryset, columns, curp, batch_size):
+            writer.write_batch(batch)
+            total += batch.num_rows
+    return total
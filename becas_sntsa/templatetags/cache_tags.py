@@ -0,0 +1,43 @@
+"""
+Template tags to build the keys of the cached template fragments.
+"""
+import functools
+import hashlib
+from pathlib import Path
+from django import template
+from becas_sntsa.catalogs import CATALOG_MODELS, get_version
+
+register = template.Library()
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / 'templates'
+
+CATALOGS = {model._meta.model_name: model for model in CATALOG_MODELS}
+
+
+@functools.cache
+def get_templates_version() -> str:
+    """
+    Returns a hash of the app templates, computed once per process, so the
+    fragments cached by a previous release are not served after a deploy.
+    """
+    digest = hashlib.sha1()
+    for path in sorted(TEMPLATES_DIR.rglob('*.html')):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+@register.simple_tag
+def fragment_version(*catalogos) -> str:
+    """
+    Returns the version of a cached fragment, to use as a vary-on argument
+    of the cache tag: the version of the templates plus the version of each
+    catalog table shown in the fragment. The catalog versions live in the
+    shared cache, so a change made by any worker changes the key in all.
+
+    Args:
+        *catalogos (str): The model names of the catalog tables, e.g. 'grado'.
+
+    Returns:
+        str: The version of the fragment.
+    """
+    return ':'.join([get_templates_version()] + [get_version(CATALOGS[nombre]) for nombre in catalogos])
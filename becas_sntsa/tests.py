@@ -4,14 +4,17 @@ import django
 from unittest.mock import patch
 from packaging.version import parse
 from django.conf import settings
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from becas_sntsa.models import (
     Becario, Trabajador, Seccion, Puesto, Jurisdiccion, LugarAdscripcion,
-    Grado, SolicitudAprovechamiento
+    Grado, SolicitudAprovechamiento, EmailOutbox
 )
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from datetime import date, timedelta
+
 
 class BecarioModelTest(TestCase):
 
@@ -247,6 +250,8 @@ class CreationViewsTest(TestCase):
         response = self.client.post(reverse('create_trabajador'), data, follow=True)
         self.assertEqual(response.status_code, 200)
         self.assertTrue(Trabajador.objects.filter(usuario=user2).exists())
+        # The verification email is queued, not sent during the request
+        self.assertEqual(EmailOutbox.objects.get().destinatarios, ['new@test.com'])
 
     def test_create_becario_view_post(self):
         data = {
@@ -373,6 +378,34 @@ class DownloadFileViewTest(TestCase):
         self.assertEqual(response.status_code, 403)
         self.assertContains(response, "Invalid file path.", status_code=403)
 
+    @override_settings(MEDIA_OFFLOAD='x-accel-redirect', MEDIA_OFFLOAD_PREFIX='/protected-media/')
+    def test_download_file_x_accel_redirect(self):
+        self.client.login(username='nonstaff', password='testpassword')
+        name = self.trabajador.talon_pago_archivo.name
+        with patch('becas_sntsa.views.open', side_effect=AssertionError('file must not be read'), create=True):
+            response = self.client.get(reverse('download_file', args=[name]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + name)
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_OFFLOAD='x-sendfile')
+    def test_download_file_x_sendfile(self):
+        self.client.login(username='staff', password='testpassword')
+        name = self.trabajador.talon_pago_archivo.name
+        with patch('becas_sntsa.views.open', side_effect=AssertionError('file must not be read'), create=True):
+            response = self.client.get(reverse('download_file', args=[name]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Sendfile'], os.path.realpath(os.path.join(settings.MEDIA_ROOT, name)))
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_OFFLOAD='x-accel-redirect')
+    def test_download_file_offload_still_checks_permissions(self):
+        self.client.login(username='nonstaff2', password='testpassword')
+        response = self.client.get(reverse('download_file', args=[self.trabajador.talon_pago_archivo.name]))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+
     def tearDown(self):
         # Clean up the created file
         file_path = os.path.join(settings.MEDIA_ROOT, self.trabajador.talon_pago_archivo.name)
@@ -435,11 +468,17 @@ class TrabajadorNotificationEmailTest(TestCase):
     @patch('becas_sntsa.models.EmailMessage.send', side_effect=smtplib.SMTPException('smtp failure'))
     def test_aprobado_transition_does_not_fail_when_email_send_errors(self, mock_send):
         self.trabajador.aprobado = True
-        with self.captureOnCommitCallbacks(execute=True):
-            self.trabajador.save()
+        self.trabajador.save()
         self.trabajador.refresh_from_db()
         self.assertTrue(self.trabajador.aprobado)
+        # The email is only queued, saving never talks to the SMTP server
+        self.assertEqual(mock_send.call_count, 0)
+        call_command('send_outbox', '--once', stdout=io.StringIO())
         self.assertEqual(mock_send.call_count, 1)
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.estado, 'P')
+        self.assertEqual(email.intentos, 1)
+        self.assertGreater(email.siguiente_intento, timezone.now())
 
 
 from django.test import override_settings
@@ -565,12 +604,15 @@ class NotificationEmailOutboxTest(TestCase):
             acta_nacimiento=SimpleUploadedFile("acta.txt", b"x"),
         )
 
+    def deliver(self):
+        call_command('send_outbox', '--once', stdout=io.StringIO())
+
     def test_aprobado_transition_sends_email(self):
         """Approving a Trabajador sends a notification email."""
         django_mail.outbox = []
         self.trabajador.aprobado = True
-        with self.captureOnCommitCallbacks(execute=True):
-            self.trabajador.save()
+        self.trabajador.save()
+        self.deliver()
         self.assertEqual(len(django_mail.outbox), 1)
         self.assertIn('notif@test.com', django_mail.outbox[0].to)
 
@@ -578,8 +620,8 @@ class NotificationEmailOutboxTest(TestCase):
         """Saving Trabajador without changing aprobado does not send email."""
         self.trabajador.aprobado = False
         django_mail.outbox = []
-        with self.captureOnCommitCallbacks(execute=True):
-            self.trabajador.save()
+        self.trabajador.save()
+        self.deliver()
         self.assertEqual(len(django_mail.outbox), 0)
 
     def test_solicitud_estado_change_sends_email(self):
@@ -595,8 +637,8 @@ class NotificationEmailOutboxTest(TestCase):
         )
         django_mail.outbox = []
         solicitud.estado = 'T'
-        with self.captureOnCommitCallbacks(execute=True):
-            solicitud.save()
+        solicitud.save()
+        self.deliver()
         self.assertEqual(len(django_mail.outbox), 1)
         self.assertIn('notif@test.com', django_mail.outbox[0].to)
 
@@ -613,8 +655,8 @@ class NotificationEmailOutboxTest(TestCase):
         )
         django_mail.outbox = []
         solicitud.notas = 'Revisar documento X'
-        with self.captureOnCommitCallbacks(execute=True):
-            solicitud.save()
+        solicitud.save()
+        self.deliver()
         self.assertEqual(len(django_mail.outbox), 1)
         self.assertIn('notif@test.com', django_mail.outbox[0].to)
 
@@ -630,6 +672,1619 @@ class NotificationEmailOutboxTest(TestCase):
             estado='R',
         )
         django_mail.outbox = []
-        with self.captureOnCommitCallbacks(execute=True):
-            solicitud.save()
+        solicitud.save()
+        self.deliver()
         self.assertEqual(len(django_mail.outbox), 0)
+
+
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from becas_sntsa.models import MediaFile
+
+
+class MediaFileIndexTest(TestCase):
+    def setUp(self):
+        self.seccion = Seccion.objects.create(numero=1)
+        self.puesto = Puesto.objects.create(clave='P1')
+        self.jurisdiccion = Jurisdiccion.objects.create(clave='J1')
+        self.lugar = LugarAdscripcion.objects.create(nombre='Lugar 1')
+        self.grado = Grado.objects.create(clave='G1', nombre='Grado 1')
+
+        self.user = User.objects.create_user(username='owner', password='testpassword')
+        self.other_user = User.objects.create_user(username='other', password='testpassword')
+        self.trabajador = Trabajador.objects.create(
+            usuario=self.user,
+            nombre='Owner',
+            apellido_paterno='User',
+            talon_pago_archivo=SimpleUploadedFile("talon.txt", b"x"),
+            telefono='1234567890',
+            correo='owner@test.com',
+            seccion=self.seccion,
+            puesto=self.puesto,
+            jurisdiccion=self.jurisdiccion,
+            lugar_adscripcion=self.lugar,
+            aprobado=True
+        )
+        self.becario = Becario.objects.create(
+            trabajador=self.user,
+            nombre='Becario',
+            apellido_paterno='Owner',
+            curp='SAHM050101HDFLNAD0',
+            curp_archivo=SimpleUploadedFile("curp.txt", b"x"),
+            acta_nacimiento=SimpleUploadedFile("acta.txt", b"x"),
+        )
+
+    def create_solicitud(self, estado='F'):
+        return SolicitudAprovechamiento.objects.create(
+            becario=self.becario,
+            grado=self.grado,
+            promedio=9.0,
+            boleta=SimpleUploadedFile("boleta.txt", b"boleta content"),
+            recibo_nomina=SimpleUploadedFile("recibo.txt", b"x"),
+            ine=SimpleUploadedFile("ine.txt", b"x"),
+            estado=estado,
+        )
+
+    def test_files_are_indexed_on_save(self):
+        solicitud = self.create_solicitud()
+        rutas = set(MediaFile.objects.filter(usuario=self.user).values_list('ruta', flat=True))
+        self.assertEqual(rutas, {
+            self.trabajador.talon_pago_archivo.name,
+            self.becario.curp_archivo.name,
+            self.becario.acta_nacimiento.name,
+            solicitud.boleta.name,
+            solicitud.recibo_nomina.name,
+            solicitud.ine.name,
+        })
+
+    def test_owner_can_download_solicitud_file(self):
+        solicitud = self.create_solicitud()
+        self.client.login(username='owner', password='testpassword')
+        response = self.client.get(reverse('download_file', args=[solicitud.boleta.name]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b"boleta content")
+
+    def test_other_user_cannot_download_solicitud_file(self):
+        solicitud = self.create_solicitud()
+        self.client.login(username='other', password='testpassword')
+        response = self.client.get(reverse('download_file', args=[solicitud.boleta.name]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_replaced_file_is_removed_from_index(self):
+        old_name = self.becario.curp_archivo.name
+        self.becario.curp_archivo = SimpleUploadedFile("curp_nuevo.txt", b"y")
+        self.becario.save()
+        self.assertFalse(MediaFile.objects.filter(ruta=old_name).exists())
+        self.assertTrue(MediaFile.objects.user_owns(self.user, self.becario.curp_archivo.name))
+
+    def test_deleted_rows_are_removed_from_index(self):
+        solicitud = self.create_solicitud()
+        ruta = solicitud.boleta.name
+        self.becario.delete()
+        self.assertFalse(MediaFile.objects.filter(ruta=ruta).exists())
+
+    def test_backfill_command_rebuilds_index(self):
+        solicitud = self.create_solicitud()
+        MediaFile.objects.all().delete()
+        call_command('backfill_media_files', stdout=open(os.devnull, 'w'))
+        self.assertTrue(MediaFile.objects.user_owns(self.user, solicitud.ine.name))
+        self.assertEqual(MediaFile.objects.count(), 6)
+
+    def test_download_query_count_is_constant(self):
+        """Authorizing a download costs the same with 1 or 10 solicitudes."""
+        solicitud = self.create_solicitud()
+        self.client.login(username='owner', password='testpassword')
+        url = reverse('download_file', args=[solicitud.ine.name])
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for _ in range(10):
+            solicitud = self.create_solicitud()
+        url = reverse('download_file', args=[solicitud.ine.name])
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(few), len(many))
+
+
+from becas_sntsa.views import RangedFile
+
+
+class DownloadFileConditionalTest(TestCase):
+    def setUp(self):
+        self.seccion = Seccion.objects.create(numero=1)
+        self.puesto = Puesto.objects.create(clave='P1')
+        self.jurisdiccion = Jurisdiccion.objects.create(clave='J1')
+        self.lugar = LugarAdscripcion.objects.create(nombre='Lugar 1')
+        self.staff_user = User.objects.create_user(username='staff', password='testpassword', is_staff=True)
+        self.trabajador = Trabajador.objects.create(
+            usuario=self.staff_user,
+            nombre='Test',
+            apellido_paterno='User',
+            talon_pago_archivo=SimpleUploadedFile("range.txt", b"0123456789"),
+            telefono='1234567890',
+            correo='test@test.com',
+            seccion=self.seccion,
+            puesto=self.puesto,
+            jurisdiccion=self.jurisdiccion,
+            lugar_adscripcion=self.lugar,
+            aprobado=True
+        )
+        self.url = reverse('download_file', args=[self.trabajador.talon_pago_archivo.name])
+        self.client.login(username='staff', password='testpassword')
+
+    def tearDown(self):
+        self.trabajador.talon_pago_archivo.delete(save=False)
+
+    def test_validators_are_sent(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since_returns_304(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_returns_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+    def test_suffix_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+    def test_unsatisfiable_range_returns_416(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-30')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_stale_if_range_returns_full_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+    def test_matching_if_range_returns_partial_content(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-0', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'0')
+
+    def test_ranged_file_is_positioned_for_sendfile(self):
+        """The descriptor is left at the start of the range for sendfile()."""
+        path = os.path.join(settings.MEDIA_ROOT, self.trabajador.talon_pago_archivo.name)
+        ranged = RangedFile(open(path, 'rb'), 3, 4)
+        try:
+            self.assertEqual(os.lseek(ranged.fileno(), 0, os.SEEK_CUR), 3)
+            self.assertEqual(ranged.read(), b'3456')
+            self.assertEqual(ranged.read(), b'')
+        finally:
+            ranged.close()
+
+
+import io
+import tempfile
+from becas_sntsa.models import SolicitudExcelencia
+from becas_sntsa.ganadores import Ganador, extract_lines, parse_ganadores
+
+
+def build_pdf(lines):
+    """
+    Builds a minimal one-page PDF with one line of text per entry.
+    """
+    text = 'BT /F1 10 Tf 50 800 Td 12 TL ' + ' '.join(
+        "({}) '".format(line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')) for line in lines) + ' ET'
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        b'<< /Length %d >>\nstream\n' % len(text) + text.encode('latin-1') + b'\nendstream',
+    ]
+    pdf = b'%PDF-1.4\n'
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n' % number + obj + b'\nendobj\n'
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return pdf
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class ImportGanadoresTest(TestCase):
+    def setUp(self):
+        self.seccion = Seccion.objects.create(numero=1)
+        self.puesto = Puesto.objects.create(clave='P1')
+        self.jurisdiccion = Jurisdiccion.objects.create(clave='J1')
+        self.lugar = LugarAdscripcion.objects.create(nombre='Lugar 1')
+        self.grado = Grado.objects.create(clave='G1', nombre='Grado 1')
+        self.user = User.objects.create_user(username='import_user', password='testpassword')
+        Trabajador.objects.create(
+            usuario=self.user,
+            nombre='Import',
+            apellido_paterno='Worker',
+            talon_pago_archivo='talon_pago/import.pdf',
+            telefono='1234567890',
+            correo='import@test.com',
+            seccion=self.seccion,
+            puesto=self.puesto,
+            jurisdiccion=self.jurisdiccion,
+            lugar_adscripcion=self.lugar,
+            aprobado=True
+        )
+        self.ganador = self.create_excelencia('SAHM050101HDFLNAE1')
+        self.perdedor = self.create_excelencia('GOMA050101MDFLNAE2')
+        becario = self.create_becario('LOPJ050101HDFLNAE3')
+        self.aprovechamiento = SolicitudAprovechamiento.objects.create(
+            becario=becario, grado=self.grado, promedio=9.0, estado='P',
+            boleta='boleta/a.pdf', recibo_nomina='recibo_nomina/a.pdf', ine='ine/a.pdf',
+        )
+        self.pdf = build_pdf([
+            'LISTA DE GANADORES BECAS DE EXCELENCIA',
+            '1 SAHM050101HDFLNAE1 SANCHEZ HERNANDEZ MARIO',
+            '2 XEXX010101HNEXXXA4 PERSONA SIN SOLICITUD',
+        ])
+
+    def create_becario(self, curp):
+        return Becario.objects.create(
+            trabajador=self.user, nombre='Becario', apellido_paterno=curp[:4], curp=curp,
+            curp_archivo='curp/{}.pdf'.format(curp), acta_nacimiento='acta_nacimiento/{}.pdf'.format(curp),
+        )
+
+    def create_excelencia(self, curp):
+        return SolicitudExcelencia.objects.create(
+            becario=self.create_becario(curp), grado=self.grado, promedio=9.5, carrera='Medicina',
+            estado='P', boleta='boleta/{}.pdf'.format(curp), recibo_nomina='recibo_nomina/{}.pdf'.format(curp),
+            ine='ine/{}.pdf'.format(curp),
+        )
+
+    def write_pdf(self):
+        archivo = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+        archivo.write(self.pdf)
+        archivo.close()
+        self.addCleanup(os.remove, archivo.name)
+        return archivo.name
+
+    def test_parse_ganadores_from_pdf(self):
+        ganadores = list(parse_ganadores(extract_lines(io.BytesIO(self.pdf))))
+        self.assertEqual([ganador.curp for ganador in ganadores],
+                         ['SAHM050101HDFLNAE1', 'XEXX010101HNEXXXA4'])
+        self.assertEqual(ganadores[0].nombre, 'SANCHEZ HERNANDEZ MARIO')
+
+    def test_dry_run_does_not_change_estado(self):
+        out = io.StringIO()
+        call_command('import_ganadores', self.write_pdf(), '--tipo', 'excelencia', '--dry-run', stdout=out)
+        self.assertIn('1 ganadores, 1 no ganadores, 1 no encontrados', out.getvalue())
+        self.ganador.refresh_from_db()
+        self.assertEqual(self.ganador.estado, 'P')
+
+    def test_import_applies_transitions(self):
+        django_mail.outbox = []
+        call_command('import_ganadores', self.write_pdf(), '--tipo', 'excelencia', stdout=io.StringIO())
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+        call_command('send_outbox', '--once', stdout=io.StringIO())
+        self.ganador.refresh_from_db()
+        self.perdedor.refresh_from_db()
+        self.aprovechamiento.refresh_from_db()
+        self.assertEqual(self.ganador.estado, 'T')
+        self.assertEqual(self.perdedor.estado, 'F')
+        # Types not covered by the list are left untouched
+        self.assertEqual(self.aprovechamiento.estado, 'P')
+        self.assertEqual(len(django_mail.outbox), 2)
+
+    def test_import_without_notifications(self):
+        django_mail.outbox = []
+        call_command('import_ganadores', self.write_pdf(), '--tipo', 'excelencia',
+                     '--no-notificar', stdout=io.StringIO())
+        self.assertEqual(EmailOutbox.objects.count(), 0)
+
+    def test_import_query_count_does_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as few:
+            call_command('import_ganadores', self.write_pdf(), '--tipo', 'excelencia',
+                         '--no-notificar', '--dry-run', stdout=io.StringIO())
+        for number in range(10):
+            self.create_excelencia('SAHM0501{:02d}HDFLNAF1'.format(number + 1))
+        with CaptureQueriesContext(connection) as many:
+            call_command('import_ganadores', self.write_pdf(), '--tipo', 'excelencia',
+                         '--no-notificar', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(len(few), len(many))
+
+    def test_admin_import_preview(self):
+        User.objects.create_superuser(username='admin', password='testpassword')
+        self.client.login(username='admin', password='testpassword')
+        url = reverse('admin:becas_sntsa_solicitudexcelencia_importar_ganadores')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(url, {
+            'archivo': SimpleUploadedFile('ganadores.pdf', self.pdf),
+            'tipos': ['excelencia'],
+            'dry_run': 'on',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '1 otorgadas, 1 no otorgadas')
+        self.assertContains(response, 'XEXX010101HNEXXXA4')
+        self.ganador.refresh_from_db()
+        self.assertEqual(self.ganador.estado, 'P')
+
+    def test_admin_import_applies_transitions(self):
+        User.objects.create_superuser(username='admin', password='testpassword')
+        self.client.login(username='admin', password='testpassword')
+        url = reverse('admin:becas_sntsa_solicitudexcelencia_importar_ganadores')
+        self.client.post(url, {
+            'archivo': SimpleUploadedFile('ganadores.pdf', self.pdf),
+            'tipos': ['excelencia'],
+        })
+        self.ganador.refresh_from_db()
+        self.assertEqual(self.ganador.estado, 'T')
+
+    def test_winner_without_curp_is_matched_by_name(self):
+        becario = self.perdedor.becario
+        becario.nombre = 'José'
+        becario.apellido_paterno = 'Jiménez'
+        becario.apellido_materno = 'Vázquez'
+        becario.save()
+        lines = ['1 SAHM050101HDFLNAE1 SANCHEZ HERNANDEZ MARIO', '2 JIMENES BASQUEZ JOSE']
+        plan = plan_import(parse_ganadores(lines), ['excelencia'])
+        self.assertEqual({transicion.solicitud_id for transicion in plan.ganadores},
+                         {self.ganador.pk, self.perdedor.pk})
+        self.assertEqual(len(plan.por_nombre), 1)
+        self.assertEqual(plan.no_ganadores, [])
+
+    def test_listed_curp_is_not_matched_by_name(self):
+        becario = self.perdedor.becario
+        becario.nombre = 'Juan'
+        becario.apellido_paterno = 'Perez'
+        becario.apellido_materno = 'Lopes'
+        becario.save()
+        plan = plan_import(parse_ganadores(['1 JUAN PEREZ LOPEZ PELJ100101HDFRPZ09']), ['excelencia'])
+        self.assertEqual(plan.ganadores, [])
+        self.assertEqual([ganador.curp for ganador in plan.no_encontrados], ['PELJ100101HDFRPZ09'])
+        self.assertIn(self.perdedor.pk, [transicion.solicitud_id for transicion in plan.no_ganadores])
+
+    def test_only_name_shaped_rows_without_curp(self):
+        lines = ['2 TOTAL DE BECAS ASIGNADAS', '3 PAGINA 1 DE 2', '4 ANA LOPEZ', '5 JIMENES BASQUEZ JOSE']
+        self.assertEqual(list(parse_ganadores(lines)), [Ganador(None, 'JIMENES BASQUEZ JOSE')])
+
+
+from becas_sntsa.ganadores import plan_import
+from becas_sntsa.matching import NameMatcher, normalize_name, phonetic_key
+
+
+class NameMatchingTest(TestCase):
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name('  José María', 'Núñez-Peña', None), 'JOSE MARIA NUNEZ PENA')
+
+    def test_phonetic_key_ignores_spelling_and_order(self):
+        self.assertEqual(phonetic_key(normalize_name('José Jiménez Vázquez')),
+                         phonetic_key(normalize_name('XIMENES BASQUEZ JOSE')))
+        self.assertNotEqual(phonetic_key('JOSE JIMENEZ'), phonetic_key('JUAN JIMENEZ'))
+
+    def test_match_with_typo(self):
+        matcher = NameMatcher()
+        matcher.add('a', 'Mariana Hernández López')
+        matcher.add('b', 'Mario Hernández López')
+        self.assertEqual(matcher.match('MARIANA HERNADEZ LOPEZ'), 'a')
+        self.assertIsNone(matcher.match('PEDRO RAMIREZ ORTIZ'))
+
+    def test_tie_is_resolved_by_best_promedio(self):
+        matcher = NameMatcher()
+        matcher.add('bajo', 'Ana García Ruiz', promedio=8.5)
+        matcher.add('alto', 'Ana García Ruiz', promedio=9.7)
+        self.assertEqual(matcher.match('ANA GARCIA RUIZ'), 'alto')
+        self.assertEqual(matcher.match('ANA GARCIA RUIZ', exclude={'alto'}), 'bajo')
+
+    def test_becario_name_keys_are_stored(self):
+        user = User.objects.create_user(username='claves_user', password='testpassword')
+        becario = Becario.objects.create(
+            trabajador=user, nombre='Ángel', apellido_paterno='Chávez', apellido_materno='Quiroz',
+            curp='CAQA050101HDFLNAE1', curp_archivo='curp/x.pdf', acta_nacimiento='acta_nacimiento/x.pdf',
+        )
+        self.assertEqual(becario.nombre_normalizado, 'ANGEL CHAVEZ QUIROZ')
+        becario.apellido_materno = 'Ruiz'
+        becario.save(update_fields=['apellido_materno'])
+        becario.refresh_from_db()
+        self.assertEqual(becario.nombre_normalizado, 'ANGEL CHAVEZ RUIZ')
+        self.assertEqual(becario.clave_fonetica, phonetic_key('ANGEL CHAVEZ RUIZ'))
+
+
+from becas_sntsa.smtp_sink import SMTPSink
+
+
+class EmailOutboxTest(TestCase):
+    def enqueue(self, *destinatarios):
+        return EmailOutbox.objects.enqueue(*[
+            django_mail.EmailMessage('Asunto', 'Cuerpo', 'becas@test.com', [destinatario])
+            for destinatario in destinatarios
+        ])
+
+    def send_outbox(self, port, *args):
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                               EMAIL_HOST='127.0.0.1', EMAIL_PORT=port, EMAIL_USE_TLS=False,
+                               EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD=''):
+            call_command('send_outbox', '--once', *args, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_batches_are_sent_over_one_connection(self):
+        self.enqueue('a@test.com', 'b@test.com', 'c@test.com')
+        with SMTPSink() as sink:
+            self.send_outbox(sink.port, '--batch-size', '2')
+        self.assertEqual(sorted(destinatarios[0] for _, destinatarios, _ in sink.messages),
+                         ['a@test.com', 'b@test.com', 'c@test.com'])
+        self.assertEqual(sink.connections, 1)
+        self.assertEqual(set(EmailOutbox.objects.values_list('estado', flat=True)), {'E'})
+
+    def test_refused_recipient_is_retried_with_backoff(self):
+        self.enqueue('refused@test.com', 'ok@test.com', 'ok2@test.com')
+        with SMTPSink(refused={'refused@test.com'}) as sink:
+            self.send_outbox(sink.port)
+        self.assertEqual(sorted(destinatarios[0] for _, destinatarios, _ in sink.messages),
+                         ['ok2@test.com', 'ok@test.com'])
+        self.assertEqual(sink.connections, 1)
+        email = EmailOutbox.objects.get(estado='P')
+        self.assertEqual(email.destinatarios, ['refused@test.com'])
+        self.assertEqual(email.intentos, 1)
+        self.assertGreater(email.siguiente_intento, timezone.now() + timedelta(seconds=30))
+        self.assertEqual(EmailOutbox.objects.claim(), [])
+
+    def test_invalid_address_only_fails_its_email(self):
+        self.enqueue('ok@test.com')
+        EmailOutbox.objects.create(asunto='Asunto', cuerpo='Cuerpo', destinatarios=['ok2@test.com'])
+        with SMTPSink() as sink, override_settings(DEFAULT_FROM_EMAIL=''):
+            self.send_outbox(sink.port)
+        self.assertEqual(len(sink.messages), 1)
+        self.assertEqual(EmailOutbox.objects.get(estado='P').destinatarios, ['ok2@test.com'])
+
+    def test_unreachable_server_keeps_the_queue(self):
+        self.enqueue('a@test.com', 'b@test.com')
+        with SMTPSink() as sink:
+            port = sink.port
+        self.send_outbox(port)
+        self.assertEqual(list(EmailOutbox.objects.values_list('estado', 'intentos')), [('P', 1), ('P', 1)])
+
+    def test_email_fails_after_max_attempts(self):
+        email, = self.enqueue('a@test.com')
+        for intento in range(EmailOutbox.MAX_INTENTOS):
+            email.registrar_fallo(smtplib.SMTPException('smtp failure'))
+        self.assertEqual(email.estado, 'F')
+        self.assertEqual(email.intentos, EmailOutbox.MAX_INTENTOS)
+
+    def test_claimed_emails_are_leased(self):
+        self.enqueue('a@test.com', 'b@test.com')
+        self.assertEqual(len(EmailOutbox.objects.claim(batch_size=1)), 1)
+        self.assertEqual(len(EmailOutbox.objects.claim()), 1)
+        self.assertEqual(EmailOutbox.objects.claim(), [])
+
+
+class TrackedFieldsTest(TestCase):
+    def setUp(self):
+        self.seccion = Seccion.objects.create(numero=1)
+        self.puesto = Puesto.objects.create(clave='P1')
+        self.jurisdiccion = Jurisdiccion.objects.create(clave='J1')
+        self.lugar = LugarAdscripcion.objects.create(nombre='Lugar 1')
+        self.grado = Grado.objects.create(clave='G1', nombre='Grado 1')
+        self.user = User.objects.create_user(username='tracked_user', password='testpassword')
+        self.trabajador = Trabajador.objects.create(
+            usuario=self.user,
+            nombre='Tracked',
+            apellido_paterno='Worker',
+            talon_pago_archivo='talon_pago/tracked.pdf',
+            telefono='1234567890',
+            correo='tracked@test.com',
+            seccion=self.seccion,
+            puesto=self.puesto,
+            jurisdiccion=self.jurisdiccion,
+            lugar_adscripcion=self.lugar,
+            aprobado=False
+        )
+        becario = Becario.objects.create(
+            trabajador=self.user, nombre='Becario', apellido_paterno='Tracked', curp='SAHM050101HDFLNAT1',
+            curp_archivo='curp/tracked.pdf', acta_nacimiento='acta_nacimiento/tracked.pdf',
+        )
+        self.solicitud = SolicitudAprovechamiento.objects.create(
+            becario=becario, grado=self.grado, promedio=9.0, estado='R',
+            boleta='boleta/tracked.pdf', recibo_nomina='recibo_nomina/tracked.pdf', ine='ine/tracked.pdf',
+        )
+
+    def test_unchanged_trabajador_save_is_one_query(self):
+        trabajador = Trabajador.objects.get(pk=self.trabajador.pk)
+        trabajador.telefono = '0987654321'
+        with self.assertNumQueries(1):
+            trabajador.save()
+
+    def test_aprobado_transition_does_not_reload_the_row(self):
+        trabajador = Trabajador.objects.get(pk=self.trabajador.pk)
+        trabajador.aprobado = True
+        # The UPDATE and the queued notification
+        with self.assertNumQueries(2):
+            trabajador.save()
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+        with self.assertNumQueries(1):
+            trabajador.save()
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def test_unchanged_solicitud_save_is_one_query_per_table(self):
+        solicitud = SolicitudAprovechamiento.objects.get(pk=self.solicitud.pk)
+        solicitud.promedio = 9.5
+        with self.assertNumQueries(2):
+            solicitud.save()
+        self.assertEqual(EmailOutbox.objects.count(), 0)
+
+    def test_estado_transition_does_not_reload_the_row(self):
+        solicitud = SolicitudAprovechamiento.objects.get(pk=self.solicitud.pk)
+        solicitud.estado = 'E'
+        with CaptureQueriesContext(connection) as queries:
+            solicitud.save()
+        self.assertFalse([query for query in queries
+                          if query['sql'].startswith('SELECT') and 'becas_sntsa_solicitud' in query['sql']])
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def test_instance_built_with_pk_reads_the_stored_values(self):
+        trabajador = Trabajador.objects.get(pk=self.trabajador.pk)
+        trabajador.__dict__.pop('_tracked_snapshot')
+        trabajador.aprobado = True
+        trabajador.save()
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def test_refresh_from_db_updates_the_snapshot(self):
+        solicitud = SolicitudAprovechamiento.objects.get(pk=self.solicitud.pk)
+        SolicitudAprovechamiento.objects.filter(pk=solicitud.pk).update(estado='P')
+        solicitud.refresh_from_db()
+        solicitud.save()
+        self.assertEqual(EmailOutbox.objects.count(), 0)
+
+    def test_files_are_reindexed_only_when_they_change(self):
+        solicitud = SolicitudAprovechamiento.objects.get(pk=self.solicitud.pk)
+        self.assertFalse(solicitud.has_changed('ine', 'boleta', 'becario'))
+        solicitud.ine = 'ine/replaced.pdf'
+        self.assertTrue(solicitud.has_changed('ine'))
+        solicitud.save()
+        self.assertFalse(solicitud.has_changed('ine'))
+        self.assertTrue(MediaFile.objects.filter(ruta='ine/replaced.pdf').exists())
+        self.assertFalse(MediaFile.objects.filter(ruta='ine/tracked.pdf').exists())
+
+
+class BulkEstadoTest(TestCase):
+    def setUp(self):
+        self.seccion = Seccion.objects.create(numero=1)
+        self.puesto = Puesto.objects.create(clave='P1')
+        self.jurisdiccion = Jurisdiccion.objects.create(clave='J1')
+        self.lugar = LugarAdscripcion.objects.create(nombre='Lugar 1')
+        self.grado = Grado.objects.create(clave='G1', nombre='Grado 1')
+        self.user = User.objects.create_user(username='bulk_user', password='testpassword')
+        Trabajador.objects.create(
+            usuario=self.user,
+            nombre='Bulk',
+            apellido_paterno='Worker',
+            talon_pago_archivo='talon_pago/bulk.pdf',
+            telefono='1234567890',
+            correo='bulk@test.com',
+            seccion=self.seccion,
+            puesto=self.puesto,
+            jurisdiccion=self.jurisdiccion,
+            lugar_adscripcion=self.lugar,
+            aprobado=True
+        )
+        self.solicitudes = [self.create_solicitud('SAHM0501{:02d}HDFLNAB1'.format(number + 1)) for number in range(3)]
+
+    def create_solicitud(self, curp, estado='R'):
+        becario = Becario.objects.create(
+            trabajador=self.user, nombre='Becario', apellido_paterno='Bulk', curp=curp,
+            curp_archivo='curp/{}.pdf'.format(curp), acta_nacimiento='acta_nacimiento/{}.pdf'.format(curp),
+        )
+        return SolicitudAprovechamiento.objects.create(
+            becario=becario, grado=self.grado, promedio=9.0, estado=estado,
+            boleta='boleta/{}.pdf'.format(curp), recibo_nomina='recibo_nomina/{}.pdf'.format(curp),
+            ine='ine/{}.pdf'.format(curp),
+        )
+
+    def test_cambiar_estado_updates_and_notifies_changed_rows(self):
+        self.solicitudes[0].estado = 'P'
+        self.solicitudes[0].save()
+        EmailOutbox.objects.all().delete()
+        ids = SolicitudAprovechamiento.objects.all().cambiar_estado('P')
+        self.assertEqual(sorted(ids), sorted(solicitud.pk for solicitud in self.solicitudes[1:]))
+        self.assertEqual(set(SolicitudAprovechamiento.objects.values_list('estado', flat=True)), {'P'})
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+    def test_cambiar_estado_query_count_does_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as few:
+            SolicitudAprovechamiento.objects.all().cambiar_estado('E')
+        for number in range(10):
+            self.create_solicitud('GOMA0501{:02d}MDFLNAB2'.format(number + 1))
+        with CaptureQueriesContext(connection) as many:
+            SolicitudAprovechamiento.objects.filter(estado='R').cambiar_estado('E')
+        self.assertEqual(len(few), len(many))
+
+    def test_admin_action(self):
+        User.objects.create_superuser(username='admin', password='testpassword')
+        self.client.login(username='admin', password='testpassword')
+        response = self.client.post(reverse('admin:becas_sntsa_solicitudaprovechamiento_changelist'), {
+            'action': 'marcar_estado_e',
+            '_selected_action': [solicitud.pk for solicitud in self.solicitudes[:2]],
+        }, follow=True)
+        self.assertContains(response, '2 solicitudes cambiaron')
+        self.assertEqual(sorted(SolicitudAprovechamiento.objects.values_list('estado', flat=True)), ['E', 'E', 'R'])
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+    def test_admin_action_reports_duplicate_pending(self):
+        User.objects.create_superuser(username='admin', password='testpassword')
+        self.client.login(username='admin', password='testpassword')
+        otra = SolicitudAprovechamiento.objects.create(
+            becario=self.solicitudes[0].becario, grado=self.grado, promedio=8.0, estado='R',
+            boleta='boleta/otra.pdf', recibo_nomina='recibo_nomina/otra.pdf', ine='ine/otra.pdf',
+        )
+        response = self.client.post(reverse('admin:becas_sntsa_solicitudaprovechamiento_changelist'), {
+            'action': 'marcar_estado_p',
+            '_selected_action': [self.solicitudes[0].pk, otra.pk],
+        }, follow=True)
+        self.assertContains(response, 'no puede tener más de una solicitud en espera')
+        self.assertFalse(SolicitudAprovechamiento.objects.filter(estado='P').exists())
+
+    def test_set_estado_command(self):
+        out = io.StringIO()
+        call_command('set_estado', 'P', '--desde', 'R', '--tipo', 'excelencia', stdout=out)
+        self.assertIn('0 solicitudes changed', out.getvalue())
+        call_command('set_estado', 'P', '--desde', 'R', '--tipo', 'aprovechamiento',
+                     '--id', str(self.solicitudes[0].pk), '--no-notificar', stdout=out)
+        self.assertEqual(SolicitudAprovechamiento.objects.get(estado='P'), self.solicitudes[0])
+        self.assertEqual(EmailOutbox.objects.count(), 0)
+
+
+from becas_sntsa.models import Solicitud, SolicitudEspecial
+
+
+class SelectSubclassesTest(TestCase):
+    def setUp(self):
+        self.seccion = Seccion.objects.create(numero=1)
+        self.puesto = Puesto.objects.create(clave='P1')
+        self.jurisdiccion = Jurisdiccion.objects.create(clave='J1')
+        self.lugar = LugarAdscripcion.objects.create(nombre='Lugar 1')
+        self.grado = Grado.objects.create(clave='G1', nombre='Grado 1')
+        self.user = User.objects.create_user(username='SAHM910101HDFLNAS1', password='testpassword')
+        Trabajador.objects.create(
+            usuario=self.user,
+            nombre='Poly',
+            apellido_paterno='Worker',
+            talon_pago_archivo='talon_pago/poly.pdf',
+            telefono='1234567890',
+            correo='poly@test.com',
+            seccion=self.seccion,
+            puesto=self.puesto,
+            jurisdiccion=self.jurisdiccion,
+            lugar_adscripcion=self.lugar,
+            aprobado=True
+        )
+        self.becario = Becario.objects.create(
+            trabajador=self.user, nombre='Becario', apellido_paterno='Poly', curp='SAHM050101HDFLNAS2',
+            curp_archivo='curp/poly.pdf', acta_nacimiento='acta_nacimiento/poly.pdf',
+        )
+
+    def create_solicitudes(self, fecha):
+        comunes = {'becario': self.becario, 'estado': 'F', 'fecha_solicitud': fecha,
+                   'recibo_nomina': 'recibo_nomina/poly.pdf', 'ine': 'ine/poly.pdf'}
+        return [
+            SolicitudAprovechamiento.objects.create(grado=self.grado, promedio=8.5, boleta='boleta/a.pdf', **comunes),
+            SolicitudExcelencia.objects.create(grado=self.grado, promedio=9.5, boleta='boleta/e.pdf',
+                                               carrera='Medicina', **comunes),
+            SolicitudEspecial.objects.create(diagnostico_medico='D', tipo_educacion='T', certificado_medico='cm/x.pdf',
+                                             certificado_escolar='ce/x.pdf', **comunes),
+        ]
+
+    def test_rows_are_loaded_as_their_subclass_in_one_query(self):
+        creadas = self.create_solicitudes(date(2024, 6, 1))
+        with self.assertNumQueries(1):
+            solicitudes = list(Solicitud.objects.select_subclasses().order_by('pk'))
+            self.assertEqual([type(solicitud) for solicitud in solicitudes],
+                             [SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial])
+            self.assertEqual([solicitud.pk for solicitud in solicitudes], [solicitud.pk for solicitud in creadas])
+            self.assertEqual(solicitudes[1].carrera, 'Medicina')
+            self.assertEqual(solicitudes[1].promedio, 9.5)
+            self.assertEqual({str(solicitud.becario) for solicitud in solicitudes}, {'SAHM050101HDFLNAS2'})
+            self.assertEqual({solicitud.estado for solicitud in solicitudes}, {'F'})
+
+    def test_loaded_subclass_can_be_saved(self):
+        self.create_solicitudes(date(2024, 6, 1))
+        solicitud = Solicitud.objects.select_subclasses().get(solicitudexcelencia__isnull=False)
+        solicitud.estado = 'T'
+        solicitud.save()
+        solicitud = SolicitudExcelencia.objects.get(pk=solicitud.pk)
+        self.assertEqual((solicitud.estado, solicitud.carrera), ('T', 'Medicina'))
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def test_ver_solicitudes_orders_by_date_with_constant_queries(self):
+        self.client.login(username='SAHM910101HDFLNAS1', password='testpassword')
+        self.create_solicitudes(date(2023, 6, 1))
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(reverse('ver_solicitudes'))
+        self.assertEqual(len(response.context['solicitudes']), 3)
+        recientes = self.create_solicitudes(date(2025, 6, 1))
+        self.create_solicitudes(date(2024, 6, 1))
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('ver_solicitudes'))
+        self.assertEqual(len(few), len(many))
+        solicitudes = list(response.context['solicitudes'])
+        self.assertEqual(len(solicitudes), 9)
+        self.assertEqual({solicitud.pk for solicitud in solicitudes[:3]}, {solicitud.pk for solicitud in recientes})
+        self.assertContains(response, 'data-order="2025-06-01"')
+        self.assertContains(response, 'Educación Especial')
+
+
+class AdminChangelistQueriesTest(TestCase):
+    # Queries per changelist page: session, user, the two counts, the rows
+    # and, for Trabajador, the choices of the two related filters
+    CHANGELIST_QUERIES = {
+        'trabajador': 7,
+        'becario': 5,
+        'solicitudaprovechamiento': 5,
+        'solicitudexcelencia': 5,
+        'solicitudespecial': 5,
+    }
+
+    def setUp(self):
+        self.seccion = Seccion.objects.create(numero=1)
+        self.puesto = Puesto.objects.create(clave='P1')
+        self.jurisdiccion = Jurisdiccion.objects.create(clave='J1')
+        self.lugar = LugarAdscripcion.objects.create(nombre='Lugar 1')
+        self.grado = Grado.objects.create(clave='G1', nombre='Grado 1')
+        User.objects.create_superuser(username='admin', password='testpassword')
+        self.client.login(username='admin', password='testpassword')
+        self.total = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.total += 1
+            curp = 'SAHM0501{:02d}HDFLNAC{}'.format(self.total, self.total % 10)
+            user = User.objects.create_user(username=curp, password='testpassword')
+            Trabajador.objects.create(
+                usuario=user, nombre='Admin', apellido_paterno='Worker', talon_pago_archivo='talon_pago/x.pdf',
+                telefono='1234567890', correo='admin{}@test.com'.format(self.total), seccion=self.seccion,
+                puesto=self.puesto, jurisdiccion=self.jurisdiccion, lugar_adscripcion=self.lugar,
+            )
+            becario = Becario.objects.create(
+                trabajador=user, nombre='Becario', apellido_paterno='Admin', curp=curp,
+                curp_archivo='curp/x.pdf', acta_nacimiento='acta_nacimiento/x.pdf',
+            )
+            comunes = {'becario': becario, 'estado': 'F', 'recibo_nomina': 'recibo_nomina/x.pdf', 'ine': 'ine/x.pdf'}
+            SolicitudAprovechamiento.objects.create(grado=self.grado, promedio=9.0, boleta='boleta/x.pdf', **comunes)
+            SolicitudExcelencia.objects.create(grado=self.grado, promedio=9.0, boleta='boleta/x.pdf',
+                                               carrera='Medicina', **comunes)
+            SolicitudEspecial.objects.create(diagnostico_medico='D', tipo_educacion='T',
+                                             certificado_medico='cm/x.pdf', certificado_escolar='ce/x.pdf', **comunes)
+
+    def changelist_queries(self, model_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:becas_sntsa_{}_changelist'.format(model_name)))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_is_fixed(self):
+        self.add_rows(2)
+        few = {model_name: self.changelist_queries(model_name) for model_name in self.CHANGELIST_QUERIES}
+        self.add_rows(20)
+        many = {model_name: self.changelist_queries(model_name) for model_name in self.CHANGELIST_QUERIES}
+        self.assertEqual(few, many)
+        self.assertEqual(many, self.CHANGELIST_QUERIES)
+
+    def test_solicitud_changelist_links_the_trabajador(self):
+        self.add_rows(1)
+        trabajador = Trabajador.objects.get()
+        response = self.client.get(reverse('admin:becas_sntsa_solicitudexcelencia_changelist'))
+        self.assertContains(response, reverse('admin:becas_sntsa_trabajador_change', args=[trabajador.pk]))
+
+
+import random
+from becas_sntsa.forms import validar_curp
+from django.core.management.base import CommandError
+from becas_sntsa.load import GunicornServer, check_local_database, check_local_url, percentile, random_curp, select_options, synthetic_pdf
+
+
+class LoadHelpersTest(TestCase):
+    def test_random_curp_is_accepted_by_signup_and_becario_form(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            curp = random_curp(rng)
+            self.assertRegex(curp, r'^([A-Z]{4}\d{6}[HM][A-Z]{5}[A-Z0-9]{2})$')
+            validar_curp(curp)
+
+    def test_synthetic_pdf_is_padded_to_size(self):
+        pdf = synthetic_pdf('PRUEBA', 10 * 1024)
+        self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+        self.assertTrue(pdf.endswith(b'%%EOF\n'))
+        self.assertGreaterEqual(len(pdf), 10 * 1024 - 200)
+        xref = int(pdf.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+        self.assertTrue(pdf[xref:].startswith(b'xref'))
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_select_options(self):
+        body = '<select name="becario" id="id_becario"><option value="">---</option>' \
+               '<option value="3">A</option><option value="8">B</option></select>'
+        self.assertEqual(select_options(body, 'becario'), ['3', '8'])
+        self.assertEqual(select_options(body, 'grado'), [])
+
+    def test_only_local_targets_are_accepted(self):
+        check_local_database({'ENGINE': 'django.db.backends.sqlite3'})
+        check_local_database({'ENGINE': 'django.db.backends.postgresql', 'HOST': 'localhost'})
+        with self.assertRaises(ValueError):
+            check_local_database({'ENGINE': 'django.db.backends.postgresql', 'HOST': 'db.example.com'})
+        with self.assertRaises(ValueError):
+            check_local_database({'ENGINE': 'django.db.backends.mysql', 'HOST': ''})
+        check_local_url('http://127.0.0.1:8000')
+        with self.assertRaises(ValueError):
+            check_local_url('https://becas.example.com')
+
+    def test_unknown_gunicorn_profile(self):
+        with self.assertRaisesRegex(RuntimeError, 'GUNICORN_PROFILE must be one of gthread, sync, uvicorn'):
+            with GunicornServer('eventlet'):
+                pass
+        with self.assertRaisesRegex(CommandError, 'cannot be used together'):
+            call_command('bench_load', url='http://127.0.0.1:8000', profile=['sync'])
+
+
+from django.contrib.auth import authenticate
+from django.db.models import Count
+
+
+class GenerateUsersBulkTest(TestCase):
+    fixtures = ['initial_data.json']
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def generate(self, *args):
+        out = io.StringIO()
+        call_command('generate_users', '--bulk', '--num_users', '25', '--batch-size', '7', '--min-solicitudes', '2',
+                     *args, stdout=out)
+        return out.getvalue()
+
+    def test_bulk_creates_consistent_rows(self):
+        output = self.generate('--password', 'secreto')
+        self.assertIn('rows/s', output)
+        self.assertEqual(User.objects.count(), 25)
+        self.assertEqual(Trabajador.objects.count(), 25)
+        self.assertGreaterEqual(Becario.objects.count(), 25)
+
+        # Every parent row has exactly one child row
+        hijos = (SolicitudAprovechamiento.objects.count() + SolicitudExcelencia.objects.count()
+                 + SolicitudEspecial.objects.count())
+        self.assertEqual(Solicitud.objects.count(), hijos)
+        for solicitud in Solicitud.objects.select_subclasses():
+            self.assertIsNot(type(solicitud), Solicitud)
+
+        self.assertFalse(Becario.objects.filter(nombre_normalizado='').exists())
+        self.assertFalse(Solicitud.objects.filter(estado='P').values('becario')
+                         .annotate(total=Count('pk')).filter(total__gt=1).exists())
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+            self.assertIsNotNone(authenticate(username=User.objects.first().username, password='secreto'))
+
+    def test_bulk_runs_a_fixed_number_of_queries_per_batch(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.generate('--max-becarios', '1', '--max-solicitudes', '2')
+        # The catalogs once, then per batch of users: the taken usernames, the
+        # savepoint, one INSERT per table, the three queries of the counters
+        # and the release
+        self.assertLessEqual(len(queries), 5 + 4 * 14)
+
+    def test_sharded_generation_only_depends_on_the_seed(self):
+        from becas_sntsa.management.commands.generate_users import SHARD_SIZE, generate_trabajadores, load_catalogs
+        catalogs = load_catalogs()
+        rangos = {'min_becarios': 1, 'max_becarios': 2, 'min_solicitudes': 1, 'max_solicitudes': 2}
+        num_users = SHARD_SIZE + 20
+        secuencial = list(generate_trabajadores(catalogs, rangos, 7, num_users, workers=1))
+        self.assertEqual(len(secuencial), num_users)
+        self.assertEqual(list(generate_trabajadores(catalogs, rangos, 7, num_users, workers=2)), secuencial)
+        self.assertNotEqual(list(generate_trabajadores(catalogs, rangos, 8, num_users, workers=1)), secuencial)
+
+
+import csv
+import zipfile
+from xml.etree import ElementTree
+from django.contrib.auth.models import Permission
+
+
+class ExportSolicitudesTest(TestCase):
+    fixtures = ['initial_data.json']
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser(username='exportador', password='x')
+        self.client.force_login(self.staff)
+        user = User.objects.create_user(username='EXPO800101HDFLNA01', password='x')
+        self.trabajador = Trabajador.objects.create(
+            usuario=user, nombre='Ana', apellido_paterno='López', telefono='5512345678', correo='ana@test.com',
+            talon_pago_archivo='talon_pago/x.pdf', seccion=Seccion.objects.first(), puesto=Puesto.objects.first(),
+            jurisdiccion=Jurisdiccion.objects.first(), lugar_adscripcion=LugarAdscripcion.objects.first(),
+            aprobado=True,
+        )
+        self.grado = Grado.objects.first()
+        self.add_solicitudes(1)
+
+    def add_solicitudes(self, numero):
+        for _ in range(numero):
+            indice = Becario.objects.count()
+            becario = Becario.objects.create(
+                trabajador=self.trabajador.usuario, nombre='Luis', apellido_paterno='Peña',
+                curp='EXPB{:06d}HDFLNA01'.format(indice), curp_archivo='curp/x.pdf',
+                acta_nacimiento='acta_nacimiento/x.pdf',
+            )
+            comunes = {'becario': becario, 'recibo_nomina': 'recibo_nomina/x.pdf', 'ine': 'ine/x.pdf'}
+            SolicitudAprovechamiento.objects.create(
+                grado=self.grado, promedio=9.5, boleta='boleta/x.pdf', estado='R',
+                fecha_solicitud=date(2024, 1, 10), **comunes)
+            SolicitudExcelencia.objects.create(
+                grado=self.grado, promedio=8.0, boleta='boleta/x.pdf', carrera='Medicina', estado='T',
+                fecha_solicitud=date(2024, 6, 10), **comunes)
+            SolicitudEspecial.objects.create(
+                diagnostico_medico='D', tipo_educacion='T', certificado_medico='cm/x.pdf',
+                certificado_escolar='ce/x.pdf', estado='F', fecha_solicitud=date(2025, 1, 10), **comunes)
+
+    def export(self, **params):
+        response = self.client.get(reverse('admin:becas_sntsa_solicitudaprovechamiento_exportar'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_export_with_filters(self):
+        response, content = self.export(formato='csv', tipos=['excelencia', 'especial'], desde='2024-03-01')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(rows[0][:3], ['ID', 'Tipo', 'Estado'])
+        self.assertEqual([row[1] for row in rows[1:]], ['Excelencia', 'Educación Especial'])
+        excelencia = dict(zip(rows[0], rows[1]))
+        self.assertEqual(excelencia['Estado'], 'Beca otorgada')
+        self.assertEqual(excelencia['Nombre del trabajador'], 'Ana')
+        self.assertEqual(excelencia['Grado'], self.grado.nombre)
+        self.assertEqual(excelencia['Promedio'], '8.0')
+        self.assertEqual(excelencia['Carrera'], 'Medicina')
+
+        _, content = self.export(formato='csv', estado='R')
+        self.assertEqual(len(content.decode('utf-8-sig').splitlines()), 2)
+
+    def test_xlsx_export_is_a_valid_workbook(self):
+        response, content = self.export(formato='xlsx')
+        self.assertIn('spreadsheetml', response['Content-Type'])
+        with zipfile.ZipFile(io.BytesIO(content)) as archivo:
+            self.assertIn('[Content_Types].xml', archivo.namelist())
+            hoja = ElementTree.fromstring(archivo.read('xl/worksheets/sheet1.xml'))
+        namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        self.assertEqual(len(hoja.findall('{0}sheetData/{0}row'.format(namespace))), 4)
+
+    def test_export_runs_the_same_queries_for_any_number_of_rows(self):
+        url = reverse('admin:becas_sntsa_solicitudaprovechamiento_exportar')
+        with CaptureQueriesContext(connection) as pocas:
+            b''.join(self.client.get(url, {'formato': 'csv'}).streaming_content)
+        self.add_solicitudes(10)
+        with CaptureQueriesContext(connection) as muchas:
+            b''.join(self.client.get(url, {'formato': 'xlsx'}).streaming_content)
+        self.assertEqual(len(pocas), len(muchas))
+
+    def test_export_requires_staff(self):
+        self.client.force_login(self.trabajador.usuario)
+        response = self.client.get(reverse('admin:becas_sntsa_solicitudaprovechamiento_exportar'), {'formato': 'csv'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('admin:login'), response['Location'])
+
+    def test_export_is_limited_to_the_types_the_user_can_view(self):
+        staff = User.objects.create_user(username='especial', password='x', is_staff=True)
+        staff.user_permissions.add(Permission.objects.get(codename='view_solicitudespecial'))
+        self.client.force_login(staff)
+        url = reverse('admin:becas_sntsa_solicitudespecial_exportar')
+        response = self.client.get(url, {'formato': 'csv'})
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual([row[1] for row in rows[1:]], ['Educación Especial'])
+
+        self.assertNotContains(self.client.get(url), 'value="excelencia"')
+        response = self.client.get(url, {'formato': 'csv', 'tipos': ['especial', 'excelencia']})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(reverse('admin:becas_sntsa_solicitudexcelencia_exportar')).status_code, 403)
+
+    def test_invalid_filters_show_the_form(self):
+        response = self.client.get(reverse('admin:becas_sntsa_solicitudaprovechamiento_exportar'),
+                                   {'formato': 'csv', 'desde': '2025-01-01', 'hasta': '2024-01-01'})
+        self.assertContains(response, 'La fecha inicial debe ser anterior a la final.')
+
+    def test_command_writes_the_file(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'solicitudes.xlsx')
+            stderr = io.StringIO()
+            call_command('export_solicitudes', ruta, '--hasta', '2024-12-31', stderr=stderr)
+            self.assertIn('2 solicitudes exported as xlsx', stderr.getvalue())
+            with zipfile.ZipFile(ruta) as archivo:
+                self.assertIn(b'Medicina', archivo.read('xl/worksheets/sheet1.xml'))
+
+
+import shutil
+from unittest import skipUnless
+from becas_sntsa import snapshot
+
+
+@skipUnless(snapshot.pa is not None, 'pyarrow is not installed')
+class ExportSnapshotTest(TestCase):
+    fixtures = ['initial_data.json']
+
+    def setUp(self):
+        user = User.objects.create_user(username='SNAP800101HDFLNA01', password='x')
+        self.trabajador = Trabajador.objects.create(
+            usuario=user, nombre='Ana', apellido_paterno='López', telefono='5512345678', correo='ana@test.com',
+            talon_pago_archivo='talon_pago/x.pdf', seccion=Seccion.objects.first(), puesto=Puesto.objects.last(),
+            jurisdiccion=Jurisdiccion.objects.first(), lugar_adscripcion=LugarAdscripcion.objects.first(),
+        )
+        comunes = {'trabajador': user, 'nombre': 'Luis', 'apellido_paterno': 'Peña',
+                   'curp_archivo': 'curp/x.pdf', 'acta_nacimiento': 'acta_nacimiento/x.pdf'}
+        self.becarios = [
+            Becario.objects.create(curp='SNAB990215HDFLNA01', **comunes),
+            Becario.objects.create(curp='SNAB100731MDFLNA02', **comunes),
+            Becario.objects.create(curp='SNAB230231MDFLNA03', **comunes),
+        ]
+        self.grado = Grado.objects.first()
+        SolicitudExcelencia.objects.create(
+            becario=self.becarios[0], grado=self.grado, promedio=9.1, carrera='Medicina', estado='T',
+            boleta='boleta/x.pdf', recibo_nomina='recibo_nomina/x.pdf', ine='ine/x.pdf')
+        SolicitudEspecial.objects.create(
+            becario=self.becarios[1], diagnostico_medico='D', tipo_educacion='T', certificado_medico='cm/x.pdf',
+            certificado_escolar='ce/x.pdf', recibo_nomina='recibo_nomina/x.pdf', ine='ine/x.pdf')
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+
+    def read(self, name, formato='parquet'):
+        path = os.path.join(self.directorio, '{}.{}'.format(name, formato))
+        if formato == 'parquet':
+            return snapshot.pq.read_table(path)
+        with snapshot.pa.memory_map(path) as source:
+            return snapshot.pa.ipc.open_file(source).read_all()
+
+    def test_parquet_snapshot(self):
+        call_command('export_snapshot', self.directorio, batch_size=2, stdout=io.StringIO())
+
+        trabajadores = self.read('trabajadores')
+        self.assertTrue(snapshot.pa.types.is_dictionary(trabajadores.schema.field('puesto').type))
+        fila = trabajadores.to_pylist()[0]
+        self.assertEqual(fila['curp'], 'SNAP800101HDFLNA01')
+        self.assertEqual(fila['puesto'], Puesto.objects.last().clave)
+        self.assertEqual(fila['sexo'], 'H')
+        self.assertEqual(fila['fecha_nacimiento'], date(1980, 1, 1))
+
+        becarios = self.read('becarios').to_pylist()
+        self.assertEqual([fila['sexo'] for fila in becarios], [becario.get_sexo() for becario in self.becarios])
+        self.assertEqual([fila['fecha_nacimiento'] and fila['fecha_nacimiento'].isoformat() for fila in becarios],
+                         [self.becarios[0].get_fecha_nacimiento(), self.becarios[1].get_fecha_nacimiento(), None])
+
+        solicitudes = self.read('solicitudes').to_pylist()
+        self.assertEqual([fila['tipo'] for fila in solicitudes], ['Excelencia', 'Educación Especial'])
+        self.assertEqual(solicitudes[0]['estado'], 'T')
+        self.assertEqual(solicitudes[0]['grado'], self.grado.nombre)
+        self.assertEqual(solicitudes[0]['carrera'], 'Medicina')
+        self.assertIsNone(solicitudes[1]['grado'])
+
+    def test_arrow_snapshot_of_one_table(self):
+        call_command('export_snapshot', self.directorio, format='arrow', table=['becarios'], stdout=io.StringIO())
+        self.assertEqual(os.listdir(self.directorio), ['becarios.arrow'])
+        self.assertEqual(self.read('becarios', 'arrow').num_rows, 3)
+
+    def test_missing_pyarrow(self):
+        with patch.object(snapshot, 'pa', None), self.assertRaises(CommandError):
+            call_command('export_snapshot', self.directorio)
+
+
+from becas_sntsa.models import ConteoSolicitud, SolicitudQuerySet
+
+
+class ConteoSolicitudTest(TestCase):
+    fixtures = ['initial_data.json']
+
+    def setUp(self):
+        self.jurisdicciones = list(Jurisdiccion.objects.order_by('pk')[:2])
+        self.grado = Grado.objects.first()
+        user = User.objects.create_user(username='CONT800101HDFLNA01', password='x')
+        self.trabajador = Trabajador.objects.create(
+            usuario=user, nombre='Ana', apellido_paterno='López', telefono='5512345678', correo='ana@test.com',
+            talon_pago_archivo='talon_pago/x.pdf', seccion=Seccion.objects.first(), puesto=Puesto.objects.first(),
+            jurisdiccion=self.jurisdicciones[0], lugar_adscripcion=LugarAdscripcion.objects.first(),
+            aprobado=True,
+        )
+        self.becario = Becario.objects.create(
+            trabajador=user, nombre='Luis', apellido_paterno='Peña', curp='CONB100101HDFLNA01',
+            curp_archivo='curp/x.pdf', acta_nacimiento='acta_nacimiento/x.pdf')
+
+    def crear(self, model=SolicitudAprovechamiento, estado='R'):
+        campos = {'becario': self.becario, 'estado': estado, 'recibo_nomina': 'recibo_nomina/x.pdf', 'ine': 'ine/x.pdf'}
+        if model is SolicitudEspecial:
+            campos.update(diagnostico_medico='D', tipo_educacion='T', certificado_medico='cm/x.pdf',
+                          certificado_escolar='ce/x.pdf')
+        else:
+            campos.update(grado=self.grado, promedio=9.0, boleta='boleta/x.pdf')
+        return model.objects.create(**campos)
+
+    def totales(self):
+        self.assertEqual(ConteoSolicitud.objects.diferencias(), [])
+        return {clave: total for clave, total in ConteoSolicitud.objects.values_list('clave', 'total') if total}
+
+    def test_saves_keep_the_counters_in_sync(self):
+        jurisdiccion, grado = self.jurisdicciones[0].pk, self.grado.pk
+        solicitud = self.crear()
+        self.crear(SolicitudEspecial, estado='P')
+        self.assertEqual(self.totales(), {
+            'R:aprovechamiento:{}:{}'.format(jurisdiccion, grado): 1,
+            'P:especial:{}:'.format(jurisdiccion): 1,
+        })
+
+        solicitud.estado = 'E'
+        solicitud.save()
+        self.assertIn('E:aprovechamiento:{}:{}'.format(jurisdiccion, grado), self.totales())
+
+        # Unrelated changes do not touch the counters
+        solicitud.promedio = 8.0
+        with self.assertNumQueries(2):
+            solicitud.save()
+
+        self.trabajador.jurisdiccion = self.jurisdicciones[1]
+        self.trabajador.save()
+        self.assertEqual(set(self.totales()), {
+            'E:aprovechamiento:{}:{}'.format(self.jurisdicciones[1].pk, grado),
+            'P:especial:{}:'.format(self.jurisdicciones[1].pk),
+        })
+
+        solicitud.delete()
+        self.assertEqual(len(self.totales()), 1)
+        self.becario.delete()
+        self.assertEqual(self.totales(), {})
+
+    def test_deleting_and_creating_the_worker_moves_the_counters(self):
+        def comparar_con_rebuild():
+            guardados = self.totales()
+            ConteoSolicitud.objects.rebuild()
+            self.assertEqual(self.totales(), guardados)
+            return guardados
+
+        jurisdiccion, grado = self.jurisdicciones[0].pk, self.grado.pk
+        self.crear()
+        self.crear(SolicitudEspecial, estado='P')
+        user = self.trabajador.usuario
+        self.trabajador.delete()
+        self.assertEqual(comparar_con_rebuild(), {'R:aprovechamiento::{}'.format(grado): 1, 'P:especial::': 1})
+
+        trabajador = Trabajador.objects.create(
+            usuario=user, nombre='Ana', apellido_paterno='López', telefono='5512345678', correo='ana@test.com',
+            talon_pago_archivo='talon_pago/x.pdf', seccion=Seccion.objects.first(), puesto=Puesto.objects.first(),
+            jurisdiccion=self.jurisdicciones[1], lugar_adscripcion=LugarAdscripcion.objects.first(),
+        )
+        self.assertEqual(set(comparar_con_rebuild()), {
+            'R:aprovechamiento:{}:{}'.format(self.jurisdicciones[1].pk, grado),
+            'P:especial:{}:'.format(self.jurisdicciones[1].pk),
+        })
+
+        trabajador.jurisdiccion = self.jurisdicciones[0]
+        trabajador.save()
+        Trabajador.objects.filter(pk=trabajador.pk).delete()
+        self.assertEqual(set(comparar_con_rebuild()), {'R:aprovechamiento::{}'.format(grado), 'P:especial::'})
+
+        Trabajador.objects.create(
+            usuario=user, nombre='Ana', apellido_paterno='López', telefono='5512345678', correo='ana@test.com',
+            talon_pago_archivo='talon_pago/x.pdf', seccion=Seccion.objects.first(), puesto=Puesto.objects.first(),
+            jurisdiccion=self.jurisdicciones[0], lugar_adscripcion=LugarAdscripcion.objects.first(),
+        )
+        self.assertIn('P:especial:{}:'.format(jurisdiccion), comparar_con_rebuild())
+        # Deleting the user deletes the applications too
+        user.delete()
+        self.assertEqual(comparar_con_rebuild(), {})
+
+    def test_bulk_estado_changes_move_the_counters(self):
+        for model in (SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial):
+            self.crear(model)
+        SolicitudExcelencia.objects.all().cambiar_estado('T', notificar=False)
+        Solicitud.objects.filter(estado='R').update(estado='F')
+        estados = {}
+        for clave, total in self.totales().items():
+            estados[clave[0]] = estados.get(clave[0], 0) + total
+        self.assertEqual(estados, {'T': 1, 'F': 2})
+
+    def test_bulk_update_only_changes_the_counted_rows(self):
+        self.crear()
+        conteos = SolicitudQuerySet.conteos
+
+        def conteos_y_nueva(queryset):
+            filas = conteos(queryset)
+            # Another request adds a matching application after the count
+            self.crear()
+            return filas
+
+        with patch.object(SolicitudQuerySet, 'conteos', conteos_y_nueva):
+            self.assertEqual(Solicitud.objects.filter(estado='R').update(estado='F'), 1)
+        self.assertEqual(sorted(Solicitud.objects.values_list('estado', flat=True)), ['F', 'R'])
+        self.assertEqual(sorted(clave[0] for clave in self.totales()), ['F', 'R'])
+
+    def test_bulk_update_is_batched(self):
+        for _ in range(3):
+            self.crear()
+        with patch('becas_sntsa.models.UPDATE_BATCH_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Solicitud.objects.filter(estado='R').update(estado='F'), 3)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "becas_sntsa_solicitud"')]), 2)
+        self.assertEqual(list(self.totales().values()), [3])
+
+    def test_bulk_generation_counts_the_inserted_rows(self):
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+            call_command('generate_users', '--bulk', '--num_users', '10', '--batch-size', '4', stdout=io.StringIO())
+        self.assertEqual(sum(self.totales().values()), Solicitud.objects.count())
+
+    def test_rebuild_command_fixes_drift(self):
+        self.crear()
+        ConteoSolicitud.objects.update(total=5)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_conteos', '--check', stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('rebuild_conteos', stdout=out)
+        self.assertIn('1 had drifted', out.getvalue())
+        self.assertEqual(list(self.totales().values()), [1])
+
+    def test_dashboard_reads_only_the_counters(self):
+        self.client.force_login(User.objects.create_superuser(username='estadistico', password='x'))
+        url = reverse('admin:becas_sntsa_solicitudaprovechamiento_estadisticas')
+        self.crear()
+        with CaptureQueriesContext(connection) as pocas:
+            response = self.client.get(url)
+        self.assertContains(response, 'Aprovechamiento')
+        self.assertContains(response, self.jurisdicciones[0].clave)
+
+        for model in (SolicitudExcelencia, SolicitudEspecial, SolicitudEspecial):
+            self.crear(model, estado='T')
+        with CaptureQueriesContext(connection) as muchas:
+            response = self.client.get(url)
+        self.assertEqual(len(muchas), len(pocas))
+        self.assertContains(response, 'Sin grado')
+        self.assertFalse([query for query in muchas if 'becas_sntsa_solicitud' in query['sql']])
+
+
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from becas_sntsa.catalogs import CATALOG_MODELS, VERSION_KEY, get_catalog
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'catalog-cache-test'}})
+class CatalogCacheTest(TestCase):
+    fixtures = ['initial_data.json']
+
+    def setUp(self):
+        user = User.objects.create_user(username='CATA800101HDFLNA01', password='x')
+        Trabajador.objects.create(
+            usuario=user, nombre='Ana', apellido_paterno='López', telefono='5512345678', correo='ana@test.com',
+            talon_pago_archivo='talon_pago/x.pdf', seccion=Seccion.objects.first(), puesto=Puesto.objects.first(),
+            jurisdiccion=Jurisdiccion.objects.first(), lugar_adscripcion=LugarAdscripcion.objects.first(),
+            aprobado=True,
+        )
+        self.client.force_login(user)
+        self.tablas = [model._meta.db_table for model in CATALOG_MODELS]
+
+    def catalog_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries
+                          if any('"{}"'.format(tabla) in query['sql'] for tabla in self.tablas)]
+
+    def test_forms_render_catalogs_from_memory(self):
+        for name in ('create_trabajador', 'create_solicitud_aprovechamiento', 'create_solicitud_excelencia'):
+            self.client.get(reverse(name))
+            response, queries = self.catalog_queries(reverse(name))
+            self.assertEqual(queries, [], name)
+        response, _ = self.catalog_queries(reverse('create_trabajador'))
+        self.assertContains(response, LugarAdscripcion.objects.last().nombre)
+        self.assertContains(response, '<option value="{}"'.format(LugarAdscripcion.objects.last().pk))
+
+    def test_changes_invalidate_every_process(self):
+        url = reverse('create_solicitud_aprovechamiento')
+        self.client.get(url)
+        grado = Grado.objects.create(clave='ZZ', nombre='Grado nuevo')
+        response, queries = self.catalog_queries(url)
+        self.assertEqual(len(queries), 1)
+        self.assertContains(response, 'Grado nuevo')
+
+        # Another process changed the table
+        cache.set(VERSION_KEY.format(grado._meta.label_lower), 'otra')
+        _, queries = self.catalog_queries(url)
+        self.assertEqual(len(queries), 1)
+
+        grado.delete()
+        response, _ = self.catalog_queries(url)
+        self.assertNotContains(response, 'Grado nuevo')
+
+    def test_choices_are_validated_against_the_cache(self):
+        from becas_sntsa.forms import TrabajadorCreateForm
+        datos = {'seccion': Seccion.objects.first().pk, 'puesto': '999999', 'jurisdiccion': 'x',
+                 'lugar_adscripcion': LugarAdscripcion.objects.first().pk}
+        str(TrabajadorCreateForm())
+        form = TrabajadorCreateForm(datos)
+        with CaptureQueriesContext(connection) as queries:
+            form.is_valid()
+        self.assertEqual(form.cleaned_data['seccion'], Seccion.objects.first())
+        self.assertIn('puesto', form.errors)
+        self.assertIn('jurisdiccion', form.errors)
+        # Only the missing puesto is looked up in the table
+        self.assertEqual(len([query for query in queries if 'becas_sntsa_puesto' in query['sql']]), 1)
+
+    def test_row_added_by_another_process_is_accepted(self):
+        from becas_sntsa.forms import TrabajadorCreateForm
+        str(TrabajadorCreateForm())
+        # Added by a process whose version change this one does not see
+        with patch('becas_sntsa.signals.invalidate'):
+            puesto = Puesto.objects.create(clave='NUEVO')
+        form = TrabajadorCreateForm({'puesto': puesto.pk})
+        form.is_valid()
+        self.assertEqual(form.cleaned_data['puesto'], puesto)
+        self.assertIn(puesto, get_catalog(Puesto))
+
+    def test_rolled_back_rows_are_not_cached(self):
+        try:
+            with transaction.atomic():
+                Grado.objects.create(clave='FA', nombre='Fantasma')
+                self.assertIn('Fantasma', [grado.nombre for grado in get_catalog(Grado)])
+                raise DatabaseError('rollback')
+        except DatabaseError:
+            pass
+        self.assertNotIn('Fantasma', [grado.nombre for grado in get_catalog(Grado)])
+
+
+from becas_sntsa.forms import CatalogChoiceIterator
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'fragment-cache-test'}})
+class FragmentCacheTest(TestCase):
+    fixtures = ['initial_data.json']
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='FRAG800101HDFLNA01', password='x')
+        Trabajador.objects.create(
+            usuario=user, nombre='Ana', apellido_paterno='López', telefono='5512345678', correo='ana@test.com',
+            talon_pago_archivo='talon_pago/x.pdf', seccion=Seccion.objects.first(), puesto=Puesto.objects.first(),
+            jurisdiccion=Jurisdiccion.objects.first(), lugar_adscripcion=LugarAdscripcion.objects.first(),
+            aprobado=True,
+        )
+        self.user = user
+
+    def test_catalog_selects_are_rendered_once(self):
+        self.client.force_login(self.user)
+        url = reverse('create_solicitud_aprovechamiento')
+        primera = self.client.get(url).content
+        with patch.object(CatalogChoiceIterator, '__iter__', side_effect=AssertionError('select rendered')):
+            self.assertEqual(self.client.get(url).content.count(b'<option'), primera.count(b'<option'))
+
+        # A new row changes the version of the catalog and the key of the fragment
+        Grado.objects.create(clave='ZZ', nombre='Grado nuevo')
+        self.assertContains(self.client.get(url), 'Grado nuevo')
+
+    def test_selects_follow_changes_of_other_workers(self):
+        self.client.force_login(self.user)
+        url = reverse('create_solicitud_aprovechamiento')
+        self.client.get(url)
+        # Another worker renamed a grade and changed its version in the shared cache
+        Grado.objects.filter(pk=Grado.objects.first().pk).update(nombre='Grado renombrado')
+        cache.set(VERSION_KEY.format(Grado._meta.label_lower), 'otra')
+        self.assertContains(self.client.get(url), 'Grado renombrado')
+
+    def test_bound_selects_keep_the_submitted_value(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('create_trabajador'))
+        lugar = LugarAdscripcion.objects.last()
+        response = self.client.post(reverse('create_trabajador'), {'lugar_adscripcion': lugar.pk})
+        self.assertContains(response, '<option value="{}" selected>'.format(lugar.pk))
+
+    def test_navbar_varies_with_the_user(self):
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('becas')), 'Cerrar sesión')
+        self.assertContains(self.client.get(reverse('home')), 'Mis Solicitudes')
+        self.client.logout()
+        response = self.client.get(reverse('signin'))
+        self.assertContains(response, 'Iniciar sesión')
+        self.assertNotContains(response, 'Cerrar sesión')
+
+
+from becas_sntsa.middleware import get_trabajador
+
+
+class RequestTrabajadorTest(TestCase):
+    fixtures = ['initial_data.json']
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='REQT800101HDFLNA01', password='x')
+        self.trabajador = Trabajador.objects.create(
+            usuario=self.user, nombre='Ana', apellido_paterno='López', telefono='5512345678',
+            correo='ana@test.com', talon_pago_archivo='talon_pago/x.pdf', seccion=Seccion.objects.first(),
+            puesto=Puesto.objects.first(), jurisdiccion=Jurisdiccion.objects.first(),
+            lugar_adscripcion=LugarAdscripcion.objects.first(), aprobado=True,
+        )
+        Becario.objects.create(
+            trabajador=self.user, nombre='Luis', apellido_paterno='López', curp='LOLU100101HDFLNA01',
+            curp_archivo='curp/x.pdf', acta_nacimiento='acta_nacimiento/x.pdf',
+        )
+
+    def test_user_and_profile_are_loaded_in_one_query(self):
+        self.client.force_login(self.user)
+        # Session, user joined with its profile and the becarios
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('ver_becarios'))
+        self.assertContains(response, 'Luis')
+
+    def test_request_trabajador(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('ver_becarios'))
+        self.assertEqual(response.wsgi_request.trabajador, self.trabajador)
+
+    def test_sessions_of_the_default_backend_stay_open(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        response = self.client.get(reverse('ver_becarios'))
+        self.assertContains(response, 'Luis')
+        self.assertEqual(response.wsgi_request.trabajador, self.trabajador)
+
+        self.client.logout()
+        self.assertTrue(self.client.login(username=self.user.username, password='x'))
+        self.assertEqual(self.client.session['_auth_user_backend'], 'becas_sntsa.backends.TrabajadorBackend')
+
+    def test_user_without_profile_is_redirected(self):
+        otro = User.objects.create_user(username='SINP800101HDFLNA01', password='x')
+        self.client.force_login(otro)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('ver_becarios'))
+        self.assertRedirects(response, reverse('create_trabajador'), fetch_redirect_response=False)
+        self.assertIsNone(get_trabajador(response.wsgi_request))
+
+    def test_unapproved_profile_waits_for_verification(self):
+        Trabajador.objects.filter(pk=self.trabajador.pk).update(aprobado=False)
+        self.client.force_login(self.user)
+        self.assertTemplateUsed(self.client.get(reverse('ver_becarios')), 'espera_verificacion.html')
+
+
+from asgiref.sync import iscoroutinefunction
+
+
+class AsyncDownloadFileTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ASYN800101HDFLNA01', password='x')
+        self.trabajador = Trabajador.objects.create(
+            usuario=self.user, nombre='Ana', apellido_paterno='López', telefono='5512345678', correo='ana@test.com',
+            talon_pago_archivo=SimpleUploadedFile('async.txt', b'0123456789'),
+            seccion=Seccion.objects.create(numero=1), puesto=Puesto.objects.create(clave='P1'),
+            jurisdiccion=Jurisdiccion.objects.create(clave='J1'),
+            lugar_adscripcion=LugarAdscripcion.objects.create(nombre='Lugar 1'), aprobado=True,
+        )
+        self.url = reverse('download_file', args=[self.trabajador.talon_pago_archivo.name])
+
+    def tearDown(self):
+        self.trabajador.talon_pago_archivo.delete(save=False)
+
+    async def test_file_is_streamed_with_an_async_iterator(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertTrue(iscoroutinefunction(response.resolver_match.func))
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'0123456789')
+
+    async def test_range(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url, headers={'Range': 'bytes=2-5'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'2345')
+
+    async def test_other_users_are_forbidden(self):
+        otro = await User.objects.acreate(username='OTRO800101HDFLNA01')
+        await self.async_client.aforce_login(otro)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_wsgi_keeps_the_file_for_sendfile(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertFalse(response.is_async)
+        self.assertFalse(iscoroutinefunction(response.resolver_match.func))
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+    async def test_activation_is_async_under_asgi(self):
+        self.user.is_active = False
+        await self.user.asave()
+        uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        response = await self.async_client.get(reverse('activate', args=[uid, token_gen.make_token(self.user)]))
+        self.assertRedirects(response, reverse('becas'), fetch_redirect_response=False)
+        self.assertTrue(iscoroutinefunction(response.resolver_match.func))
+        await self.user.arefresh_from_db()
+        self.assertTrue(self.user.is_active)
+
+
+import json
+from becas_sntsa.bootstrap import STATIC_FINGERPRINT
+from becas_sntsa.models import BootstrapFingerprint
+
+
+class BootstrapCommandTest(TestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+        self.fixture = os.path.join(self.directorio, 'bootstrap_test.json')
+        self.write_fixture(1)
+        settings_override = override_settings(FIXTURE_DIRS=[self.directorio],
+                                              STATIC_ROOT=os.path.join(self.directorio, 'static'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_fixture(self, numero):
+        with open(self.fixture, 'w') as archivo:
+            json.dump([{'model': 'becas_sntsa.seccion', 'pk': 900, 'fields': {'numero': numero}}], archivo)
+
+    def bootstrap(self, *args) -> dict:
+        out = io.StringIO()
+        call_command('bootstrap', '--skip', 'makemigrations', '--fixture', 'bootstrap_test.json', *args, stdout=out)
+        return {linea.split()[0]: linea.split()[1] for linea in out.getvalue().splitlines()[:-1]}
+
+    def test_runs_only_the_phases_that_changed(self):
+        self.assertEqual(self.bootstrap(), {'makemigrations': 'disabled', 'migrate': 'ran',
+                                            'loaddata': 'ran', 'collectstatic': 'ran'})
+        self.assertEqual(Seccion.objects.get(pk=900).numero, 1)
+        self.assertTrue(os.path.isfile(os.path.join(self.directorio, 'static', STATIC_FINGERPRINT)))
+        self.assertEqual(set(BootstrapFingerprint.objects.values_list('fase', flat=True)), {'migrate', 'loaddata'})
+
+        self.assertEqual(self.bootstrap(), {'makemigrations': 'disabled', 'migrate': 'skipped',
+                                            'loaddata': 'skipped', 'collectstatic': 'skipped'})
+
+        self.write_fixture(2)
+        self.assertEqual(self.bootstrap()['loaddata'], 'ran')
+        self.assertEqual(Seccion.objects.get(pk=900).numero, 2)
+
+    def test_force_and_missing_output(self):
+        self.bootstrap()
+        shutil.rmtree(os.path.join(self.directorio, 'static'))
+        self.assertEqual(self.bootstrap(), {'makemigrations': 'disabled', 'migrate': 'skipped',
+                                            'loaddata': 'skipped', 'collectstatic': 'ran'})
+        self.assertEqual(self.bootstrap('--force'), {'makemigrations': 'disabled', 'migrate': 'ran',
+                                                     'loaddata': 'ran', 'collectstatic': 'ran'})
+
+
+import sqlite3
+import subprocess
+import sys
+from contextlib import closing
+
+
+class BuildDemoTest(TestCase):
+    def test_snapshot_with_media(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        subprocess.run(
+            [sys.executable, 'manage.py', 'build_demo', directorio, '--num_users', '1', '--pdf-kb', '1'],
+            cwd=settings.BASE_DIR, env={**os.environ, 'DEMO': 'True'}, check=True, capture_output=True)
+
+        with closing(sqlite3.connect(os.path.join(directorio, 'db.sqlite3'))) as db:
+            usuarios = db.execute('SELECT username, is_superuser FROM auth_user ORDER BY id').fetchall()
+            rutas = {ruta for ruta, in db.execute('SELECT ruta FROM becas_sntsa_mediafile')}
+            fases = {fase for fase, in db.execute('SELECT fase FROM becas_sntsa_bootstrapfingerprint')}
+            secciones = db.execute('SELECT COUNT(*) FROM becas_sntsa_seccion').fetchone()[0]
+        self.assertEqual(usuarios[0], ('admin', 1))
+        self.assertEqual(len(usuarios), 2)
+        self.assertGreater(secciones, 0)
+        self.assertEqual(fases, {'migrate', 'loaddata'})
+
+        media = os.path.join(directorio, 'media')
+        archivos = {os.path.relpath(os.path.join(raiz, nombre), media)
+                    for raiz, _, nombres in os.walk(media) for nombre in nombres}
+        self.assertEqual(rutas, archivos)
+        for ruta in archivos:
+            with open(os.path.join(media, ruta), 'rb') as archivo:
+                self.assertEqual(archivo.read(5), b'%PDF-')
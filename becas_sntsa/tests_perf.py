@@ -0,0 +1,182 @@
+"""
+Performance regression tests for the becas_sntsa app.
+
+Every route of becas/urls.py is requested through the test client against a
+seeded database, recording the number of queries and the wall time of each
+view. A view fails when it goes over the query budget stored in
+perf_baseline.json. The wall time depends on the machine and its load, so
+it is only checked against its budget when asked for:
+
+    PERF_TIMING=1 python manage.py test becas_sntsa.tests_perf
+
+After an intended change, regenerate the baseline with:
+
+    PERF_UPDATE_BASELINE=1 python manage.py test becas_sntsa.tests_perf
+"""
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from faker import Faker
+from django.contrib.auth.tokens import default_token_generator
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from becas_sntsa.management.commands.generate_users import create_trabajador, create_becario, create_solicitud
+from becas_sntsa.models import User, Becario, Solicitud
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'perf_baseline.json')
+
+# Seeded volumes: workers in the database and scholars of the measured worker
+NUM_TRABAJADORES = 30
+NUM_BECARIOS = 4
+SOLICITUDES_POR_BECARIO = 5
+
+# Requests averaged per view, after one warm-up request
+REPEAT = 3
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ViewPerformanceTest(TestCase):
+    fixtures = ['initial_data.json']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(0)
+        Faker.seed(0)
+        trabajadores = []
+        for _ in range(NUM_TRABAJADORES):
+            trabajador = create_trabajador()
+            for _ in range(random.randint(1, 3)):
+                becario = create_becario(trabajador)
+                for _ in range(random.randint(1, 3)):
+                    create_solicitud(becario)
+            trabajadores.append(trabajador)
+
+        # The worker whose pages are measured, with a long history
+        cls.trabajador = trabajadores[0]
+        cls.trabajador.aprobado = True
+        cls.trabajador.save()
+        cls.user = cls.trabajador.usuario
+        for _ in range(NUM_BECARIOS):
+            becario = create_becario(cls.trabajador)
+            for _ in range(SOLICITUDES_POR_BECARIO):
+                create_solicitud(becario)
+        cls.becario = Becario.objects.filter(trabajador=cls.user).first()
+        solicitud = Solicitud.objects.filter(becario__trabajador=cls.user).select_subclasses().first()
+        solicitud.ine = 'ine/perf.pdf'
+        solicitud.save()
+
+        cls.staff = User.objects.create_superuser(username='perf_admin', password='perf_admin')
+
+    def setUp(self):
+        os.makedirs(os.path.join(self.media_root, 'ine'), exist_ok=True)
+        with open(os.path.join(self.media_root, 'ine', 'perf.pdf'), 'wb') as archivo:
+            archivo.write(b'%PDF-1.4 perf')
+
+    def get_routes(self):
+        """
+        Returns the measured requests as (name, user, url) tuples, where user
+        is None for anonymous requests and url may be a callable that builds
+        the URL of every request, for single-use links.
+        """
+        uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        token = default_token_generator.make_token(self.user)
+
+        def activate_url():
+            # Logging in changes last_login, which invalidates the previous token
+            user = User.objects.get(pk=self.user.pk)
+            return reverse('activate', args=[uid, default_token_generator.make_token(user)])
+
+        return [
+            ('home', None, reverse('home')),
+            ('signup', None, reverse('signup')),
+            ('signin', None, reverse('signin')),
+            ('signout', self.user, reverse('signout')),
+            ('becas', self.user, reverse('becas')),
+            ('create_trabajador', self.user, reverse('create_trabajador')),
+            ('create_becario', self.user, reverse('create_becario')),
+            ('create_solicitud_aprovechamiento', self.user, reverse('create_solicitud_aprovechamiento')),
+            ('create_solicitud_excelencia', self.user, reverse('create_solicitud_excelencia')),
+            ('create_solicitud_especial', self.user, reverse('create_solicitud_especial')),
+            ('ver_becarios', self.user, reverse('ver_becarios')),
+            ('ver_solicitudes', self.user, reverse('ver_solicitudes')),
+            ('editar_usuario', self.user, reverse('editar_usuario')),
+            ('change_password', self.user, reverse('change_password')),
+            ('editar_becario', self.user, reverse('editar_becario', args=[self.becario.pk])),
+            ('activate', None, activate_url),
+            ('confirm_email_change', None, reverse('confirm_email_change', args=[uid, token])),
+            ('download_file', self.user, reverse('download_file', args=['ine/perf.pdf'])),
+            ('admin_index', self.staff, reverse('admin:index')),
+            ('admin_trabajador', self.staff, reverse('admin:becas_sntsa_trabajador_changelist')),
+            ('admin_becario', self.staff, reverse('admin:becas_sntsa_becario_changelist')),
+            ('admin_solicitudaprovechamiento', self.staff,
+             reverse('admin:becas_sntsa_solicitudaprovechamiento_changelist')),
+            ('admin_solicitudexcelencia', self.staff, reverse('admin:becas_sntsa_solicitudexcelencia_changelist')),
+            ('admin_solicitudespecial', self.staff, reverse('admin:becas_sntsa_solicitudespecial_changelist')),
+        ]
+
+    def measure(self, user, url):
+        """
+        Requests a URL, returning the queries of the last request and the
+        median wall time in ms.
+        """
+        tiempos = []
+        for _ in range(REPEAT + 1):
+            if user is not None:
+                self.client.force_login(user)
+            else:
+                self.client.logout()
+            ruta = url() if callable(url) else url
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(ruta)
+            tiempos.append((time.perf_counter() - start) * 1000)
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 500, ruta)
+        return len(queries), statistics.median(tiempos[1:])
+
+    def test_views_stay_within_budget(self):
+        results = {name: self.measure(user, url) for name, user, url in self.get_routes()}
+
+        if os.environ.get('PERF_UPDATE_BASELINE'):
+            with open(BASELINE_PATH) as archivo:
+                baseline = json.load(archivo)
+            baseline['views'] = {name: {'queries': queries, 'ms': round(ms, 2)}
+                                 for name, (queries, ms) in results.items()}
+            with open(BASELINE_PATH, 'w') as archivo:
+                json.dump(baseline, archivo, indent=2, sort_keys=True)
+                archivo.write('\n')
+            return
+
+        with open(BASELINE_PATH) as archivo:
+            baseline = json.load(archivo)
+        for name, (queries, ms) in results.items():
+            with self.subTest(view=name):
+                self.assertIn(name, baseline['views'], 'No budget for this view, regenerate the baseline.')
+                budget = baseline['views'][name]
+                self.assertLessEqual(queries, budget['queries'], 'Query budget exceeded.')
+                if not os.environ.get('PERF_TIMING'):
+                    continue
+                limite = budget['ms'] * baseline['time_factor'] + baseline['time_slack_ms']
+                self.assertLessEqual(ms, limite, 'Time budget exceeded ({:.1f}ms).'.format(ms))
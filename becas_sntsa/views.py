@@ -6,23 +6,26 @@ This file contains the view functions that handle requests and responses for the
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordChangeForm
 from django.contrib.auth.models import User
-from django.contrib.auth import login, logout, authenticate, update_session_auth_hash
-from django.db import IntegrityError
+from django.contrib.auth import login, alogin, logout, authenticate, update_session_auth_hash
+from django.db import IntegrityError, transaction
 from django.contrib.auth.decorators import login_required
 from becas_sntsa.forms import TrabajadorCreateForm, BecarioCreateForm, SolicitudAprovechamientoCreateForm, SolicitudExcelenciaCreateForm, SolicitudEspecialCreateForm, TrabajadorEditForm, BecarioEditForm
-from becas_sntsa.models import Trabajador, Becario, Solicitud, SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial
+from becas_sntsa.models import Trabajador, Becario, Solicitud, SolicitudAprovechamiento, SolicitudExcelencia, SolicitudEspecial, MediaFile, EmailOutbox
 from django.http import HttpResponseForbidden, FileResponse, HttpResponse
 from django.contrib.sites.shortcuts import get_current_site
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode, content_disposition_header, http_date
+from django.utils.cache import get_conditional_response
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.tokens import default_token_generator
 from django.template.loader import render_to_string
 from django.core.mail import EmailMessage
 from django.conf import settings
+from asgiref.sync import sync_to_async
+from urllib.parse import quote
 import logging
+import mimetypes
 import os
 import re
-import smtplib
 
 logger = logging.getLogger(__name__)
 
@@ -41,11 +44,8 @@ def trabajador_required(view_func):
         function: The wrapped view function.
     """
     def _wrapped_view_func(request, *args, **kwargs):
-        if request.user.is_authenticated:
-            try:
-                request.user.trabajador
-            except Trabajador.DoesNotExist:
-                return redirect('create_trabajador')
+        if request.user.is_authenticated and not request.trabajador:
+            return redirect('create_trabajador')
         return view_func(request, *args, **kwargs)
     return _wrapped_view_func
 
@@ -65,12 +65,10 @@ def approved_required(view_func):
     """
     def _wrapped_view_func(request, *args, **kwargs):
         if request.user.is_authenticated:
-            try:
-                trabajador = request.user.trabajador
-                if not trabajador.aprobado:
-                    return render(request, 'espera_verificacion.html', {'user': request.user})
-            except Trabajador.DoesNotExist:
+            if not request.trabajador:
                 return redirect('create_trabajador')
+            if not request.trabajador.aprobado:
+                return render(request, 'espera_verificacion.html', {'user': request.user})
         return view_func(request, *args, **kwargs)
     return _wrapped_view_func
 
@@ -117,7 +115,7 @@ def signup(request):
                 user = User.objects.create_user(
                     request.POST['username'], password=request.POST['password1'])
                 user.save()
-                login(request, user)
+                login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
                 return redirect('create_trabajador')
             except IntegrityError:
                 return render(request, 'signup.html', {
@@ -216,44 +214,27 @@ def create_trabajador(request):
             form = TrabajadorCreateForm(request.POST, request.FILES)
             if form.is_valid():
                 trabajador = form.save(commit=False)
-                user = User.objects.get(
-                    username=request.user.username)
+                user = request.user
                 trabajador.usuario = user
-                trabajador.save()
-                
-                # Make the user inactive until they verify email
-                user.email = trabajador.correo
-                user.is_active = False
-                user.save()
+                with transaction.atomic():
+                    trabajador.save()
 
-                # Generate email verification token and send mail
-                current_site = get_current_site(request)
-                mail_subject = 'Verifica tu cuenta - Becas SNTSA.'
-                message = render_to_string('verificar_correo.html', {
-                    'user': user,
-                    'domain': current_site.domain,
-                    'protocol': request.scheme,
-                    'uid': urlsafe_base64_encode(force_bytes(user.pk)),
-                    'token': default_token_generator.make_token(user),
-                })
-                to_email = trabajador.correo
-                email = EmailMessage(
-                    mail_subject, message, to=[to_email]
-                )
-                try:
-                    email.send()
-                except (smtplib.SMTPException, OSError):
-                    logger.exception(
-                        "No se pudo enviar correo de verificación para usuario_id=%s",
-                        user.pk
-                    )
-                    user.is_active = True
+                    # Make the user inactive until they verify email
+                    user.email = trabajador.correo
+                    user.is_active = False
                     user.save()
-                    trabajador.delete()
-                    return render(request, 'create_trabajador.html', {
-                        'form': TrabajadorCreateForm(),
-                        'error': 'Error al enviar el correo de verificación. Por favor, inténtalo de nuevo.'
+
+                    # Generate email verification token and queue the mail
+                    current_site = get_current_site(request)
+                    mail_subject = 'Verifica tu cuenta - Becas SNTSA.'
+                    message = render_to_string('verificar_correo.html', {
+                        'user': user,
+                        'domain': current_site.domain,
+                        'protocol': request.scheme,
+                        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+                        'token': default_token_generator.make_token(user),
                     })
+                    EmailOutbox.objects.enqueue(EmailMessage(mail_subject, message, to=[trabajador.correo]))
 
                 logout(request)
                 return render(request, 'espera_verificacion_email.html')
@@ -301,8 +282,7 @@ def create_becario(request):
             form = BecarioCreateForm(request.POST, request.FILES)
             if form.is_valid():
                 becario = form.save(commit=False)
-                becario.trabajador = User.objects.get(
-                    username=request.user.username)
+                becario.trabajador = request.user
                 becario.save()
                 return redirect('home')
             else:
@@ -449,7 +429,8 @@ def create_solicitud_especial(request):
 @login_required
 def download_file(request, file_path):
     """
-    Handles file downloads, ensuring that only staff users can access them.
+    Handles file downloads, ensuring that only staff users and the owner of
+    the file can access them.
 
     Args:
         request (HttpRequest): The request object.
@@ -461,44 +442,45 @@ def download_file(request, file_path):
     """
     if not request.user.is_staff:
         # Check if the file belongs to the current user (trabajador, becario, or solicitud)
-        allowed = False
-        try:
-            trabajador = getattr(request.user, 'trabajador', None)
-            clean_file_path = file_path.rstrip('/')
-            if trabajador:
-                # Check if it's the trabajador's own file
-                if trabajador.talon_pago_archivo and clean_file_path == trabajador.talon_pago_archivo.name:
-                    allowed = True
-                
-                # Check if it's a file from their becarios
-                elif any(clean_file_path in [b.curp_archivo.name if b.curp_archivo else '', b.acta_nacimiento.name if b.acta_nacimiento else ''] for b in trabajador.usuario.becario_set.all()):
-                    allowed = True
-                
-                # Check if it's a file from their solicitudes
-                else:
-                    for becario in trabajador.usuario.becario_set.all():
-                        for solicitud in becario.solicitud_set.all():
-                            if solicitud.recibo_nomina and clean_file_path == solicitud.recibo_nomina.name:
-                                allowed = True
-                            if solicitud.ine and clean_file_path == solicitud.ine.name:
-                                allowed = True
-                            
-                            # Check subclasses explicitly
-                            if hasattr(solicitud, 'solicitudaprovechamiento') and solicitud.solicitudaprovechamiento.boleta and clean_file_path == solicitud.solicitudaprovechamiento.boleta.name:
-                                allowed = True
-                            elif hasattr(solicitud, 'solicitudexcelencia') and solicitud.solicitudexcelencia.boleta and clean_file_path == solicitud.solicitudexcelencia.boleta.name:
-                                allowed = True
-                            elif hasattr(solicitud, 'solicitudespecial'):
-                                especial = solicitud.solicitudespecial
-                                if (especial.certificado_medico and clean_file_path == especial.certificado_medico.name) or \
-                                   (especial.certificado_escolar and clean_file_path == especial.certificado_escolar.name):
-                                    allowed = True
-        except Exception:
-            pass
-            
-        if not allowed:
+        if not MediaFile.objects.user_owns(request.user, file_path.rstrip('/')):
             return HttpResponseForbidden("You do not have permission to access this file.")
 
+    return media_file_response(request, file_path)
+
+
+@login_required
+async def download_file_async(request, file_path):
+    """
+    Async version of download_file, routed under ASGI only (see
+    becas.urls_asgi), so a worker is not held while the ownership is looked
+    up and the file is sent to a slow client. Under WSGI it would only add
+    an event loop and a thread switch to every download.
+    """
+    user = await request.auser()
+    if not user.is_staff:
+        if not await MediaFile.objects.auser_owns(user, file_path.rstrip('/')):
+            return HttpResponseForbidden("You do not have permission to access this file.")
+
+    # The file system calls block, run them in a thread of their own
+    response = await sync_to_async(media_file_response, thread_sensitive=False)(request, file_path)
+    if isinstance(response, FileResponse) and response.file_to_stream:
+        stream_file_async(response)
+    return response
+
+
+def media_file_response(request, file_path):
+    """
+    Builds the response of an authorized download.
+
+    Args:
+        request (HttpRequest): The request object.
+        file_path (str): The path to the file, relative to MEDIA_ROOT.
+
+    Returns:
+        HttpResponse: The file, a range of it, a 304 or offload response, or
+                      a forbidden response if the path is not a file inside
+                      MEDIA_ROOT.
+    """
     normalized_path = os.path.normpath(file_path)
     file_full_path = os.path.join(settings.MEDIA_ROOT, normalized_path)
 
@@ -508,11 +490,194 @@ def download_file(request, file_path):
     if not real_path.startswith(os.path.realpath(settings.MEDIA_ROOT)):
         return HttpResponseForbidden("Invalid file path.")
 
-    if os.path.exists(real_path):
-        return FileResponse(open(real_path, 'rb'))
-    else:
+    if not os.path.isfile(real_path):
         return HttpResponseForbidden("File not found.")
 
+    # Validators from the file metadata let viewers revalidate with a 304
+    stat = os.stat(real_path)
+    etag = '"{:x}-{:x}"'.format(stat.st_mtime_ns, stat.st_size)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if settings.MEDIA_OFFLOAD != 'none':
+            # The proxy answers the Range requests itself
+            response = offload_file_response(real_path)
+        else:
+            response = ranged_file_response(request, real_path, stat.st_size, etag, last_modified)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def stream_file_async(response):
+    """
+    Makes a FileResponse send its file through an async iterator, reading it
+    in a thread one block at a time. ASGI servers have no sendfile(), and
+    Django would read a synchronous file whole before sending it.
+
+    Args:
+        response (FileResponse): The response, with the file still unread.
+    """
+    filelike = response.file_to_stream
+
+    async def chunks():
+        read = sync_to_async(filelike.read, thread_sensitive=False)
+        # The block size is raised by the ASGI handler after the view returns
+        while chunk := await read(response.block_size):
+            yield chunk
+
+    # The file stays among the resources closed with the response
+    response.streaming_content = chunks()
+
+
+class RangedFile:
+    """
+    A file-like object that reads only a byte range of a file.
+
+    It keeps fileno() available and leaves the underlying file positioned at
+    the start of the range, so WSGI servers that implement wsgi.file_wrapper
+    with sendfile() (e.g. gunicorn) still send the range without copying it
+    through Python.
+    """
+
+    def __init__(self, file, start, length):
+        """
+        Positions the file at the start of the range.
+
+        Args:
+            file (file): The open binary file.
+            start (int): The first byte of the range.
+            length (int): The number of bytes of the range.
+        """
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        """
+        Reads up to size bytes without going past the end of the range.
+        """
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        """
+        Returns the file descriptor of the underlying file.
+        """
+        return self.file.fileno()
+
+    def close(self):
+        """
+        Closes the underlying file.
+        """
+        self.file.close()
+
+
+def parse_range_header(header, size):
+    """
+    Parses a single byte range of a Range header.
+
+    Args:
+        header (str): The value of the Range header, e.g. 'bytes=0-1023'.
+        size (int): The size of the file.
+
+    Returns:
+        tuple or None: The (start, end) inclusive offsets, None if the header
+                       should be ignored and the whole file sent.
+
+    Raises:
+        ValueError: If the range cannot be satisfied.
+    """
+    unit, _, ranges = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in ranges:
+        # Multipart ranges are not supported, the whole file is sent instead
+        return None
+    first, _, last = ranges.strip().partition('-')
+    if not (first or last) or not (first or '0').isdigit() or not (last or '0').isdigit():
+        return None
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range, the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        raise ValueError('Unsatisfiable range')
+    return start, end
+
+
+def ranged_file_response(request, real_path, size, etag, last_modified):
+    """
+    Builds the response for a file, answering Range requests with 206.
+
+    Args:
+        request (HttpRequest): The request object.
+        real_path (str): The resolved absolute path of the file.
+        size (int): The size of the file.
+        etag (str): The ETag of the file, used to evaluate If-Range.
+        last_modified (int): The modification timestamp, used to evaluate If-Range.
+
+    Returns:
+        FileResponse or HttpResponse: The full file, the requested range or a
+                                      416 response.
+    """
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and if_range and if_range not in (etag, http_date(last_modified)):
+        # The client has a stale copy, it needs the whole file
+        range_header = None
+
+    byte_range = None
+    if range_header:
+        try:
+            byte_range = parse_range_header(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(real_path, 'rb'))
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(RangedFile(open(real_path, 'rb'), start, length), status=206)
+        response['Content-Length'] = length
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def offload_file_response(real_path):
+    """
+    Builds an empty response that tells the front proxy to send the file.
+
+    With 'x-accel-redirect' nginx serves the file from the internal location
+    MEDIA_OFFLOAD_PREFIX, with 'x-sendfile' the proxy reads the absolute path.
+
+    Args:
+        real_path (str): The resolved absolute path of the file, inside MEDIA_ROOT.
+
+    Returns:
+        HttpResponse: A response without body carrying the offload header.
+    """
+    content_type, _ = mimetypes.guess_type(real_path)
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    response['Content-Disposition'] = content_disposition_header(False, os.path.basename(real_path))
+    if settings.MEDIA_OFFLOAD == 'x-accel-redirect':
+        relative_path = os.path.relpath(real_path, os.path.realpath(settings.MEDIA_ROOT))
+        response['X-Accel-Redirect'] = quote(
+            settings.MEDIA_OFFLOAD_PREFIX.rstrip('/') + '/' + relative_path.replace(os.sep, '/'))
+    else:
+        response['X-Sendfile'] = real_path
+    return response
+
 
 @login_required
 @trabajador_required
@@ -544,17 +709,9 @@ def ver_solicitudes(request):
     Returns:
         HttpResponse: The rendered page with the list of applications.
     """
-    solicitudes_normales = SolicitudAprovechamiento.objects.filter(
-        becario__trabajador=request.user)
-    solicitudes_excelencia = SolicitudExcelencia.objects.filter(
-        becario__trabajador=request.user)
-    solicitudes_especiales = SolicitudEspecial.objects.filter(
-        becario__trabajador=request.user)
-    return render(request, 'ver_solicitudes.html', {
-        'solicitudes_aprovechamiento': solicitudes_normales,
-        'solicitudes_excelencia': solicitudes_excelencia,
-        'solicitudes_especiales': solicitudes_especiales
-    })
+    solicitudes = Solicitud.objects.filter(becario__trabajador=request.user).select_subclasses().order_by(
+        '-fecha_solicitud', '-pk')
+    return render(request, 'ver_solicitudes.html', {'solicitudes': solicitudes})
 
 
 @login_required
@@ -572,7 +729,7 @@ def editar_usuario(request):
     Returns:
         HttpResponse: The rendered form page or a redirect to the 'becas' page.
     """
-    trabajador = request.user.trabajador
+    trabajador = request.trabajador
     if request.method == 'GET':
         form = TrabajadorEditForm(instance=trabajador)
         return render(request, 'editar_usuario.html', {'form': form})
@@ -592,7 +749,7 @@ def editar_usuario(request):
 
                 user = request.user
                 
-                # Generate email verification token and send mail
+                # Generate email verification token and queue the mail
                 current_site = get_current_site(request)
                 mail_subject = 'Confirma tu nuevo correo - Becas SNTSA.'
                 message = render_to_string('confirmar_nuevo_correo.html', {
@@ -602,24 +759,8 @@ def editar_usuario(request):
                     'uid': urlsafe_base64_encode(force_bytes(user.pk)),
                     'token': default_token_generator.make_token(user),
                 })
-                to_email = new_email
-                email = EmailMessage(
-                    mail_subject, message, to=[to_email]
-                )
-                try:
-                    email.send()
-                except (smtplib.SMTPException, OSError):
-                    logger.exception(
-                        "No se pudo enviar correo de confirmación de email para usuario_id=%s",
-                        user.pk
-                    )
-                    trabajador.pending_email = None
-                    trabajador.save()
-                    return render(request, 'editar_usuario.html', {
-                        'form': form,
-                        'error': 'Error al enviar el correo de verificación. Por favor, inténtalo de nuevo.'
-                    })
-                
+                EmailOutbox.objects.enqueue(EmailMessage(mail_subject, message, to=[new_email]))
+
                 return render(request, 'espera_verificacion_nuevo_email.html')
 
             trabajador.save()
@@ -695,7 +836,24 @@ def activate(request, uidb64, token):
     if user is not None and default_token_generator.check_token(user, token):
         user.is_active = True
         user.save()
-        login(request, user)
+        login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
+        return redirect('becas')
+    else:
+        return HttpResponse('El enlace de confirmación es inválido o ha expirado.')
+
+async def activate_async(request, uidb64, token):
+    """
+    Async version of activate, routed under ASGI only (see becas.urls_asgi).
+    """
+    try:
+        uid = force_str(urlsafe_base64_decode(uidb64))
+        user = await User.objects.aget(pk=uid)
+    except(TypeError, ValueError, OverflowError, User.DoesNotExist):
+        user = None
+    if user is not None and default_token_generator.check_token(user, token):
+        user.is_active = True
+        await user.asave()
+        await alogin(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
         return redirect('becas')
     else:
         return HttpResponse('El enlace de confirmación es inválido o ha expirado.')
@@ -21,12 +21,8 @@ export DEMO=True
 echo "Running in DEMO mode with SQLite database."
 
 # Configure the Django settings for testing
-echo "Setting up the database..."
-python manage.py makemigrations
-python manage.py migrate --noinput
-
-echo "Loading initial data..."
-python manage.py loaddata initial_data.json
+echo "Setting up the database and the static files..."
+python manage.py bootstrap
 
 # Create a superuser for testing
 echo "Creating superuser..."
@@ -39,8 +35,10 @@ python manage.py createsuperuser --noinput
 echo "Generating test users..."
 python manage.py generate_users
 
-echo "Collecting static files..."
-python manage.py collectstatic --noinput
+# Deliver the queued emails in the background
+echo "Starting the email worker..."
+python manage.py send_outbox &
+trap 'kill $!' EXIT
 
 # Start the Django development server
 echo "Starting the Django development server..."
@@ -11,23 +11,32 @@ DEMO=${DEMO:-True}
 if [ "$DEMO" = "True" ]; then
     echo "Running in DEMO mode."
 
-    echo "Setting up the database..."
-    python manage.py makemigrations
-    python manage.py migrate --noinput
-
-    echo "Loading initial data..."
-    python manage.py loaddata initial_data.json
-
-    # Create a superuser for testing
-    echo "Creating superuser..."
-    export DJANGO_SUPERUSER_USERNAME=admin
-    export DJANGO_SUPERUSER_EMAIL=admin@example.com
-    export DJANGO_SUPERUSER_PASSWORD=admin
-    python manage.py createsuperuser --noinput
-
-    # Create test users
-    echo "Generating test users..."
-    python manage.py generate_users
+    if [ -f /code/db.sqlite3 ]; then
+        # Keep the data of a restarted container, migrating it if needed
+        echo "Using the existing demo database..."
+        python manage.py bootstrap
+    elif [ -f /code/demo/db.sqlite3 ]; then
+        # The image comes with a ready database and documents, built with
+        # build_demo, and its static files collected
+        echo "Copying the demo database and media files..."
+        cp /code/demo/db.sqlite3 /code/db.sqlite3
+        cp -R /code/demo/media/. /code/media/
+    else
+        # Migrate, load the catalogs and collect the static files, when they changed
+        echo "Setting up the database and the static files..."
+        python manage.py bootstrap
+
+        # Create a superuser for testing
+        echo "Creating superuser..."
+        export DJANGO_SUPERUSER_USERNAME=admin
+        export DJANGO_SUPERUSER_EMAIL=admin@example.com
+        export DJANGO_SUPERUSER_PASSWORD=admin
+        python manage.py createsuperuser --noinput
+
+        # Create test users
+        echo "Generating test users..."
+        python manage.py generate_users
+    fi
 else
     echo "Running in production mode."
     # Get database configuration from environment variables
@@ -62,20 +71,26 @@ else
         sleep 2  # Additional wait time to ensure PostgreSQL is fully ready
     fi
 
-    echo "Applying database migrations..."
-    python manage.py makemigrations
-    python manage.py migrate --noinput
-
-    echo "Loading initial data..."
-    python manage.py loaddata initial_data.json
+    # Migrate, load the catalogs and collect the static files, when they changed
+    echo "Setting up the database and the static files..."
+    python manage.py bootstrap
 fi
 
-echo "Collecting static files..."
-python manage.py collectstatic --noinput
+# Deliver the queued emails in the background, restarting the worker if it exits
+EMAIL_WORKER=${EMAIL_WORKER:-True}
+if [ "$EMAIL_WORKER" = "True" ]; then
+    echo "Starting the email worker..."
+    (
+        while true; do
+            python manage.py send_outbox || echo "The email worker exited with status $?, restarting it in 5 seconds..." >&2
+            sleep 5
+        done
+    ) &
+fi
 
-PORT=${PORT:-8000}
+export PORT=${PORT:-8000}
 echo "Using port: $PORT"
 
-# Run the application
-echo "Starting the application..."
-exec python -m gunicorn becas.wsgi:application --bind "0.0.0.0:$PORT"
\ No newline at end of file
+# Run the application, the WSGI or ASGI app, workers and threads are set in gunicorn.conf.py
+echo "Starting the application (${GUNICORN_PROFILE:-gthread} profile)..."
+exec python -m gunicorn --config gunicorn.conf.py
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Gunicorn configuration for the becas project.
+
+The worker processes and threads come from a profile (GUNICORN_PROFILE),
+sized from the CPUs of the machine, and can be set directly with
+GUNICORN_WORKERS and GUNICORN_THREADS:
+
+- gthread (default): CPUs + 1 workers with 4 threads each. A slow upload or
+  SMTP call only holds one thread, and the worker keeps answering the
+  master's heartbeat meanwhile.
+- sync: 2 x CPUs + 1 single-threaded workers, the gunicorn default worker.
+- uvicorn: CPUs + 1 workers serving the ASGI application (becas.asgi) with
+  an event loop. The async views (downloads, account activation) wait for
+  the database and the clients without holding the worker. Persistent
+  database connections are turned off, and the connections are reused
+  through a pool instead (DB_POOL, on by default with this profile).
+
+The app is loaded once in the master before forking (preload_app), so the
+workers share its imported code copy-on-write, and every worker is replaced
+after a number of requests to bound the growth of its memory.
+"""
+import multiprocessing
+import os
+
+cpus = multiprocessing.cpu_count()
+
+PROFILES = {
+    'gthread': {'worker_class': 'gthread', 'workers': cpus + 1, 'threads': 4, 'app': 'becas.wsgi:application'},
+    'sync': {'worker_class': 'sync', 'workers': cpus * 2 + 1, 'threads': 1, 'app': 'becas.wsgi:application'},
+    # The threads run the sync code of the requests, they only size the pool
+    'uvicorn': {'worker_class': 'uvicorn_worker.UvicornWorker', 'workers': cpus + 1, 'threads': 4,
+                'app': 'becas.asgi:application'},
+}
+
+profile = os.environ.get('GUNICORN_PROFILE', 'gthread').lower()
+if profile not in PROFILES:
+    raise ValueError("GUNICORN_PROFILE must be one of {}, got '{}'".format(', '.join(PROFILES), profile))
+
+wsgi_app = PROFILES[profile]['app']
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', '8000'))
+worker_class = PROFILES[profile]['worker_class']
+workers = int(os.environ.get('GUNICORN_WORKERS') or PROFILES[profile]['workers'])
+threads = int(os.environ.get('GUNICORN_THREADS') or PROFILES[profile]['threads'])
+
+# The settings size the database connection pool from the threads, and are
+# loaded after this file
+os.environ['GUNICORN_THREADS'] = str(threads)
+if profile == 'uvicorn':
+    # Connections belong to a thread, and the async views run their queries
+    # in short-lived ones, so persistent connections would pile up. The pool
+    # is shared by the threads of the worker, so it reuses them instead
+    os.environ['DB_CONN_MAX_AGE'] = '0'
+    if not os.environ.get('DB_POOL'):
+        os.environ['DB_POOL'] = 'True'
+
+preload_app = True
+
+# Replace every worker after this many requests, give or take the jitter so
+# they are not all restarted at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS') or 1000)
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER') or max_requests // 10)
+
+# Seconds a silent worker is given before it is killed. Sync workers are
+# silent while they handle a request, so this bounds large uploads too
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 120)
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT') or 30)
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE') or 5)
+
+# Heartbeat files in memory, a container's overlay filesystem can stall them
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'